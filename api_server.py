@@ -0,0 +1,296 @@
+import argparse
+import hmac
+import json
+import math
+import os
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+import streamlit as st
+import toml
+
+import database as db
+import utils
+
+# JSON API for the POS and other scripts, served next to Streamlit.
+# Started from app.py inside the Streamlit process, so it reads the same
+# process cache; inserts go through db.queue_transactions, whose writer thread
+# merges concurrent requests into one append.
+#
+# .streamlit/secrets.toml:
+#   [api]
+#   enabled = true
+#   port = 8600
+#   [api.tokens]        # client name = token (send "Authorization: Bearer <token>")
+#   pos-main = "..."
+# Inserts are idempotent: resending a transaction with the same "idem_key"
+# (or a request with the same Idempotency-Key header) returns the original ids.
+API_PORT = 8600
+MAX_BATCH = 1000 # transactions per insert request
+MAX_PAGE = 1000 # rows per query page
+WRITE_TIMEOUT = 120 # seconds a request waits for its rows to be written
+MAX_KEY_LENGTH = 100
+TRANSACTION_TYPES = ["收入", "支出", "資金調度"]
+NHI_FIELDS = ["total_fee", "deduction", "rejection", "chronic_count", "general_count", "drug_fee"]
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def load_config():
+    """The [api] section of secrets.toml ({} when missing)."""
+    if not os.path.exists(db.SECRETS_PATH):
+        return {}
+    try:
+        return toml.load(db.SECRETS_PATH).get("api", {})
+    except Exception as e:
+        print(f"Error loading api config: {e}")
+        return {}
+
+def _to_json(value):
+    if hasattr(value, "item"): # numpy scalars
+        return value.item()
+    return str(value)
+
+def _records(df):
+    """DataFrame -> JSON-ready list of dicts (dates as YYYY-MM-DD, NaN as null)."""
+    if df.empty:
+        return []
+    if 'date' in df.columns:
+        df = df.assign(date=pd.to_datetime(df['date']).dt.strftime('%Y-%m-%d'))
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+def _parse_date(value, field):
+    try:
+        return datetime.strptime(str(value), '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        raise ApiError(400, f"{field}: expected YYYY-MM-DD, got {value!r}")
+
+def _parse_month(value, field="month"):
+    try:
+        return datetime.strptime(value, '%Y-%m').strftime('%Y-%m')
+    except (TypeError, ValueError):
+        raise ApiError(400, f"{field}: expected YYYY-MM, got {value!r}")
+
+def parse_transaction(item, index, request_key=None):
+    """
+    Validate one POSTed transaction and apply the same fee adjustment as the entry form.
+    Its idempotency key is the item's "idem_key", else "<Idempotency-Key header>:<index>".
+    """
+    if not isinstance(item, dict):
+        raise ApiError(400, f"transactions[{index}]: expected an object")
+    where = f"transactions[{index}]"
+    tx_type = item.get("type")
+    if tx_type not in TRANSACTION_TYPES:
+        raise ApiError(400, f"{where}.type must be one of {TRANSACTION_TYPES}")
+    if item.get("account") not in utils.ACCOUNT_TYPES:
+        raise ApiError(400, f"{where}.account must be one of {utils.ACCOUNT_TYPES}")
+    if not item.get("category"):
+        raise ApiError(400, f"{where}.category is required")
+    try:
+        amount = float(item.get("amount"))
+    except (TypeError, ValueError):
+        raise ApiError(400, f"{where}.amount must be a number")
+    if not math.isfinite(amount) or amount <= 0:
+        raise ApiError(400, f"{where}.amount must be positive")
+    original_amount = item.get("original_amount")
+    if original_amount is not None:
+        try:
+            original_amount = float(original_amount)
+        except (TypeError, ValueError):
+            raise ApiError(400, f"{where}.original_amount must be a number")
+        if not math.isfinite(original_amount):
+            raise ApiError(400, f"{where}.original_amount must be a number")
+    nhi_month = item.get("nhi_month") or None
+    if nhi_month is not None:
+        nhi_month = _parse_month(nhi_month, f"{where}.nhi_month")
+
+    tx = {
+        "date": _parse_date(item.get("date"), f"{where}.date"),
+        "type": tx_type,
+        "category": item["category"],
+        "subcategory": item.get("subcategory") or "",
+        "account": item["account"],
+        "amount": amount,
+        "original_amount": original_amount,
+        "note": item.get("note") or "",
+        "nhi_month": nhi_month,
+        "idem_key": None,
+    }
+    key = item.get("idem_key") or (f"{request_key}:{index}" if request_key else None)
+    if key is not None:
+        if not isinstance(key, str) or len(key) > MAX_KEY_LENGTH:
+            raise ApiError(400, f"{where}.idem_key must be a string of at most {MAX_KEY_LENGTH} characters")
+        tx["idem_key"] = f"api:{key}"
+    if tx_type == "收入" and tx["subcategory"] and tx["original_amount"] is None:
+        net, adjusted = utils.calculate_net_amount(tx["category"], tx["subcategory"], amount)
+        if adjusted:
+            tx["amount"], tx["original_amount"] = net, amount
+    return tx
+
+# --- Endpoints ----------------------------------------------------------------
+
+def insert_transactions(body, request_key=None):
+    items = body.get("transactions") if isinstance(body, dict) else None
+    if not isinstance(items, list) or not items:
+        raise ApiError(400, "transactions: expected a non-empty list")
+    if len(items) > MAX_BATCH:
+        raise ApiError(413, f"at most {MAX_BATCH} transactions per request")
+    txs = [parse_transaction(item, i, request_key) for i, item in enumerate(items)]
+    ids = db.queue_transactions(txs).result(timeout=WRITE_TIMEOUT)
+    return 201, {"written": len(ids), "ids": ids}
+
+def query(params):
+    start = _parse_date(params.get("start"), "start")
+    end = _parse_date(params.get("end"), "end")
+    sort_by = params.get("sort", "date")
+    if sort_by not in db.TRANSACTION_COLUMNS:
+        raise ApiError(400, f"sort: unknown column {sort_by!r}")
+    try:
+        offset = max(0, int(params.get("offset", 0)))
+        limit = min(MAX_PAGE, max(1, int(params.get("limit", 100))))
+    except ValueError:
+        raise ApiError(400, "offset/limit must be integers")
+    filters = {c: params[c].split(",") for c in ("type", "category", "subcategory", "account") if params.get(c)}
+    page, total = db.query_transactions(start, end, text=params.get("q", ""), sort_by=sort_by,
+                                        ascending=params.get("order") == "asc", offset=offset,
+                                        limit=limit, filters=filters)
+    return 200, {"total": total, "offset": offset, "rows": _records(page)}
+
+def upsert_nhi(month, body):
+    month = _parse_month(month)
+    if not isinstance(body, dict):
+        raise ApiError(400, "expected an object")
+    missing = [f for f in NHI_FIELDS if f not in body]
+    if missing:
+        raise ApiError(400, f"missing fields: {', '.join(missing)}")
+    try:
+        values = [float(body[f]) if f in ("total_fee", "deduction", "rejection", "drug_fee") else int(body[f])
+                  for f in NHI_FIELDS]
+    except (TypeError, ValueError):
+        raise ApiError(400, f"{', '.join(NHI_FIELDS)} must be numbers")
+    db.save_nhi_record(month, *values)
+    return 200, {"month": month, "saved": True}
+
+def closing_status(month):
+    month = _parse_month(month)
+    closing = db.get_closing(month)
+    if closing is None:
+        return 200, {"month": month, "closed": False}
+    _, bank_actual, cash_actual, bank_calc, cash_calc, note, closed_at = closing
+    return 200, {"month": month, "closed": True, "closed_at": closed_at, "note": note,
+                 "bank_actual": bank_actual, "cash_actual": cash_actual,
+                 "bank_calc": bank_calc, "cash_calc": cash_calc}
+
+def closings(params):
+    start = _parse_month(params.get("start"))
+    end = _parse_month(params.get("end"))
+    return 200, {"closings": _records(db.get_closings_range(start, end))}
+
+# --- HTTP -------------------------------------------------------------------
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = "PharmacyAPI/1.0"
+    tokens = {} # token -> client name
+
+    def _send(self, status, payload):
+        data = json.dumps(payload, ensure_ascii=False, default=_to_json).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _client(self):
+        auth = self.headers.get("Authorization", "")
+        token = auth[7:] if auth.startswith("Bearer ") else ""
+        for known, name in self.tokens.items():
+            if token and hmac.compare_digest(token, known):
+                return name
+        raise ApiError(401, "invalid or missing token")
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            return json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            raise ApiError(400, "body is not valid JSON")
+
+    def _dispatch(self, method):
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        if method == "GET" and parts == ["health"]:
+            return 200, {"ok": True}
+        self._client()
+        if parts == ["transactions"]:
+            if method == "POST":
+                return insert_transactions(self._body(), self.headers.get("Idempotency-Key"))
+            if method == "GET":
+                return query(params)
+        elif len(parts) == 2 and parts[0] == "nhi" and method == "PUT":
+            return upsert_nhi(parts[1], self._body())
+        elif parts == ["closings"] and method == "GET":
+            return closings(params)
+        elif len(parts) == 2 and parts[0] == "closings" and method == "GET":
+            return closing_status(parts[1])
+        raise ApiError(404, f"no route for {method} {url.path}")
+
+    def _handle(self, method):
+        try:
+            status, payload = self._dispatch(method)
+        except ApiError as e:
+            status, payload = e.status, {"error": str(e)}
+        except TimeoutError:
+            status, payload = 503, {"error": "write queue busy, retry later"}
+        except Exception as e:
+            status, payload = 500, {"error": f"{e}"}
+        self._send(status, payload)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+def serve(port=None, host="127.0.0.1"):
+    """Run the API server in this thread (blocks)."""
+    config = load_config()
+    Handler.tokens = {token: name for name, token in config.get("tokens", {}).items()}
+    if not Handler.tokens:
+        print("API server: no tokens configured in [api.tokens], every request will be rejected")
+    server = ThreadingHTTPServer((host, port or config.get("port", API_PORT)), Handler)
+    server.daemon_threads = True
+    print(f"API server listening on {host}:{server.server_port}")
+    server.serve_forever()
+
+@st.cache_resource
+def start():
+    """Start the API server thread once per process when enabled in secrets.toml."""
+    if not load_config().get("enabled"):
+        return None
+
+    def run():
+        try:
+            serve()
+        except OSError as e:
+            # Multi-worker deployments: the port is taken by the first worker
+            print(f"API server not started in this process: {e}")
+
+    thread = threading.Thread(target=run, name="api-server", daemon=True)
+    thread.start()
+    return thread
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the JSON API without the Streamlit app.")
+    parser.add_argument("--port", type=int, help=f"Port (default: [api] port or {API_PORT})")
+    parser.add_argument("--host", default="127.0.0.1")
+    args = parser.parse_args()
+    serve(args.port, args.host)
@@ -0,0 +1,234 @@
+from datetime import datetime
+
+import pandas as pd
+import streamlit as st
+
+import database as db
+import utils
+
+TODAY_REFRESH_SECONDS = 2
+
+st.header("每日收支紀錄")
+
+# Callback for smart defaults
+def apply_smart_defaults():
+    t = st.session_state.get('tx_type_radio')
+    if t == '收入':
+        m = st.session_state.get('inc_main')
+        s = st.session_state.get('inc_sub')
+        if m == '健保收入':
+            st.session_state['tx_account'] = '銀行'
+        elif s in ['Line Pay收入', '信用卡收入', '銀行收入']:
+            st.session_state['tx_account'] = '銀行'
+    elif t == '支出':
+        m = st.session_state.get('exp_main')
+        if m == '家庭支出':
+            st.session_state['tx_account'] = '現金'
+
+# The form and today's table are separate fragments: widget callbacks and saves
+# rerun only the form, and the table polls the shared process cache, which
+# db.add_transaction updates locally instead of refetching the sheet.
+@st.fragment
+def entry_form():
+    # One idempotency key per submission: a double click or a rerun interrupted
+    # after the write resends the same key and is ignored; a new key is issued
+    # only once the form has been reset for the next entry.
+    if 'tx_idem_key' not in st.session_state:
+        st.session_state['tx_idem_key'] = db.new_idem_key("form")
+    idem_key = st.session_state['tx_idem_key']
+
+    if st.session_state.get('tx_success'):
+        # Reset inputs here before widgets are rendered
+        st.session_state['tx_idem_key'] = db.new_idem_key("form")
+        st.session_state['input_amount'] = 0
+        st.session_state['input_note'] = ""
+        st.session_state['allow_duplicate'] = False
+        st.session_state['dup_warning'] = False
+        st.success("✅ 紀錄已新增")
+        st.session_state['tx_success'] = False
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        date = st.date_input("日期", datetime.now(), key="entry_date")
+
+        tx_type = st.radio("類型", ["收入", "支出", "資金調度"], horizontal=True, key="tx_type_radio", on_change=apply_smart_defaults)
+
+        if tx_type == "收入":
+            main_cat = st.selectbox("主類別", list(utils.INCOME_CATEGORIES.keys()), key="inc_main", on_change=apply_smart_defaults)
+            sub_cat_options = list(utils.INCOME_CATEGORIES[main_cat].keys())
+            sub_cat = st.selectbox("子類別", sub_cat_options, key="inc_sub", on_change=apply_smart_defaults)
+            account_from = None
+        elif tx_type == "支出":
+            # Expense
+            expense_cats = [k for k in utils.EXPENSE_CATEGORIES.keys() if k != "帳戶類別"]
+            main_cat = st.selectbox("主科目", expense_cats, key="exp_main", on_change=apply_smart_defaults)
+            sub_cat_options = utils.EXPENSE_CATEGORIES.get(main_cat, [])
+            if sub_cat_options:
+                sub_cat = st.selectbox("子類別", sub_cat_options, key="exp_sub", on_change=apply_smart_defaults)
+            else:
+                sub_cat = None
+            account_from = None
+        else:
+            # 資金調度 (Transfer)
+            st.info("ℹ️ 資金調度：僅調整帳戶餘額，不影響損益計算。")
+            main_cat = "資金調度"
+            sub_cat = ""
+            # Show "From" Account here in Col 1
+            account_from = st.selectbox("轉出帳戶 (From)", utils.ACCOUNT_TYPES, key="acc_from")
+
+    with col2:
+        account_options = utils.ACCOUNT_TYPES
+        if tx_type == "資金調度":
+            # Show "To" Account (without the 'from' account, plus the withdraw option)
+            to_options = [x for x in account_options if x != account_from]
+            to_options.append("提出")
+            account = st.selectbox("轉入帳戶 (To)", to_options, key="acc_to")
+        else:
+            # Normal Income/Expense Account Selection
+            account = st.selectbox("帳戶", account_options, key="tx_account")
+
+        amount = st.number_input("金額 (TWD)", min_value=0, step=1, key="input_amount")
+        note = st.text_input("備註", key="input_note")
+
+    # Preview Calculation for Income
+    net_amount = amount
+    is_adjusted = False
+    if tx_type == "收入" and sub_cat:
+        net_amount, is_adjusted = utils.calculate_net_amount(main_cat, sub_cat, amount)
+        if is_adjusted:
+            st.info(f"提示 系統將自動扣除手續費: 輸入 {amount} -> 實帳 {net_amount:.2f}")
+
+    # NHI Month Linking
+    nhi_selected_month_str = None
+    if tx_type == "收入" and main_cat == "健保收入" and sub_cat in ["健保一暫", "健保二暫"]:
+        st.write("---")
+        st.caption("健保申報月份關聯")
+        nm_col1, nm_col2 = st.columns(2)
+        today = datetime.now()
+        # Default to previous month
+        def_date = today.replace(day=1) - pd.Timedelta(days=1)
+        with nm_col1:
+            n_year = st.selectbox("申報年份", range(today.year - 2, today.year + 2), index=2, key="nhi_tx_year")
+        with nm_col2:
+            n_month = st.selectbox("申報月份", range(1, 13), index=def_date.month-1, key="nhi_tx_month")
+        nhi_selected_month_str = f"{n_year}-{n_month:02d}"
+
+    # Duplicate guard: same date/type/account/amount/note already recorded
+    allow_duplicate = False
+    if st.session_state.get('dup_warning'):
+        st.warning("⚠️ 已存在相同日期、類型、帳戶、金額與備註的紀錄。若確定要重複新增，請勾選下方選項後再送出。")
+        allow_duplicate = st.checkbox("仍要新增重複紀錄", key="allow_duplicate")
+
+    if st.button("登入", type="primary"):
+        # The first row this submission would write
+        if tx_type == "資金調度":
+            check_account, check_amount = account_from, amount
+            check_note = f"{note} (提出)" if account == "提出" else f"{note} (轉入 {account})"
+        else:
+            check_account, check_amount, check_note = account, net_amount, note
+
+        if amount > 0 and not allow_duplicate and db.is_duplicate_transaction(date, tx_type, check_account, check_amount, check_note):
+            st.session_state['dup_warning'] = True
+            st.rerun(scope="fragment")
+        elif amount > 0:
+            if tx_type == "資金調度":
+                # Transfer Out (always) + Transfer In (only if NOT '提出'), written in one request
+                # Note logic: If withdrawal, note is just "Withdrawal". If internal transfer, note "Transfer to X".
+                note_out = f"{note} (提出)" if account == "提出" else f"{note} (轉入 {account})"
+                rows = [dict(date=date, type="資金調度", category="轉出", subcategory="", account=account_from,
+                             amount=amount, original_amount=None, note=note_out, nhi_month="", idem_key=f"{idem_key}:out")]
+                if account != "提出":
+                    rows.append(dict(date=date, type="資金調度", category="轉入", subcategory="", account=account,
+                                     amount=amount, original_amount=None, note=f"{note} (來自 {account_from})", nhi_month="",
+                                     idem_key=f"{idem_key}:in"))
+                db.add_transactions(rows)
+            else:
+                # Normal Transaction
+                db.add_transaction(
+                    date=date,
+                    type=tx_type,
+                    category=main_cat,
+                    subcategory=sub_cat if sub_cat else "",
+                    account=account,
+                    amount=net_amount,
+                    original_amount=amount if is_adjusted else None,
+                    note=note,
+                    nhi_month=nhi_selected_month_str,
+                    idem_key=idem_key
+                )
+
+            st.session_state['tx_success'] = True
+            st.rerun(scope="fragment")
+        else:
+            st.error("帳號或密碼錯誤")
+
+@st.fragment(run_every=TODAY_REFRESH_SECONDS)
+def today_table():
+    st.subheader("今日紀錄")
+
+    # Re-filter the shared ledger only when the date or the data version changed
+    # (a save here or in any other session bumps the version)
+    date = st.session_state.get('entry_date') or datetime.now().date()
+    memo_key = (date, db.current_version("transactions"))
+    memo = st.session_state.get('today_memo')
+    if memo is None or memo[0] != memo_key:
+        memo = (memo_key, db.get_transactions(start_date=date, end_date=date))
+        st.session_state['today_memo'] = memo
+    df_today = memo[1]
+
+    if df_today.empty:
+        st.caption("尚無紀錄")
+        return
+
+    # Prepare dataframe for editing
+    df_today_edit = df_today.copy()
+    df_today_edit['刪除'] = False
+
+    # Reorder columns to put '刪除' first
+    cols = ['刪除', 'id', 'type', 'category', 'subcategory', 'account', 'amount', 'note']
+    df_today_edit = df_today_edit[cols]
+
+    edited_df = st.data_editor(
+        df_today_edit,
+        column_config={
+            "刪除": st.column_config.CheckboxColumn(
+                "刪除",
+                help="勾選以刪除此筆紀錄",
+                default=False,
+            ),
+            "id": st.column_config.NumberColumn("ID", disabled=True),
+            "type": st.column_config.TextColumn("類型", disabled=True),
+            "category": st.column_config.TextColumn("主類別", disabled=True),
+            "subcategory": st.column_config.TextColumn("子類別", disabled=True),
+            "account": st.column_config.TextColumn("帳戶", disabled=True),
+            "amount": st.column_config.NumberColumn("金額", disabled=True),
+            "note": st.column_config.TextColumn("備註", disabled=True),
+        },
+        hide_index=True,
+        use_container_width=True,
+        key="editor_today"
+    )
+
+    st.markdown("")
+    if st.button("刪除所選紀錄 (Delete Selected)", type="secondary"):
+        # Filter rows where '刪除' is True
+        to_delete = edited_df[edited_df['刪除'] == True]
+        if not to_delete.empty:
+            count = 0
+            # Rows are flagged as deleted in one request (the sheet keeps them until compaction)
+            try:
+                count = db.delete_transactions(to_delete['id'].tolist(), deleted_by=st.session_state.get('username') or "")
+            except Exception as e:
+                st.error(f"刪除失敗: {e}")
+            if count > 0:
+                st.success(f"成功刪除 {count} 筆紀錄")
+                st.rerun(scope="fragment")
+        else:
+            st.info("請先勾選欲刪除的紀錄")
+
+entry_form()
+
+st.divider()
+
+today_table()
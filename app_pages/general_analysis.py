@@ -0,0 +1,355 @@
+import math
+import os
+from datetime import datetime
+
+import pandas as pd
+import streamlit as st
+
+import database as db
+import export
+import services
+
+st.header("一般帳務分析")
+
+services.change_notice("general_analysis", ["transactions"])
+
+DETAIL_PAGE_SIZES = [50, 100, 200]
+DETAIL_SORT_COLUMNS = {'date': '日期', 'amount': '金額', 'category': '主類別', 'subcategory': '子類別', 'account': '帳戶', 'id': 'ID'}
+
+# Detail rows are filtered, sorted and paged on the server (db.query_transactions),
+# so only one page is sent to the browser however long the range is
+@st.fragment
+def detail_table(start_date, end_date):
+    f1, f2, f3, f4 = st.columns([2, 1, 1, 1])
+    text = f1.text_input("搜尋 (類型/科目/帳戶/備註)", key="detail_text")
+    sort_by = f2.selectbox("排序欄位", list(DETAIL_SORT_COLUMNS), format_func=DETAIL_SORT_COLUMNS.get, key="detail_sort")
+    ascending = f3.selectbox("排序方式", [False, True], format_func=lambda a: "遞增" if a else "遞減", key="detail_asc")
+    page_size = f4.selectbox("每頁筆數", DETAIL_PAGE_SIZES, key="detail_size")
+
+    # Back to the first page whenever the query changes
+    query = (str(start_date), str(end_date), text, sort_by, ascending, page_size)
+    if st.session_state.get('detail_query') != query:
+        st.session_state['detail_query'] = query
+        st.session_state['detail_page'] = 1
+
+    page_no = st.session_state.get('detail_page', 1)
+    page_df, total = db.query_transactions(start_date, end_date, text, sort_by, ascending,
+                                           offset=(page_no - 1) * page_size, limit=page_size)
+    page_count = max(1, math.ceil(total / page_size))
+    if page_no > page_count:
+        # Rows disappeared since the last run (e.g. deleted elsewhere)
+        page_no = st.session_state['detail_page'] = page_count
+        page_df, total = db.query_transactions(start_date, end_date, text, sort_by, ascending,
+                                               offset=(page_no - 1) * page_size, limit=page_size)
+
+    st.dataframe(page_df, use_container_width=True, hide_index=True)
+
+    p1, p2 = st.columns([1, 3])
+    p1.number_input("頁數", min_value=1, max_value=page_count, step=1, key="detail_page")
+    p2.caption(f"共 {total:,} 筆，第 {page_no} / {page_count} 頁")
+
+# Mode Selection
+analysis_mode = st.radio(
+    "分析模式", 
+    ["帳務細目分析 (每一筆收支加總)", "實際月營收 (每月結算餘額比較)"], 
+    horizontal=True
+)
+
+if analysis_mode == "帳務細目分析 (每一筆收支加總)":
+    
+    st.caption("加總此區間內每一筆「收入」與「支出」紀錄來計算損益。")
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+
+        start_date = st.date_input("開始日期", datetime(datetime.now().year, datetime.now().month, 1))
+
+    with col2:
+
+        end_date = st.date_input("結束日期", datetime.now())
+
+
+
+    if start_date <= end_date:
+
+        df = db.get_transactions(start_date=start_date, end_date=end_date)
+
+        
+
+        if not df.empty:
+
+            # KPI Cards
+            # Exclude Owner's Equity
+            total_income = df[(df['type'] == '收入') & (df['category'] != '業主資本')]['amount'].sum()
+
+            total_expense = df[df['type'] == '支出']['amount'].sum()
+
+            net_profit = total_income - total_expense
+
+            
+
+            kpi1, kpi2, kpi3 = st.columns(3)
+
+            kpi1.metric("總收入", f"${total_income:,.0f}")
+
+            kpi2.metric("總支出", f"${total_expense:,.0f}")
+
+            kpi3.metric("淨利", f"${net_profit:,.0f}", delta_color="normal")
+
+            
+
+            st.divider()
+
+            
+
+            # Charts
+
+            c1, c2 = st.columns(2)
+
+            
+
+            with c1:
+
+                st.subheader("收入分析 (依子科目)")
+
+                income_df = df[(df['type'] == '收入') & (df['category'] != '業主資本')]
+
+                if not income_df.empty:
+
+                    income_chart = income_df.groupby('subcategory')['amount'].sum()
+
+                    st.bar_chart(income_chart)
+
+                else:
+
+                    st.write("無收入資料")
+
+            
+
+            with c2:
+
+                st.subheader("支出分析 (依主科目)")
+
+                expense_df = df[df['type'] == '支出']
+
+                if not expense_df.empty:
+
+                    expense_chart = expense_df.groupby('category')['amount'].sum()
+
+                    st.bar_chart(expense_chart)
+
+                else:
+
+                    st.write("無支出資料")
+
+
+
+            st.divider()
+
+            st.subheader("詳細交易紀錄")
+
+            
+
+            # Show dataframe with ID for reference
+
+            detail_table(start_date, end_date)
+
+
+
+            # Export: generated only on request, cached per range + data version
+
+            e1, e2, e3 = st.columns([1, 1, 2])
+
+            with e1:
+
+                export_layout = st.selectbox("匯出內容", list(export.EXPORT_LAYOUTS),
+                                             format_func=lambda l: export.EXPORT_LAYOUTS[l], key="export_layout")
+
+            with e2:
+
+                export_fmt = st.selectbox("匯出格式", list(export.EXPORT_FORMATS),
+                                          format_func=lambda f: export.EXPORT_FORMATS[f]['label'], key="export_fmt")
+
+            export_request = (str(start_date), str(end_date), export_fmt, export_layout)
+
+            with e3:
+
+                st.write("")
+
+                if st.button("產生匯出檔"):
+
+                    with st.spinner("匯出中..."):
+
+                        st.session_state['export_file'] = (export_request, export.export_transactions(start_date, end_date, export_fmt, layout=export_layout))
+
+            exported = st.session_state.get('export_file')
+
+            if exported and exported[0] == export_request and os.path.exists(exported[1]):
+
+                with open(exported[1], 'rb') as f:
+
+                    st.download_button(
+
+                        label=f"下載 {export.EXPORT_FORMATS[export_fmt]['label']}",
+
+                        data=f,
+
+                        file_name=export.export_filename(start_date, end_date, export_fmt, export_layout),
+
+                        mime=export.EXPORT_FORMATS[export_fmt]['mime'],
+
+                    )
+
+        else:
+
+            st.info("此日期區間無資料")
+    else:
+         st.error("開始日期不能晚於結束日期")
+
+else:
+    # Actual Monthly Revenue Mode
+    st.subheader("實際月營收分析")
+    st.caption("透過比較「每月結算」的期末餘額，計算實際現金流增減。可檢視包含資金調度等所有影響後的最終獲利。")
+    
+    # Date Selection (Year/Month Range)
+    c1, c2, c3, c4 = st.columns(4)
+    today = datetime.now()
+    year_opts = list(range(today.year - 3, today.year + 2))
+    month_opts = list(range(1, 13))
+    
+    with c1:
+        start_year = st.selectbox("開始年份", year_opts, index=year_opts.index(today.year), key="mr_sy")
+    with c2:
+        start_month = st.selectbox("開始月份", month_opts, index=0, key="mr_sm")
+    with c3:
+        end_year = st.selectbox("結束年份", year_opts, index=year_opts.index(today.year), key="mr_ey")
+    with c4:
+        end_month = st.selectbox("結束月份", month_opts, index=today.month-1, key="mr_em")
+        
+    start_str = f"{start_year}-{start_month:02d}"
+    end_str = f"{end_year}-{end_month:02d}"
+    
+    if start_str > end_str:
+        st.error("開始月份不能晚於結束月份")
+    else:
+        # Logic: We need Closing of (Start Month - 1) as "Opening Balance"
+        # And Closings of all months in range.
+        
+        # Calculate Previous Month
+        start_date_obj = datetime(start_year, start_month, 1)
+        prev_month_date = start_date_obj - pd.Timedelta(days=1)
+        prev_month_str = prev_month_date.strftime("%Y-%m")
+        
+        # Fetch all closings from prev_month to end_month
+        df_closings = db.get_closings_range(prev_month_str, end_str)
+        
+        if df_closings.empty:
+            st.warning("在此區間內找不到任何結算資料。請確認是否已至「每月 結算」功能執行結帳。")
+        else:
+            # Check for missing months
+            # Generate expected list (inclusive of prev_month for calculation basis)
+            expected_months = []
+            curr = prev_month_date.replace(day=1) # Start from prev month
+            end_date_obj = datetime(end_year, end_month, 1)
+            
+            while curr <= end_date_obj:
+                expected_months.append(curr.strftime("%Y-%m"))
+                # Next month
+                if curr.month == 12:
+                    curr = datetime(curr.year + 1, 1, 1)
+                else:
+                    curr = datetime(curr.year, curr.month + 1, 1)
+                    
+            found_months = df_closings['month'].tolist()
+            missing = [m for m in expected_months if m not in found_months]
+            
+            if missing:
+                st.warning(f"⚠️ 注意：缺少以下月份的結算資料，分析結果可能不準確：{', '.join(missing)}")
+                
+            # Process Data
+            # We need to calculate Profit = (This Month Total) - (Prev Month Total) - (Owner Injection)
+            df_closings['Total'] = df_closings['bank_actual'] + df_closings['cash_actual']
+            df_closings['Prev_Total'] = df_closings['Total'].shift(1)
+            df_closings['Gross_Change'] = df_closings['Total'] - df_closings['Prev_Total']
+            
+            # Fetch Owner's Capital Injections for the period
+            # Construct exact dates for query
+            t_start_date = datetime(start_year, start_month, 1)
+            # End date: last day of end_month
+            if end_month == 12:
+                t_end_date = datetime(end_year + 1, 1, 1) - pd.Timedelta(days=1)
+            else:
+                t_end_date = datetime(end_year, end_month + 1, 1) - pd.Timedelta(days=1)
+            
+            df_tx = db.get_transactions(start_date=t_start_date, end_date=t_end_date)
+            
+            # Init columns via mapping to ensure correct alignment without merge suffix issues
+            
+            # Default to 0.0
+            capital_series = pd.Series(0.0, index=df_closings['month'])
+            withdrawal_series = pd.Series(0.0, index=df_closings['month'])
+
+            if not df_tx.empty:
+                df_tx['month'] = df_tx['date'].dt.strftime('%Y-%m')
+
+                # 1. Capital Injection (Owner)
+                mask_cap = (df_tx['category'] == '業主資本') & (df_tx['subcategory'] == '一般投入')
+                df_cap = df_tx[mask_cap].copy()
+                
+                if not df_cap.empty:
+                     # Group by month and sum
+                     cap_grouped = df_cap.groupby('month')['amount'].sum()
+                     # Align with df_closings['month']
+                     # We can use map.
+                     capital_series = df_closings['month'].map(cap_grouped).fillna(0.0)
+
+                # 2. Capital Withdrawal (資金調度 - 提出)
+                # Logic: Type="資金調度", Category="轉出", Note contains "(提出)"
+                mask_withdraw = (df_tx['type'] == '資金調度') & (df_tx['category'] == '轉出') & (df_tx['note'].str.contains(r'\(提出\)', na=False))
+                df_withdraw = df_tx[mask_withdraw].copy()
+                
+                if not df_withdraw.empty:
+                    with_grouped = df_withdraw.groupby('month')['amount'].sum()
+                    withdrawal_series = df_closings['month'].map(with_grouped).fillna(0.0)
+            
+            df_closings['Capital_Injection'] = capital_series.values
+            df_closings['Withdrawal'] = withdrawal_series.values
+
+            # Net Profit = Gross Change - Capital Injection + Withdrawal
+            # (Gross Change = Total - Prev Total. Withdrawal reduces Total. So we add it back to neutralize.)
+            df_closings['Net_Profit'] = df_closings['Gross_Change'] - df_closings['Capital_Injection'] + df_closings['Withdrawal']
+            
+            # Filter out the 'prev_month' row from display, only show target range
+            df_result = df_closings[df_closings['month'] >= start_str].copy()
+            
+            if not df_result.empty:
+                # Total Period Profit
+                # Logic: Sum of Net_Profit in the period
+                total_profit = df_result['Net_Profit'].sum()
+                
+                st.metric(f"區間總獲利 ({start_str} ~ {end_str})", f"${total_profit:,.0f}", help="區間期末總資產 - 區間期初總資產 - 業主投入 + 資金提出")
+                st.divider()
+                
+                # Chart
+                st.subheader("每月獲利趨勢")
+                if not df_result['Net_Profit'].isna().all():
+                    st.bar_chart(df_result.set_index('month')['Net_Profit'])
+                else:
+                    st.info("無法產生圖表 (資料不足)")
+                
+                # Table
+                st.subheader("詳細數據")
+                tbl = df_result[['month', 'Prev_Total', 'Total', 'Gross_Change', 'Capital_Injection', 'Withdrawal', 'Net_Profit']].copy()
+                tbl.columns = ['月份', '期初餘額 (上期末)', '期末總資產', '資產增減', '扣除業主投入', '加回資金提出', '實際獲利']
+                
+                st.dataframe(tbl.style.format({
+                    '期初餘額 (上期末)': '${:,.0f}', 
+                    '期末總資產': '${:,.0f}', 
+                    '資產增減': '${:,.0f}',
+                    '扣除業主投入': '${:,.0f}',
+                    '加回資金提出': '${:,.0f}',
+                    '實際獲利': '${:,.0f}'
+                }).applymap(lambda v: 'color: red;' if v < 0 else 'color: green;', subset=['實際獲利']), use_container_width=True)
+            else:
+                st.info("尚無目標月份的完整結算資料 (可能缺上個月的期末餘額)。")
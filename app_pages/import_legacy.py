@@ -0,0 +1,116 @@
+import pandas as pd
+import streamlit as st
+
+import data_import
+import database as db
+import import_jobs
+
+st.header("匯入歷史收支資料")
+st.info("支援一般會計軟體匯出之帳簿格式 (日期, 借方科目, 借方金額, 貸方科目, 貸方金額, 說明)。可一次選取多個檔案或 ZIP 壓縮檔，每個工作表都會解析。")
+
+# Background import jobs: progress is polled, the import itself runs off the script thread
+job_status_labels = {'pending': '等待中', 'running': '匯入中', 'done': '完成', 'failed': '失敗', 'interrupted': '中斷'}
+
+@st.fragment(run_every=2)
+def import_job_panel():
+    jobs = import_jobs.list_jobs(unfinished_only=True)
+    current = st.session_state.get('import_job_id')
+    if current and current not in [j['id'] for j in jobs]:
+        current_job = import_jobs.get_job(current)
+        if current_job:
+            jobs.insert(0, current_job)
+
+    for job in jobs:
+        status = job_status_labels.get(job['status'], job['status'])
+        progress = job['committed'] / job['total'] if job['total'] else 1.0
+        st.progress(progress, text=f"{job['label']} — {status} {job['committed']}/{job['total']} 筆")
+        if job['status'] == 'done':
+            st.success(f"匯入完成 成功: {job['committed']} 筆")
+        elif job['status'] in ('failed', 'interrupted'):
+            if job['error']:
+                st.error(f"匯入失敗: {job['error']}")
+            c1, c2 = st.columns(2)
+            if c1.button("從中斷處繼續匯入", key=f"resume_{job['id']}"):
+                import_jobs.start_job(job['id'])
+                st.rerun(scope="fragment")
+            # Already committed rows stay; re-importing the file flags them as existing
+            if c2.button("捨棄此匯入工作", key=f"discard_{job['id']}"):
+                if not import_jobs.cancel_job(job['id']):
+                    st.warning("此工作正在執行中，無法捨棄。")
+                else:
+                    st.rerun(scope="fragment")
+
+import_job_panel()
+
+uploaded_files = st.file_uploader("請選擇 Excel、CSV 或 ZIP 檔案", type=['xlsx', 'xls', 'csv', 'zip'], accept_multiple_files=True)
+folder_path = st.text_input("或輸入伺服器上的資料夾路徑", placeholder="例如: 過去會計報表")
+
+with st.expander("進階選項"):
+    engine_options = ['auto'] + list(data_import.EXCEL_ENGINES.keys())
+    excel_engine = st.selectbox("Excel 讀取引擎", engine_options, help="auto 會依序嘗試較快的引擎，失敗時自動改用預設讀取方式")
+
+sources = None
+if uploaded_files:
+    sources = uploaded_files
+elif folder_path:
+    sources = folder_path
+
+if sources:
+    st.subheader("資料預覽與解析")
+
+    # Parse once per selection: widget reruns (checkbox, confirm) reuse the result
+    parse_key = (data_import.sources_key(sources), excel_engine)
+    parsed = st.session_state.get('import_parsed')
+    if parsed is None or parsed[0] != parse_key:
+        try:
+            parsed = (parse_key, *data_import.process_batch(sources, engine=excel_engine))
+        except Exception as e:
+            st.error(f"讀取檔案失敗: {e}")
+            st.stop()
+        st.session_state['import_parsed'] = parsed
+    df_import, import_report = parsed[1].copy(), parsed[2]
+
+    # Per-file / per-sheet report
+    if import_report:
+        report_rows = []
+        for r in import_report:
+            skipped_desc = "、".join(f"第 {row_no} 列 ({reason})" for row_no, reason in r['skipped_rows'])
+            report_rows.append({
+                '檔案': r['file'],
+                '工作表': r['sheet'],
+                '狀態': r['status'],
+                '有效筆數': r['rows'],
+                '略過列': skipped_desc,
+                '錯誤': r['error']
+            })
+        with st.expander("檔案解析報告", expanded=any(r['status'] != '成功' or r['skipped_rows'] for r in import_report)):
+            st.dataframe(pd.DataFrame(report_rows), use_container_width=True, hide_index=True)
+
+    if df_import.empty:
+        st.warning("檔案中找不到可匯入的交易資料 (需包含日期與科目)")
+    else:
+        # Flag rows already recorded (re-imported periods)
+        df_import.insert(0, '已存在', db.find_existing_transactions(df_import))
+        dup_count = int(df_import['已存在'].sum())
+
+        st.caption(f"共 {len(import_report)} 個工作表，解析出 {len(df_import)} 筆有效收支")
+        if dup_count:
+            st.warning(f"⚠️ 其中 {dup_count} 筆與現有紀錄相同 (已存在)")
+        st.dataframe(df_import, use_container_width=True)
+
+        skip_existing = st.checkbox("略過已存在的紀錄", value=True)
+        df_commit = df_import[~df_import['已存在']] if skip_existing else df_import
+
+        # Confirmation
+        st.write("---")
+        if st.button(f"確認匯入資料 ({len(df_commit)} 筆)", type="primary"):
+            if import_jobs.list_jobs(unfinished_only=True):
+                st.warning("尚有未完成的匯入工作，請先繼續、捨棄或等待其完成。")
+            elif df_commit.empty:
+                st.info("沒有需要匯入的紀錄")
+            else:
+                label = "、".join(sorted({r['file'] for r in import_report}))
+                job_id = import_jobs.create_job(df_commit, label=label)
+                import_jobs.start_job(job_id)
+                st.session_state['import_job_id'] = job_id
+                st.rerun()
@@ -0,0 +1,371 @@
+from datetime import datetime
+
+import pandas as pd
+import streamlit as st
+
+import database as db
+import reports
+import services
+import utils
+
+st.header("每月結算")
+
+services.change_notice("monthly_closing", ["transactions", "monthly_closings"])
+
+
+
+# 1. Select Month
+
+col1, col2 = st.columns(2)
+
+with col1:
+
+    # Default to previous month
+
+    today = datetime.now()
+
+    last_month_date = today.replace(day=1) - pd.Timedelta(days=1)
+
+    
+
+    # UI for Year/Month Selection
+
+    m_year, m_month = st.columns(2)
+
+    with m_year:
+
+        current_year = today.year
+
+        # Year range: Current year - 3 to Current year + 1
+
+        year_options = list(range(current_year - 3, current_year + 2))
+
+        selected_year = st.selectbox("年份", year_options, index=year_options.index(last_month_date.year), key="mc_year")
+
+        
+
+    with m_month:
+
+        month_options = list(range(1, 13))
+
+        selected_month = st.selectbox("月份", month_options, index=month_options.index(last_month_date.month), key="mc_month")
+
+        
+
+    selected_month_str = f"{selected_year}-{selected_month:02d}"
+
+    
+
+    # Calculate Start/End Date for Query
+
+    m_start = datetime(selected_year, selected_month, 1)
+
+    # Handle end of month - simplest way to get next month 1st - 1 day
+
+    if selected_month == 12:
+
+        m_end = datetime(selected_year + 1, 1, 1) - pd.Timedelta(days=1)
+
+    else:
+
+        m_end = datetime(selected_year, selected_month + 1, 1) - pd.Timedelta(days=1)
+
+        
+
+# 2. Get Previous Closing (REMOVED: Rely on Transactions)
+
+# prev_closing = db.get_previous_closing(selected_month_str)
+
+
+
+start_bank = 0.0
+
+start_cash = 0.0
+
+
+
+st.info("ℹ️ 期初餘額說明：本月期初餘額將由「業主資本-上期結轉」交易紀錄決定。若為首月使用，請手動新增一筆「業主資本」收入作為開帳金額。")
+
+
+
+# 3. Calculate This Month's Flow
+
+df_month = db.get_transactions(start_date=m_start, end_date=m_end)
+
+
+
+flow_bank, flow_cash = utils.calculate_account_flow(df_month)
+
+
+calc_bank = start_bank + flow_bank
+
+calc_cash = start_cash + flow_cash
+
+
+
+st.divider()
+
+
+
+# 4. Input Actual & Compare
+
+st.subheader(f"{selected_month_str} 結帳核對")
+
+
+
+# Load existing closing if any
+
+current_closing = db.get_closing(selected_month_str)
+
+existing_bank = calc_bank
+
+existing_cash = calc_cash
+
+existing_note = ""
+
+
+
+if current_closing:
+
+    existing_bank = current_closing[1]
+
+    existing_cash = current_closing[2]
+
+    existing_note = current_closing[5]
+
+    st.success(f"✅ 本月已於 {current_closing[6]} 結帳過。")
+
+
+
+c1, c2 = st.columns(2)
+
+
+
+with c1:
+
+    st.markdown("### 🏦 銀行")
+
+    st.metric("期初", f"{start_bank:,.0f}")
+
+    st.metric("本月異動", f"{flow_bank:,.0f}")
+
+    st.metric("系統計算應有", f"{calc_bank:,.0f}")
+
+    
+
+    actual_bank = st.number_input("銀行實際餘額", value=existing_bank, step=1.0)
+
+    diff_bank = actual_bank - calc_bank
+
+    if diff_bank != 0:
+
+        st.error(f"差異: {diff_bank:,.0f}")
+
+    else:
+
+        st.success("無差異")
+
+
+
+with c2:
+
+    st.markdown("### 💵 現金")
+
+    st.metric("期初", f"{start_cash:,.0f}")
+
+    st.metric("本月異動", f"{flow_cash:,.0f}")
+
+    st.metric("系統計算應有", f"{calc_cash:,.0f}")
+
+    
+
+    actual_cash = st.number_input("現金實際餘額", value=existing_cash, step=1.0)
+
+    diff_cash = actual_cash - calc_cash
+
+    if diff_cash != 0:
+
+        st.error(f"差異: {diff_cash:,.0f}")
+
+    else:
+
+        st.success("無差異")
+
+
+
+note = st.text_area("結帳備註", value=existing_note)
+
+
+
+month_archived = db.is_archived_month(selected_month_str)
+
+if month_archived:
+
+    st.warning("此月份的交易 (或期初結轉) 已封存至歷史年度檔案，無法重新結帳。")
+
+if st.button("儲存結帳資料 (Save)", type="primary", disabled=month_archived):
+
+    # Closing + next month's carryover rows, upserted in one batch (re-saving never duplicates)
+
+    try:
+        duplicates = db.save_closing(selected_month_str, actual_bank, actual_cash, calc_bank, calc_cash, note, carryover=True)
+
+        next_month_date = db.carryover_date(selected_month_str)
+
+        st.session_state['closing_saved'] = (next_month_date.strftime('%Y-%m-%d'), duplicates)
+
+    except Exception as e:
+        st.error(f"結帳儲存失敗: {e}")
+        st.stop()
+
+    st.rerun()
+
+if st.session_state.get('closing_saved'):
+
+    carry_day, duplicates = st.session_state.pop('closing_saved')
+
+    st.success(f"結帳成功！已建立/更新 {carry_day} 的期初結轉紀錄。")
+
+    if duplicates:
+
+        st.warning(f"發現舊版重複建立的結轉紀錄 (ID: {', '.join(map(str, duplicates))})，會重複計入期初餘額，請至「每日記帳」選擇 {carry_day} 刪除。")
+
+st.divider()
+
+# Bulk re-close: after correcting an old transaction, recompute every later closing
+# from one ledger read, review the differences, then write them in one batch
+
+with st.expander("🔁 批次重新結帳 (修改過去交易後使用)"):
+
+    closings_all = db.get_closings_range("0000-00", "9999-99")
+
+    # Archived years are read-only (their carryovers live in the cold tier)
+    closed_months = [m for m in closings_all['month'].astype(str).tolist() if not db.is_archived_month(m)] if not closings_all.empty else []
+
+    if not closed_months:
+
+        st.caption("尚無可重新結帳的月份")
+
+    else:
+
+        rc1, rc2 = st.columns(2)
+
+        rc_start = rc1.selectbox("起始月份", closed_months, key="rc_start")
+
+        rc_end = rc2.selectbox("結束月份", closed_months, index=len(closed_months) - 1, key="rc_end")
+
+        if st.button("計算差異", key="rc_plan"):
+
+            st.session_state['reclose_plan'] = db.plan_reclose(rc_start, rc_end)
+
+        plan = st.session_state.get('reclose_plan')
+
+        if plan is not None:
+
+            if plan.empty:
+
+                st.info("此區間沒有已結帳的月份")
+
+            else:
+
+                diff = pd.DataFrame({
+                    "月份": plan['month'],
+                    "銀行 原計算": plan['bank_calc_old'],
+                    "銀行 重算": plan['bank_calc'],
+                    "銀行 實際": plan['bank_actual'],
+                    "銀行 差異": plan['bank_actual'] - plan['bank_calc'],
+                    "現金 原計算": plan['cash_calc_old'],
+                    "現金 重算": plan['cash_calc'],
+                    "現金 實際": plan['cash_actual'],
+                    "現金 差異": plan['cash_actual'] - plan['cash_calc'],
+                })
+
+                changed = ((plan['bank_calc'] - plan['bank_calc_old']).abs() > 0.005) | ((plan['cash_calc'] - plan['cash_calc_old']).abs() > 0.005)
+
+                diff.insert(1, "變動", changed.map({True: "⚠️", False: ""}))
+
+                st.dataframe(diff, hide_index=True, use_container_width=True,
+                             column_config={c: st.column_config.NumberColumn(c, format="%.0f") for c in diff.columns[2:]})
+
+                st.caption(f"共 {len(plan)} 個月，其中 {int(changed.sum())} 個月的系統計算值會變動。實際餘額與備註維持不變，期初結轉依前月實際餘額更新。")
+
+                if st.button("確認重新結帳", type="primary", key="rc_confirm"):
+
+                    try:
+                        duplicates = db.reclose(plan)
+                        st.session_state.pop('reclose_plan', None)
+                        st.session_state['reclose_done'] = (len(plan), duplicates)
+                    except Exception as e:
+                        st.error(f"重新結帳失敗: {e}")
+                        st.stop()
+
+                    st.rerun()
+
+    if st.session_state.get('reclose_done'):
+
+        count, duplicates = st.session_state.pop('reclose_done')
+
+        st.success(f"已重新結帳 {count} 個月。")
+
+        if duplicates:
+
+            st.warning(f"發現舊版重複建立的結轉紀錄 (ID: {', '.join(map(str, duplicates))})，會重複計入期初餘額，請至「每日記帳」刪除。")
+
+st.divider()
+
+# Report packs are built on a background worker; only while one is being built
+# does a fragment poll, and it reruns the page once the pack is ready
+
+st.subheader("📑 結帳報表")
+
+report_labels = {'running': '產生中...', 'failed': '產生失敗', 'missing': '尚未產生'}
+
+r_scope = st.radio("報表期間", ["月報", "年報"], horizontal=True, key="report_scope")
+
+report_period = selected_month_str if r_scope == "月報" else str(selected_year)
+
+@st.fragment(run_every=2)
+def report_progress(period):
+
+    if reports.report_status(period)['status'] != 'running':
+
+        st.rerun()
+
+    st.caption(f"{period}: {report_labels['running']}")
+
+def report_panel(period):
+
+    status = reports.report_status(period)
+
+    if status['status'] == 'running':
+
+        report_progress(period)
+
+    elif status['status'] == 'ready':
+
+        st.caption(f"{period} 報表已就緒" + ("" if reports.is_closed(period) else " (此期間尚未全部結帳)"))
+
+        cols = st.columns(len(reports.REPORT_FILES))
+
+        for col, (fmt, info) in zip(cols, reports.REPORT_FILES.items()):
+
+            with col, open(status['paths'][fmt], 'rb') as f:
+
+                st.download_button(info['label'], data=f, file_name=f"財務報表_{period}.{fmt}",
+                                   mime=info['mime'], key=f"report_{fmt}")
+
+    else:
+
+        st.caption(f"{period}: {report_labels[status['status']]}")
+
+        if status['error']:
+
+            st.error(status['error'])
+
+        if st.button("產生報表", key="report_generate"):
+
+            reports.request_report(period)
+
+            st.rerun()
+
+report_panel(report_period)
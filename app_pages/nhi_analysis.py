@@ -0,0 +1,391 @@
+from datetime import datetime
+
+import altair as alt
+import pandas as pd
+import streamlit as st
+
+import database as db
+import services
+import utils
+
+st.header("健保營收分析")
+
+services.change_notice("nhi_analysis", ["nhi_records", "transactions"])
+
+
+
+tab1, tab2 = st.tabs(["📝 資料登錄 (Data Entry)", "📊 分析報表 (Analysis)"])
+
+
+
+with tab1:
+
+    st.subheader("每月健保申報資料登錄")
+
+    
+
+    # Month Selection
+
+    today = datetime.now()
+
+    last_month_date = today.replace(day=1) - pd.Timedelta(days=1)
+
+    
+
+    # UI for Year/Month Selection
+
+    c_year, c_month = st.columns(2)
+
+    with c_year:
+
+        current_year = today.year
+
+        # Year range: Current year - 3 to Current year + 1
+
+        year_options = list(range(current_year - 3, current_year + 2))
+
+        selected_year = st.selectbox("年份", year_options, index=year_options.index(last_month_date.year), key="mc_year")
+
+        
+
+    with c_month:
+
+        month_options = list(range(1, 13))
+
+        selected_month = st.selectbox("月份", month_options, index=month_options.index(last_month_date.month), key="mc_month")
+
+        
+
+    target_month_str = f"{selected_year}-{selected_month:02d}"
+
+    
+
+    # Load existing data if any
+
+    # We need to implement get_nhi_records to filter by a single month or just get all and filter in python, 
+
+    # or simplify and just use get_nhi_records(start, end)
+
+    existing_recs = db.get_nhi_records(start_month=target_month_str, end_month=target_month_str)
+
+    
+
+    def_total = 0.0
+
+    def_deduction = 0.0
+
+    def_rejection = 0.0
+
+    def_chronic = 0
+
+    def_drug_fee = 0.0
+
+    def_general = 0
+
+
+
+    if not existing_recs.empty:
+
+        rec = existing_recs.iloc[0]
+
+        def_total = float(rec['total_fee'])
+
+        def_deduction = float(rec['deduction'])
+
+        def_rejection = float(rec['rejection'])
+
+        def_chronic = int(rec['chronic_count'])
+
+        # Check if general_count exists (for backward compatibility if DB not reset)
+
+        if 'general_count' in rec:
+
+             def_general = int(rec['general_count'])
+
+        if 'drug_fee' in rec:
+
+             def_drug_fee = float(rec['drug_fee'])
+
+             
+
+        st.info(f"ℹ️ 已載入 {target_month_str} 的現有資料，最後更新: {rec['updated_at']}")
+
+    
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+
+        total_fee = st.number_input("總調劑費 (核扣點值前)", value=def_total, step=1.0, help="申報 A")
+
+        rejection = st.number_input("核刪費用", value=def_rejection, step=1.0, help="核刪 E")
+
+        chronic_count = st.number_input("慢箋數量 (張)", value=def_chronic, step=1, help="當月慢箋總張數")
+
+        
+
+    with col2:
+
+        drug_fee = st.number_input("健保藥費 (實支實付)", value=def_drug_fee, step=1.0, help="藥費")
+
+        deduction = st.number_input("點值核扣金額", value=def_deduction, step=1.0, help="核扣 D")
+
+        general_count = st.number_input("一般箋數量 (張)", value=def_general, step=1, help="當月一般箋總張數")
+
+        
+
+    # Real-time Verification Calc
+
+    if total_fee > 0:
+
+        # Formula: (Dispensing + Drug) - Deduction - Rejection
+
+        actual_received = (total_fee + drug_fee) - deduction - rejection
+
+        point_value = 1 - (deduction / total_fee)
+
+        st.metric("試算實際點值 (Effective Point Value)", f"{point_value:.4f}", help="1 - (核扣 / 總調劑費)")
+
+        st.metric("當月健保應收", f"${actual_received:,.0f}", help="總調劑費 (核扣點值前) + 健保藥費 - 核扣 - 核刪")
+
+    
+
+    if st.button("登入", type="primary"):
+
+        db.save_nhi_record(target_month_str, total_fee, deduction, rejection, chronic_count, general_count, drug_fee)
+
+        st.success(f"✅ {target_month_str} 資料已儲存！")
+
+        st.rerun()
+
+
+
+with tab2:
+
+    st.subheader("健保營收結構分析")
+
+    
+
+    # Date Selection with Year/Month only
+
+    # Layout: Start Year | Start Month | -> | End Year | End Month
+
+    st.write("選擇分析區間")
+
+    sel_c1, sel_c2, sel_c3, sel_c4 = st.columns(4)
+
+    
+
+    current_year = datetime.now().year
+
+    year_options = list(range(current_year - 3, current_year + 2))
+
+    month_options = list(range(1, 13))
+
+    
+
+    with sel_c1:
+
+        start_year = st.selectbox("開始年份", year_options, index=year_options.index(current_year), key="an_start_y")
+
+    with sel_c2:
+
+        start_month = st.selectbox("開始月份", month_options, index=0, key="an_start_m") # Default Jan
+
+        
+
+    with sel_c3:
+
+        end_year = st.selectbox("結束年份", year_options, index=year_options.index(current_year), key="an_end_y")
+
+    with sel_c4:
+
+        end_month = st.selectbox("結束月份", month_options, index=datetime.now().month-1, key="an_end_m") # Default Current Month
+
+        
+
+    start_str = f"{start_year}-{start_month:02d}"
+
+    end_str = f"{end_year}-{end_month:02d}"
+
+    
+
+    if start_str <= end_str:
+
+        df_nhi = db.get_nhi_records(start_month=start_str, end_month=end_str)
+
+        
+
+        if not df_nhi.empty:
+
+            df_nhi = utils.nhi_metrics(df_nhi)
+
+            
+            # Metrics Display
+
+            st.markdown("### 區間總結")
+
+            m1, m2, m3, m4 = st.columns(4)
+
+            m1.metric("預估健保淨額 (含藥費)", f"${df_nhi['actual_received'].sum():,.0f}")
+
+            m2.metric("平均點值", f"{df_nhi['point_value'].mean():.4f}")
+
+            m3.metric("慢箋調劑費總收入 (推估)", f"${df_nhi['chronic_income'].sum():,.0f}")
+
+            m4.metric("一般箋調劑費總收入 (推估)", f"${df_nhi['general_income'].sum():,.0f}")
+
+            
+
+            st.divider()
+
+            st.markdown("### 財務對帳 (預估 vs 實際入帳)")
+
+            all_tx = db.get_transactions()
+
+            df_merge = utils.nhi_reconciliation(df_nhi, all_tx)
+
+            
+            # Display Comparison Table
+
+            comp_display = df_merge[['month', 'total_fee', 'real_dispensing_fee', 'drug_fee', 'deduction', 'rejection', 'actual_received', '實際入帳', '差異']].copy()
+
+            comp_display.columns = ['月份', '申報調劑費', '實領調劑費', '藥費', '點值核扣', '核刪', '當月健保應收', '實際入帳', '差異']
+
+            
+
+            st.dataframe(comp_display.style.format({
+
+                '申報調劑費': '${:,.0f}',
+                
+                '實領調劑費': '${:,.0f}',
+
+                '藥費': '${:,.0f}',
+
+                '點值核扣': '${:,.0f}',
+
+                '核刪': '${:,.0f}',
+
+                '當月健保應收': '${:,.0f}',
+
+                '實際入帳': '${:,.0f}',
+
+                '差異': '${:,.0f}'
+
+            }).applymap(lambda v: 'color: red;' if v < -100 else ('color: green;' if v > 100 else ''), subset=['差異']), 
+
+            use_container_width=True)
+
+
+
+            
+
+            st.divider()
+
+            
+
+            # Visualization
+
+            st.markdown("### 健保營收結構趨勢")
+
+            
+
+            # Prepare data for stacked bar chart: Chronic Income, General Income, Drug Fee
+
+            chart_data = df_nhi.set_index('month')[['chronic_income', 'general_income', 'drug_fee']]
+
+            chart_data.columns = ['慢箋調劑費', '一般箋調劑費', '藥費']
+
+            st.bar_chart(chart_data, stack=True)
+
+            
+
+            # Point Value Trend
+
+            st.markdown("### 點值趨勢")
+
+            # st.line_chart(df_nhi.set_index('month')['point_value'])
+
+            
+
+            # Use Altair for fixed Y-axis scaling
+
+            chart_point = alt.Chart(df_nhi).mark_line(point=True).encode(
+
+                x=alt.X('month', title='月份'),
+
+                y=alt.Y('point_value', title='點值', scale=alt.Scale(domain=[0.75, 1.0])),
+
+                tooltip=['month', alt.Tooltip('point_value', format='.4f')]
+
+            ).interactive()
+
+            
+
+            st.altair_chart(chart_point, use_container_width=True)
+
+            
+
+            st.divider()
+
+            st.markdown("### 詳細數據")
+
+            
+
+            # Rename columns for display
+
+            df_display = df_nhi.rename(columns={
+
+                'month': '月份',
+
+                'total_fee': '總調劑費',
+
+                'deduction': '點值核扣',
+
+                'rejection': '核刪費用',
+
+                'chronic_count': '慢箋張數',
+
+                'general_count': '一般箋張數',
+
+                'updated_at': '更新時間',
+
+                'actual_received': '實收金額',
+
+                'point_value': '點值',
+
+                'chronic_income': '慢箋收入',
+
+                'general_income': '一般箋收入'
+
+            })
+
+            
+
+            st.dataframe(df_display.style.format({
+
+                '總調劑費': '${:,.0f}',
+
+                '點值核扣': '${:,.0f}',
+
+                '核刪費用': '${:,.0f}',
+
+                '實收金額': '${:,.0f}',
+
+                '點值': '{:.4f}',
+
+                '慢箋收入': '${:,.0f}',
+
+                '一般箋收入': '${:,.0f}'
+
+            }), use_container_width=True)
+
+            
+
+        else:
+
+            st.info("此區間無健保申報資料")
+
+    else:
+
+        st.error("帳號或密碼錯誤")
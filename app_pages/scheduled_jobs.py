@@ -0,0 +1,65 @@
+import pandas as pd
+import streamlit as st
+
+import scheduler
+
+st.header("排程工作")
+
+enabled, schedule = scheduler.load_schedule()
+if not enabled:
+    st.warning("排程已停用 (secrets.toml [scheduler] enabled = false)，僅能手動執行。")
+
+status_labels = {'ok': '成功', 'failed': '失敗', 'running': '執行中'}
+
+@st.fragment(run_every=5)
+def job_panel():
+    latest = scheduler.last_runs()
+    running = scheduler.running_jobs()
+
+    for job, spec in schedule.items():
+        last = latest.get(job)
+        c1, c2, c3, c4 = st.columns([3, 2, 4, 1])
+        c1.markdown(f"**{spec['label']}**  \n`{job}` · {scheduler.describe(spec)}")
+        if job in running:
+            c2.info(f"執行中 (自 {running[job]['started_at']})")
+        elif last:
+            label = status_labels.get(last['status'], last['status'])
+            (c2.success if last['status'] == 'ok' else c2.error)(f"{label} · {last['duration']:.1f}s")
+        else:
+            c2.caption("尚未執行")
+        if last:
+            next_at = scheduler.next_run(spec, scheduler.parse_time(last['started_at']))
+            c3.caption(f"上次: {last['started_at']}  \n下次: {next_at:%Y-%m-%d %H:%M}")
+            if last.get('error'):
+                c3.caption(f"錯誤: {last['error']}")
+        if c4.button("立即執行", key=f"run_{job}", disabled=job in running):
+            scheduler.run_in_background(job)
+            st.rerun(scope="fragment")
+
+job_panel()
+
+st.divider()
+st.subheader("執行紀錄")
+
+job_filter = st.selectbox("工作", ["全部"] + list(schedule), format_func=lambda j: j if j == "全部" else schedule[j]['label'])
+history = scheduler.read_history(job=None if job_filter == "全部" else job_filter, limit=200)
+if history:
+    df_hist = pd.DataFrame(history)
+    df_hist['status'] = df_hist['status'].map(status_labels).fillna(df_hist['status'])
+    cols = [c for c in ['started_at', 'job', 'trigger', 'status', 'duration', 'error', 'result'] if c in df_hist.columns]
+    df_hist = df_hist[cols]
+    if 'result' in df_hist.columns:
+        df_hist['result'] = df_hist['result'].astype(str)
+    st.dataframe(df_hist, hide_index=True, use_container_width=True, column_config={
+        "started_at": "開始時間", "job": "工作", "trigger": "觸發", "status": "狀態",
+        "duration": st.column_config.NumberColumn("耗時 (秒)", format="%.2f"), "error": "錯誤", "result": "結果"})
+
+    # Duration trend per job
+    ok = pd.DataFrame(history)
+    ok = ok[ok['status'] == 'ok']
+    if not ok.empty:
+        st.caption("平均耗時 (成功執行)")
+        st.dataframe(ok.groupby('job')['duration'].agg(['count', 'mean', 'max']).round(2)
+                     .rename(columns={'count': '次數', 'mean': '平均 (秒)', 'max': '最長 (秒)'}), use_container_width=True)
+else:
+    st.caption("尚無執行紀錄")
@@ -0,0 +1,146 @@
+import argparse
+import os
+from datetime import datetime, timedelta
+
+import pandas as pd
+from gspread.utils import rowcol_to_a1
+
+import database as db
+
+# Hot/cold tiering: transactions of fully closed years move from the live
+# "transactions" worksheet into compressed Parquet files under db.ARCHIVE_DIR.
+# db.get_transactions unions them back in when a date range reaches those years.
+COMPRESSION = "zstd"
+# Tombstones stay in the sheet this long. Undo: clear the row's deleted cell; the
+# app shows the row again after its next full sync (db.FULL_SYNC_SECONDS).
+COMPACT_AFTER_DAYS = 7
+
+def closed_years():
+    """Years before the current one whose 12 months all have a monthly closing."""
+    df = db.get_closings_range("0000-00", "9999-99")
+    if df.empty:
+        return []
+    months = df['month'].astype(str)
+    years = []
+    for year in sorted({m[:4] for m in months if m[:4].isdigit()}):
+        expected = {f"{year}-{m:02d}" for m in range(1, 13)}
+        if int(year) < datetime.now().year and expected <= set(months):
+            years.append(int(year))
+    return years
+
+def _row_ranges(row_numbers):
+    """Group sorted sheet row numbers into (first, last) contiguous ranges."""
+    ranges = []
+    for r in sorted(row_numbers):
+        if ranges and r == ranges[-1][1] + 1:
+            ranges[-1][1] = r
+        else:
+            ranges.append([r, r])
+    return ranges
+
+def archive_year(year, dry_run=False):
+    """Move one year's transactions to its archive file, then delete them from the sheet in one request."""
+    with db.write_lock(): # no append or row-number write while rows shift
+        return _archive_year(year, dry_run)
+
+def _archive_year(year, dry_run):
+    ws = db.get_worksheet("transactions")
+    values = ws.get_all_values()
+    if len(values) < 2:
+        print(f"[{year}] Sheet is empty.")
+        return 0
+    header, rows = values[0], values[1:]
+
+    dates = pd.to_datetime(pd.Series([r[header.index('date')] if len(r) > header.index('date') else "" for r in rows]), errors='coerce')
+    selected = [i for i, d in enumerate(dates) if not pd.isna(d) and d.year == year]
+    if not selected:
+        print(f"[{year}] Nothing to archive.")
+        return 0
+
+    ranges = _row_ranges([i + 2 for i in selected]) # sheet rows are 1-based after the header
+    print(f"[{year}] {len(selected)} rows in {len(ranges)} block(s)")
+    if dry_run:
+        return len(selected)
+
+    # 1. Write the cold copy first (merged with rows archived earlier); deleted rows are not kept
+    df = db.drop_deleted(db.decode_values("transactions", header, [rows[i] for i in selected]))
+    path = db.archive_path(year)
+    if os.path.exists(path):
+        old = pd.read_parquet(path)
+        df = pd.concat([old, df], ignore_index=True).drop_duplicates(subset=['id'], keep='last')
+    os.makedirs(db.ARCHIVE_DIR, exist_ok=True)
+    tmp = path + ".tmp"
+    db.arrow_safe(df).to_parquet(tmp, compression=COMPRESSION, index=False)
+    os.replace(tmp, path)
+
+    # 2. Delete from the live sheet: one batch_update, bottom-up so row numbers stay valid
+    requests = [
+        {"deleteDimension": {"range": {"sheetId": ws.id, "dimension": "ROWS", "startIndex": first - 1, "endIndex": last}}}
+        for first, last in reversed(ranges)
+    ]
+    db.get_spreadsheet().batch_update({"requests": requests})
+    db.invalidate_cache("transactions")
+    print(f"[{year}] Archived to {path}")
+    return len(selected)
+
+def compact(dry_run=False, after_days=COMPACT_AFTER_DAYS):
+    """Remove rows tombstoned more than `after_days` ago from the live sheet in one request."""
+    with db.write_lock(): # no append or row-number write while rows shift
+        return _compact(dry_run, after_days)
+
+def _compact(dry_run, after_days):
+    ws = db.get_worksheet("transactions")
+    header = db.TABLE_HEADERS["transactions"]
+    col = header.index("deleted") + 1
+    # deleted and deleted_at are adjacent: one read of the two columns
+    values = ws.get(f"{rowcol_to_a1(2, col)}:{rowcol_to_a1(ws.row_count, col + 1)}")
+    cutoff = datetime.now() - timedelta(days=after_days)
+    selected = []
+    for i, r in enumerate(values):
+        if not r or str(r[0]) != "1":
+            continue
+        try:
+            deleted_at = datetime.strptime(r[1], '%Y-%m-%d %H:%M:%S') if len(r) > 1 else None
+        except ValueError:
+            deleted_at = None # unreadable timestamp: treat as old
+        if deleted_at is None or deleted_at <= cutoff:
+            selected.append(i + 2)
+    if not selected:
+        print("Nothing to compact.")
+        return 0
+
+    ranges = _row_ranges(selected)
+    print(f"{len(selected)} deleted rows in {len(ranges)} block(s)")
+    if dry_run:
+        return len(selected)
+    # Bottom-up so row numbers stay valid
+    requests = [
+        {"deleteDimension": {"range": {"sheetId": ws.id, "dimension": "ROWS", "startIndex": first - 1, "endIndex": last}}}
+        for first, last in reversed(ranges)
+    ]
+    db.get_spreadsheet().batch_update({"requests": requests})
+    db.invalidate_cache("transactions")
+    return len(selected)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive fully closed years out of the live transactions sheet.")
+    parser.add_argument("--year", type=int, nargs="+", help="Years to archive (default: every closed year not yet archived)")
+    parser.add_argument("--dry-run", action="store_true", help="Only show what would be archived")
+    parser.add_argument("--list", action="store_true", help="List closed and archived years")
+    parser.add_argument("--compact", action="store_true", help=f"Remove rows deleted more than {COMPACT_AFTER_DAYS} days ago instead")
+    args = parser.parse_args()
+
+    if args.compact:
+        compact(dry_run=args.dry_run)
+    elif args.list:
+        closed = closed_years()
+        print(f"Closed years: {closed}")
+        print(f"Archived years: {db.archived_years()}")
+    else:
+        closed = closed_years()
+        years = args.year or [y for y in closed if y not in db.archived_years()]
+        for y in years:
+            if y not in closed:
+                print(f"[{y}] Not fully closed, skipped.")
+                continue
+            archive_year(y, dry_run=args.dry_run)
@@ -0,0 +1,195 @@
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+
+import pandas as pd
+
+import database as db
+
+# Incremental Parquet snapshots of the spreadsheet.
+# Each snapshot directory holds, per table, only the rows that are new or changed
+# since the previous snapshot, plus the keys deleted since then and a key -> row
+# hash list used to diff the next snapshot. The first snapshot is a full copy.
+BACKUP_DIR = os.path.join(db.LOCAL_DIR, "backups")
+TABLES = ["transactions", "monthly_closings", "nhi_records"]
+TABLE_KEYS = {"transactions": "id", "monthly_closings": "month", "nhi_records": "month"}
+COMPRESSION = "zstd"
+ROWS_PER_REQUEST = 10000 # rows per values.update call on restore
+
+# Column types; anything not listed (including columns added later) is stored as text
+NUMERIC_COLUMNS = {
+    "id": "Int64",
+    "amount": "float64",
+    "original_amount": "float64",
+    "bank_actual": "float64",
+    "cash_actual": "float64",
+    "bank_calc": "float64",
+    "cash_calc": "float64",
+    "total_fee": "float64",
+    "deduction": "float64",
+    "rejection": "float64",
+    "chronic_count": "Int64",
+    "general_count": "Int64",
+    "drug_fee": "float64",
+}
+DATE_COLUMNS = {"date"}
+
+def to_typed(df):
+    """Apply NUMERIC_COLUMNS / DATE_COLUMNS types; everything else becomes text."""
+    df = df.copy()
+    for c in df.columns:
+        if c in NUMERIC_COLUMNS:
+            numeric = pd.to_numeric(df[c].replace("", None), errors='coerce')
+            if NUMERIC_COLUMNS[c] == "Int64":
+                numeric = numeric.round()
+            df[c] = numeric.astype(NUMERIC_COLUMNS[c])
+        elif c in DATE_COLUMNS:
+            df[c] = pd.to_datetime(df[c].replace("", None), errors='coerce')
+        else:
+            df[c] = df[c].astype(str).where(df[c].notna(), "").astype("string")
+    return df
+
+def to_sheet_values(df):
+    """Typed frame -> list of rows ready for the Sheets API (no NaN/NA, dates as text)."""
+    out = pd.DataFrame(index=df.index)
+    for c in df.columns:
+        if c in DATE_COLUMNS:
+            out[c] = df[c].dt.strftime('%Y-%m-%d').astype(object).where(df[c].notna(), "")
+        else:
+            out[c] = df[c].astype(object).where(df[c].notna(), "")
+    return out.values.tolist()
+
+def row_hashes(df, table):
+    """Key -> content hash for every row."""
+    hashes = pd.util.hash_pandas_object(df, index=False).astype(str)
+    return pd.DataFrame({"key": df[TABLE_KEYS[table]].astype(str).values, "hash": hashes.values})
+
+def fetch_table(table):
+    """Download one worksheet as a typed frame."""
+    ws = db.get_worksheet(table)
+    values = ws.get_all_values()
+    if not values:
+        return pd.DataFrame(columns=db.TABLE_HEADERS[table])
+    header, rows = values[0], values[1:]
+    df = pd.DataFrame(rows, columns=header)
+    return to_typed(df)
+
+def list_snapshots():
+    """Snapshot manifests, oldest first."""
+    if not os.path.isdir(BACKUP_DIR):
+        return []
+    manifests = []
+    for name in sorted(os.listdir(BACKUP_DIR)):
+        path = os.path.join(BACKUP_DIR, name, "manifest.json")
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                manifests.append(json.load(f))
+    return manifests
+
+def _snapshot_file(snapshot_id, table, kind):
+    return os.path.join(BACKUP_DIR, snapshot_id, f"{table}.{kind}.parquet")
+
+def create_snapshot(tables=TABLES):
+    """Write an incremental snapshot and return its manifest."""
+    previous = list_snapshots()
+    prev = previous[-1] if previous else None
+    snapshot_id = datetime.now().strftime('%Y%m%d-%H%M%S')
+    os.makedirs(os.path.join(BACKUP_DIR, snapshot_id), exist_ok=True)
+
+    manifest = {"id": snapshot_id, "created_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                "base": prev["id"] if prev else None, "tables": {}}
+
+    for table in tables:
+        df = fetch_table(table)
+        hashes = row_hashes(df, table)
+
+        prev_hashes = None
+        if prev and table in prev["tables"]:
+            prev_hashes = pd.read_parquet(_snapshot_file(prev["id"], table, "hashes"))
+
+        if prev_hashes is None:
+            changed = df
+            deleted = []
+        else:
+            merged = hashes.merge(prev_hashes, on="key", how="left", suffixes=("", "_prev"))
+            changed = df[(merged["hash"] != merged["hash_prev"]).values]
+            deleted = sorted(set(prev_hashes["key"]) - set(hashes["key"]))
+
+        changed.to_parquet(_snapshot_file(snapshot_id, table, "rows"), compression=COMPRESSION, index=False)
+        hashes.to_parquet(_snapshot_file(snapshot_id, table, "hashes"), compression=COMPRESSION, index=False)
+        manifest["tables"][table] = {"columns": list(df.columns), "rows": len(df),
+                                     "changed": len(changed), "deleted": deleted}
+        print(f"[{table}] {len(df)} rows, {len(changed)} changed, {len(deleted)} deleted")
+
+    with open(os.path.join(BACKUP_DIR, snapshot_id, "manifest.json"), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    print(f"Snapshot {snapshot_id} written to {BACKUP_DIR}")
+    return manifest
+
+def load_snapshot(snapshot_id, table):
+    """Rebuild the full table as of `snapshot_id` by replaying the snapshot chain."""
+    chain = []
+    manifests = {m["id"]: m for m in list_snapshots()}
+    current = manifests.get(snapshot_id)
+    if current is None:
+        raise ValueError(f"Snapshot {snapshot_id} not found")
+    while current:
+        chain.append(current)
+        current = manifests.get(current["base"]) if current["base"] else None
+
+    key = TABLE_KEYS[table]
+    rows = None
+    for m in reversed(chain):
+        if table not in m["tables"]:
+            continue
+        delta = pd.read_parquet(_snapshot_file(m["id"], table, "rows"))
+        if rows is None:
+            rows = delta
+            continue
+        keep = ~rows[key].astype(str).isin(set(m["tables"][table]["deleted"]) | set(delta[key].astype(str)))
+        rows = pd.concat([rows[keep], delta], ignore_index=True)
+
+    if rows is None:
+        raise ValueError(f"Snapshot {snapshot_id} has no data for {table}")
+    columns = chain[0]["tables"][table]["columns"]
+    rows = rows.reindex(columns=columns)
+    return rows.sort_values(by=key, kind="stable").reset_index(drop=True)
+
+def restore_snapshot(snapshot_id, tables=TABLES):
+    """Replace worksheet contents with a snapshot: clear + resize + one update per ROWS_PER_REQUEST rows."""
+    for table in tables:
+        df = load_snapshot(snapshot_id, table)
+        values = [list(df.columns)] + to_sheet_values(df)
+        ws = db.get_worksheet(table)
+        ws.clear()
+        ws.resize(rows=max(len(values), 2), cols=max(len(df.columns), 1))
+        for start in range(0, len(values), ROWS_PER_REQUEST):
+            ws.update(range_name=f"A{start + 1}", values=values[start:start + ROWS_PER_REQUEST])
+        print(f"[{table}] restored {len(df)} rows")
+    db.invalidate_cache()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incremental Parquet backups of the pharmacy spreadsheet.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("backup", help="Write an incremental snapshot")
+    sub.add_parser("list", help="List snapshots")
+    p_restore = sub.add_parser("restore", help="Overwrite the sheets with a snapshot")
+    p_restore.add_argument("snapshot_id")
+    p_restore.add_argument("--tables", nargs="+", choices=TABLES, default=TABLES)
+    p_restore.add_argument("--yes", action="store_true", help="Do not ask for confirmation")
+    args = parser.parse_args()
+
+    if args.command == "backup":
+        create_snapshot()
+    elif args.command == "list":
+        for m in list_snapshots():
+            summary = ", ".join(f"{t}: {info['rows']} rows ({info['changed']} changed)" for t, info in m["tables"].items())
+            print(f"{m['id']}  {summary}")
+    elif args.command == "restore":
+        if not args.yes:
+            answer = input(f"This replaces {', '.join(args.tables)} with snapshot {args.snapshot_id}. Continue? [y/N] ")
+            if answer.strip().lower() != "y":
+                sys.exit("Aborted.")
+        restore_snapshot(args.snapshot_id, args.tables)
@@ -0,0 +1,85 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+import data_import
+
+# Rows shaped like 過去會計報表/11401.xlsx: title row, header row, then journal lines
+SAMPLE_LINES = [
+    ("現金", "銷貨收入", "現金收入"),
+    ("銀行存款", "銷貨收入", "刷卡收入"),
+    ("銀行存款", "銷貨收入", "信用卡收入"),
+    ("銷貨成本", "現金", "藥費收現"),
+    ("水電雜費", "現金", "雜費"),
+    ("薪資支出", "銀行存款", "薪資"),
+]
+
+def build_sample_workbook(path, rows, sheets=1):
+    """Write a synthetic legacy ledger workbook with `rows` journal lines per sheet."""
+    start = datetime(2025, 1, 1)
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        for s in range(sheets):
+            data = [["日記簿", None, None, None, None, None],
+                    ["日期", "借方科目(資金流入)", "借方金額", "貸方科目(資金流出)", "貸方金額", "說明"]]
+            for i in range(rows):
+                debit, credit, note = random.choice(SAMPLE_LINES)
+                amount = random.randint(100, 40000)
+                data.append([start + timedelta(days=i % 365), debit, amount, credit, amount, note])
+            pd.DataFrame(data).to_excel(writer, sheet_name=f"工作表{s + 1}", header=False, index=False)
+
+def time_engine(path, engine, repeat):
+    """Return (best seconds, rows parsed) for reading + parsing `path` with `engine`."""
+    best = None
+    rows = 0
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        with open(path, "rb") as f:
+            sheets = data_import.EXCEL_ENGINES[engine](f)
+        for raw in sheets.values():
+            result = data_import.parse_sheet(raw)
+            rows = len(result[0]) if not isinstance(result, str) else 0
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best, rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare Excel ingestion engines used by data_import.")
+    parser.add_argument("--file", help="Existing workbook to benchmark (default: generate a sample)")
+    parser.add_argument("--rows", type=int, default=20000, help="Rows per sheet for the generated sample")
+    parser.add_argument("--sheets", type=int, default=1, help="Sheets in the generated sample")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per engine (best time is reported)")
+    args = parser.parse_args()
+
+    tmp_dir = None
+    path = args.file
+    if not path:
+        tmp_dir = tempfile.TemporaryDirectory()
+        path = os.path.join(tmp_dir.name, "sample_ledger.xlsx")
+        print(f"Generating sample workbook ({args.sheets} x {args.rows} rows)...")
+        build_sample_workbook(path, args.rows, args.sheets)
+
+    print(f"Benchmarking {path} ({os.path.getsize(path) / 1024:.0f} KB)")
+    print(f"{'engine':<20}{'best (s)':>10}{'rows':>10}{'speedup':>10}")
+
+    results = {}
+    for engine in data_import.EXCEL_ENGINES:
+        try:
+            results[engine] = time_engine(path, engine, args.repeat)
+        except Exception as e:
+            print(f"{engine:<20}{'n/a':>10}  ({e})")
+
+    baseline = results.get("default", (None, 0))[0]
+    for engine, (elapsed, rows) in results.items():
+        speedup = f"{baseline / elapsed:.1f}x" if baseline else "-"
+        print(f"{engine:<20}{elapsed:>10.3f}{rows:>10}{speedup:>10}")
+
+    if tmp_dir:
+        tmp_dir.cleanup()
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,97 @@
 import pandas as pd
 import utils
-from datetime import datetime
+from datetime import datetime, date
 import io
+import os
+import re
+import zipfile
+from collections import Counter
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+
+# Legacy account/note -> system category rules.
+# scope: 'Asset' (is this an asset account?), 'Account' (which system account),
+#        'Income' / 'Expense' (legacy account name -> main category),
+#        or a main category name (note text -> subcategory).
+# The highest priority match wins; ties go to the rule listed first.
+# Support new legacy names by adding rows here.
+CATEGORY_RULES = [
+    # Asset Accounts (Aligned with common accounting inputs)
+    {'scope': 'Asset', 'keywords': ['現金', '銀行存款', '銀行', '庫存現金'], 'priority': 10},
+
+    {'scope': 'Account', 'keywords': ['現金'], 'main': '現金', 'priority': 30},
+    {'scope': 'Account', 'keywords': ['銀行'], 'main': '銀行', 'priority': 20},
+    # Sometimes Line Pay accumulation is treated as an account
+    {'scope': 'Account', 'keywords': ['Line'], 'main': '銀行', 'priority': 10},
+
+    # Income (INCOME_CATEGORIES keys: 銷貨收入, 健保收入)
+    {'scope': 'Income', 'keywords': ['銷貨'], 'main': '銷貨收入', 'sub': '現金收入', 'priority': 30},
+    {'scope': 'Income', 'keywords': ['健保'], 'main': '健保收入', 'sub': '健保補助', 'priority': 20},
+    {'scope': 'Income', 'keywords': ['收入'], 'main': '銷貨收入', 'sub': '現金收入', 'priority': 10},
+    {'scope': '銷貨收入', 'keywords': ['刷卡', '信用卡'], 'sub': '信用卡收入', 'priority': 20},
+    {'scope': '銷貨收入', 'keywords': ['Line', 'LINE'], 'sub': 'Line Pay收入', 'priority': 10},
+    {'scope': '健保收入', 'keywords': ['補助'], 'sub': '健保補助', 'priority': 30},
+    {'scope': '健保收入', 'keywords': ['一暫'], 'sub': '健保一暫', 'priority': 20},
+    {'scope': '健保收入', 'keywords': ['二暫'], 'sub': '健保二暫', 'priority': 10},
+
+    # Expense fuzzy matches (exact EXPENSE_CATEGORIES names are added below at priority 100)
+    {'scope': 'Expense', 'keywords': ['成本', '進貨'], 'main': '銷貨成本', 'sub': '調劑藥品', 'priority': 50},
+    {'scope': 'Expense', 'keywords': ['薪'], 'main': '薪資支出', 'sub': '月薪', 'priority': 40},
+    {'scope': 'Expense', 'keywords': ['水', '電', '費'], 'main': '水電雜費', 'sub': '其他雜費', 'priority': 30},
+    {'scope': 'Expense', 'keywords': ['稅'], 'main': '稅務支出', 'sub': '營業稅', 'priority': 20},
+    {'scope': 'Expense', 'keywords': ['家庭', '家事'], 'main': '家庭支出', 'sub': '其他', 'priority': 10},
+]
+
+def expense_category_rules():
+    """Rules generated from utils.EXPENSE_CATEGORIES: exact main names, and subcategory names in the note."""
+    rules = []
+    for key, subs in utils.EXPENSE_CATEGORIES.items():
+        if not subs: # "帳戶類別" lists account types, not expenses
+            continue
+        # Found clean match, use first subcategory as default if unknown
+        rules.append({'scope': 'Expense', 'keywords': [key], 'main': key, 'sub': subs[0], 'priority': 100})
+        for sub in subs:
+            rules.append({'scope': key, 'keywords': [sub], 'sub': sub, 'priority': 100})
+    return rules
+
+def compile_rules(rules):
+    """
+    Compile a rule table into {scope: (keyword -> (rank, rule), longest keyword length)}.
+    Matching looks up every substring up to the longest keyword in one dict, so the
+    cost depends on the text length, not on the number of rules.
+    """
+    compiled = {}
+    for order, rule in enumerate(rules):
+        table, max_len = compiled.get(rule['scope'], ({}, 0))
+        rank = (rule['priority'], -order)
+        for kw in rule['keywords']:
+            if kw not in table or rank > table[kw][0]:
+                table[kw] = (rank, rule)
+            max_len = max(max_len, len(kw))
+        compiled[rule['scope']] = (table, max_len)
+    return compiled
+
+_compiled_rules = compile_rules(expense_category_rules() + CATEGORY_RULES)
+
+def reload_rules(rules=None):
+    """Recompile the rule table (e.g. after editing CATEGORY_RULES) and clear memoized results."""
+    global _compiled_rules
+    _compiled_rules = compile_rules(expense_category_rules() + (rules if rules is not None else CATEGORY_RULES))
+    match_rule.cache_clear()
+    _map_category.cache_clear()
+
+@lru_cache(maxsize=8192)
+def match_rule(scope, text):
+    """Return the best rule of `scope` whose keyword occurs in `text`, or None."""
+    table, max_len = _compiled_rules.get(scope, ({}, 0))
+    best = None
+    n = len(text)
+    for i in range(n):
+        for j in range(i + 1, min(n, i + max_len) + 1):
+            hit = table.get(text[i:j])
+            if hit and (best is None or hit[0] > best[0]):
+                best = hit
+    return best[1] if best else None
 
 def identify_transaction_type(row):
     """
@@ -11,16 +101,13 @@ def identify_transaction_type(row):
     debit = str(row.get('借方科目', '')).strip()
     credit = str(row.get('貸方科目', '')).strip()
     
-    # Asset Accounts (Aligned with common accounting inputs)
-    assets = ['現金', '銀行存款', '銀行', '庫存現金']
-    
     # Logic:
     # Debit Asset, Credit Non-Asset -> Income (e.g. Cash Dr, Sales Cr)
     # Debit Non-Asset, Credit Asset -> Expense (e.g. Expense Dr, Cash Cr)
     # Debit Asset, Credit Asset -> Transfer
     
-    debit_is_asset = any(a in debit for a in assets)
-    credit_is_asset = any(a in credit for a in assets)
+    debit_is_asset = match_rule('Asset', debit) is not None
+    credit_is_asset = match_rule('Asset', credit) is not None
     
     if debit_is_asset and not credit_is_asset:
         return 'Income'
@@ -34,189 +121,463 @@ def identify_transaction_type(row):
 
 def normalize_account_name(name):
     """Map legacy account names to system account names."""
-    if '現金' in name:
-        return '現金'
-    if '銀行' in name:
-        return '銀行'
-    if 'Line' in name:
-        # Sometimes Line Pay accumulation is treated as an account
-        return '銀行' 
+    rule = match_rule('Account', str(name).strip())
+    if rule:
+        return rule['main']
     return '現金' # Default fallback
 
+@lru_cache(maxsize=8192)
+def _map_category(category_name, tx_type, note):
+    rule = match_rule(tx_type, category_name)
+    if not rule:
+        return "其他", "其他"
+    main, sub = rule['main'], rule['sub']
+    # Subcategory heuristic from the note
+    sub_rule = match_rule(main, note)
+    if sub_rule:
+        sub = sub_rule['sub']
+    return main, sub
+
 def normalize_category(category_name, tx_type, note):
     """
-    Map legacy category names to system categories.
+    Map legacy category names to system categories using CATEGORY_RULES.
+    Results are memoized per distinct (account, type, note).
     """
-    category_name = str(category_name).strip()
-    note = str(note).strip()
-    
-    if tx_type == 'Income':
-        # INCOME_CATEGORIES keys: 銷貨收入, 健保收入
-        if '銷貨' in category_name or '收入' in category_name:
-            main = "銷貨收入"
-            # Subcategory heuristic
-            if '刷卡' in note or '信用卡' in note:
-                sub = "信用卡收入"
-            elif 'Line' in note or 'LINE' in note:
-                sub = "Line Pay收入"
-            else:
-                sub = "現金收入"
-            return main, sub
-            
-        if '健保' in category_name:
-            main = "健保收入"
-            # Sub heuristic
-            if '補助' in note:
-                sub = "健保補助"
-            elif '一暫' in note:
-                sub = "健保一暫"
-            elif '二暫' in note:
-                sub = "健保二暫"
+    return _map_category(str(category_name).strip(), tx_type, str(note).strip())
+
+# Date parsing
+DATE_SAMPLE_SIZE = 50
+EXCEL_EPOCH = pd.Timestamp('1899-12-30')
+EXCEL_SERIAL_RANGE = (20000, 100000) # 1954-09-24 .. 2173-10-14; smaller numbers are not dates
+ROC_YEAR_OFFSET = 1911 # 民國 114 = 2025
+# 2025/01/05, 2025-1-5, 114/01/05, 民國114年1月5日, 2025-01-05 00:00:00
+_DATE_RE = r'^(?:民國)?\s*(\d{2,4})\s*([/\-.年])\s*(\d{1,2})\s*[/\-.月]\s*(\d{1,2})'
+# 20250105, 1140105
+_COMPACT_DATE_RE = r'^(\d{2,4})(\d{2})(\d{2})$'
+
+def detect_date_format(values, sample_size=DATE_SAMPLE_SIZE):
+    """
+    Guess the dominant date format from a sample of non-empty values.
+    Returns 'datetime', 'serial', 'roc', 'mixed', a strftime pattern such as '%Y/%m/%d', or None.
+    """
+    votes = Counter()
+    for v in values:
+        if sum(votes.values()) >= sample_size:
+            break
+        if v is None or (isinstance(v, float) and pd.isna(v)) or str(v).strip() == '':
+            continue
+        if isinstance(v, (datetime, date)):
+            votes['datetime'] += 1
+        elif isinstance(v, (int, float)) and EXCEL_SERIAL_RANGE[0] <= v < EXCEL_SERIAL_RANGE[1]:
+            votes['serial'] += 1
+        else:
+            text = str(v).strip()
+            m = re.match(_DATE_RE, text) or re.match(_COMPACT_DATE_RE, text)
+            if not m:
+                votes['unknown'] += 1
+            elif len(m.group(1)) <= 3:
+                votes['roc'] += 1
+            elif m.re.pattern == _COMPACT_DATE_RE:
+                votes['%Y%m%d'] += 1
+            elif m.group(2) in '/-.':
+                votes[f'%Y{m.group(2)}%m{m.group(2)}%d'] += 1
             else:
-                sub = "健保補助" # Default
-            return main, sub
-            
-    elif tx_type == 'Expense':
-        # EXPENSE_CATEGORIES keys from utils.py
-        # Direct Match attempt
-        for key, subs in utils.EXPENSE_CATEGORIES.items():
-            if key in category_name:
-                # Found clean match, use first subcategory as default if unknown
-                return key, subs[0] if subs else ""
-        
-        # Fuzzy Match
-        if '成本' in category_name or '進貨' in category_name:
-            return "銷貨成本", "調劑藥品"
-        if '薪' in category_name:
-            return "薪資支出", "月薪"
-        if '水' in category_name or '電' in category_name or '費' in category_name:
-            # Check explicit exclusions or more parsing
-            return "水電雜費", "其他雜費"
-        if '稅' in category_name:
-            return "稅務支出", "營業稅"
-        if '家庭' in category_name or '家事' in category_name:
-            return "家庭支出", "其他"
-            
-    return "其他", "其他"
-
-def process_file(uploaded_file):
+                votes['mixed'] += 1 # e.g. 2025年1月5日, handled by the general path
+
+    if not votes:
+        return None
+    fmt = votes.most_common(1)[0][0]
+    return None if fmt == 'unknown' else fmt
+
+def parse_dates(values):
     """
-    Process the uploaded Excel/CSV file and return a DataFrame of valid transactions.
+    Parse a column of mixed date values in one vectorized pass.
+    Handles datetime cells, Excel serial numbers, Gregorian strings and ROC (民國) dates.
+    Returns (parsed datetime Series, invalid mask) where invalid marks non-empty
+    values that could not be parsed. Unparseable rows are never replaced by a guess.
     """
-    df = pd.DataFrame()
+    s = values if isinstance(values, pd.Series) else pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s, pd.Series(False, index=s.index)
+
+    present = s.notna() & (s.astype(str).str.strip() != '')
+    parsed = pd.Series(pd.NaT, index=s.index, dtype='datetime64[ns]')
+    fmt = detect_date_format(s)
+
+    # 1. Cells that are already dates
+    is_dt = s.map(lambda v: isinstance(v, (datetime, date)))
+    if is_dt.any():
+        parsed[is_dt] = pd.to_datetime(s[is_dt].astype(object), errors='coerce')
+
+    # 2. Excel serial numbers
+    numeric = pd.to_numeric(s.where(~is_dt & present), errors='coerce')
+    is_serial = numeric.ge(EXCEL_SERIAL_RANGE[0]) & numeric.lt(EXCEL_SERIAL_RANGE[1])
+    if is_serial.any():
+        parsed[is_serial] = EXCEL_EPOCH + pd.to_timedelta(numeric[is_serial], unit='D')
+
+    # 3. Text: numbers such as 1140105.0 are read back as integer strings
+    rest = present & ~is_dt & ~is_serial
+    if rest.any():
+        text = s[rest].astype(str).str.strip()
+        integral = numeric[rest].notna() & (numeric[rest] % 1 == 0)
+        text[integral] = numeric[rest][integral].astype('int64').astype(str)
+
+        # Fast path: the detected Gregorian format over the whole text column
+        if fmt and fmt.startswith('%'):
+            fast = pd.to_datetime(text, format=fmt, errors='coerce')
+            parsed[fast.index] = fast
+            text = text[fast.isna()]
+
+        if not text.empty:
+            parts = text.str.extract(_DATE_RE)[[0, 2, 3]]
+            parts.columns = ['year', 'month', 'day']
+            compact = text.str.extract(_COMPACT_DATE_RE)
+            compact.columns = ['year', 'month', 'day']
+            parts = parts.fillna(compact)
+            year = pd.to_numeric(parts['year'], errors='coerce')
+            # Years with fewer than four digits are ROC years
+            parts['year'] = year.where(year >= 1000, year + ROC_YEAR_OFFSET)
+            parts['month'] = pd.to_numeric(parts['month'], errors='coerce')
+            parts['day'] = pd.to_numeric(parts['day'], errors='coerce')
+            general = pd.to_datetime(parts, errors='coerce')
+            parsed[general.index] = general
+
+    invalid = present & parsed.isna()
+    return parsed, invalid
+
+# Batch import settings
+SUPPORTED_EXTENSIONS = ('.xlsx', '.xls', '.csv')
+HEADER_SCAN_ROWS = 10 # Legacy workbooks put a title row (e.g. "日記簿") above the header
+
+def read_csv_file(uploaded_file):
+    """Read a CSV export, trying the encodings used by local accounting software."""
     try:
-        # Check if uploaded_file is a file-like object available for seeking
-        if hasattr(uploaded_file, 'name') and uploaded_file.name.lower().endswith('.csv'):
+        return pd.read_csv(uploaded_file, header=None)
+    except UnicodeDecodeError:
+        uploaded_file.seek(0)
+        return pd.read_csv(uploaded_file, header=None, encoding='cp950')
+    except Exception:
+         # Fallback for other encodings if needed
+         uploaded_file.seek(0)
+         return pd.read_csv(uploaded_file, header=None, encoding='big5')
+
+def _read_excel_calamine(uploaded_file):
+    """Rust-based reader (python-calamine); only cell values are decoded."""
+    return pd.read_excel(uploaded_file, sheet_name=None, header=None, engine='calamine')
+
+def _read_excel_readonly(uploaded_file):
+    """openpyxl in read-only streaming mode: no styles, formulas resolved to cached values."""
+    import openpyxl
+    wb = openpyxl.load_workbook(uploaded_file, read_only=True, data_only=True)
+    try:
+        return {ws.title: pd.DataFrame(list(ws.iter_rows(values_only=True))) for ws in wb.worksheets}
+    finally:
+        wb.close()
+
+def _read_excel_default(uploaded_file):
+    """pandas' default reader (full openpyxl workbook model). Always available."""
+    return pd.read_excel(uploaded_file, sheet_name=None, header=None)
+
+# Excel readers in order of preference. 'auto' tries each and falls back to the next.
+EXCEL_ENGINES = {
+    'calamine': _read_excel_calamine,
+    'openpyxl-readonly': _read_excel_readonly,
+    'default': _read_excel_default,
+}
+DEFAULT_EXCEL_ENGINE = 'auto'
+
+def read_excel_sheets(uploaded_file, engine=DEFAULT_EXCEL_ENGINE):
+    """
+    Read all sheets of a workbook as raw frames (no header applied).
+    engine: 'auto' or one of EXCEL_ENGINES. A failing engine (missing package,
+    unsupported format such as .xls for openpyxl) falls back to the next one.
+    """
+    names = list(EXCEL_ENGINES) if engine == 'auto' else [engine, 'default']
+    last_error = None
+    for name in dict.fromkeys(names):
+        if hasattr(uploaded_file, 'seek'):
+            uploaded_file.seek(0)
+        try:
+            return EXCEL_ENGINES[name](uploaded_file)
+        except Exception as e:
+            last_error = e
+    raise last_error
+
+def read_sheets(uploaded_file, engine=DEFAULT_EXCEL_ENGINE):
+    """
+    Read every sheet of an Excel/CSV file without assuming where the header is.
+    Returns a dict of {sheet_name: raw DataFrame}.
+    """
+    name = getattr(uploaded_file, 'name', '')
+    if name.lower().endswith('.csv'):
+        return {'CSV': read_csv_file(uploaded_file)}
+    return read_excel_sheets(uploaded_file, engine)
+
+def apply_header(raw):
+    """
+    Promote the first row that looks like a header (contains '日期') to column names.
+    Returns (df, header_row) where header_row is the 0-based row index used, or None.
+    """
+    for i in range(min(HEADER_SCAN_ROWS, len(raw))):
+        values = [str(v).strip() for v in raw.iloc[i].tolist()]
+        if any('日期' in v for v in values):
+            df = raw.iloc[i + 1:].copy()
+            df.columns = values
+            return df, i
+    # No header found: keep positional columns, first row is treated as header like before
+    df = raw.iloc[1:].copy()
+    df.columns = [str(c).strip() for c in raw.iloc[0].tolist()] if len(raw) else raw.columns
+    return df, 0
+
+def standardize_columns(df):
+    """
+    Map legacy column names to the standard ledger headers.
+    Returns a list of missing required columns (empty when the frame is usable).
+    """
+    # Expected Headers: 日期, 借方科目, 借方金額, 貸方科目, 貸方金額, 說明 (or similar)
+    df.columns = [str(c).strip() for c in df.columns]
+
+    col_map = {}
+    # Dynamic Mapping
+    for c in df.columns:
+        if '日期' in c: col_map[c] = '日期'
+        elif '借方科目' in c or ('借方' in c and '金額' not in c): col_map[c] = '借方科目'
+        elif '借方金額' in c: col_map[c] = '借方金額'
+        elif '貸方科目' in c or ('貸方' in c and '金額' not in c): col_map[c] = '貸方科目'
+        elif '貸方金額' in c: col_map[c] = '貸方金額'
+        elif '說明' in c or '摘要' in c: col_map[c] = '說明'
+
+    df.rename(columns=col_map, inplace=True)
+
+    # Validation checks
+    required = ['日期', '借方科目', '借方金額', '貸方科目', '貸方金額']
+    missing = [req for req in required if req not in df.columns]
+
+    # If headers are missing, try positional if 6 columns exist
+    if missing and len(df.columns) >= 6:
+        # Assume standard format: Date, DrAcct, DrAmt, CrAcct, CrAmt, Note
+        df.columns = ['日期', '借方科目', '借方金額', '貸方科目', '貸方金額', '說明'] + list(df.columns[6:])
+        missing = []
+
+    return missing
+
+def parse_transactions(df, first_row=2):
+    """
+    Convert a standardized ledger frame into system transactions.
+    `first_row` is the spreadsheet row number of the first data row, used for error reports.
+    Returns (transactions DataFrame, skipped) where skipped is a list of (row number, reason).
+    """
+    transactions = []
+    skipped = []
+
+    dates, invalid_dates = parse_dates(df['日期'])
+
+    for pos, (index, row) in enumerate(df.iterrows()):
+        row_no = first_row + pos
+        raw_date = row.get('日期')
+        if pd.isna(raw_date) or str(raw_date).strip() == '':
+            continue # blank date cell: subtotal or spacer row
+
+        if invalid_dates[index]:
+            skipped.append((row_no, f"日期無法辨識: {raw_date}"))
+            continue
+
+        tx_type = identify_transaction_type(row)
+
+        if not tx_type:
+            skipped.append((row_no, "無法判斷收支類型"))
+            continue
+
+        note = str(row.get('說明', ''))
+        date_obj = dates[index]
+        if pd.isna(date_obj):
+            skipped.append((row_no, f"日期無法辨識: {raw_date}"))
+            continue
+
+        amount = 0
+        account = ""
+        main_cat = ""
+        sub_cat = ""
+
+        if tx_type == 'Income':
+            account = normalize_account_name(row['借方科目'])
+            try:
+                amount = float(row['借方金額']) if not pd.isna(row['借方金額']) else 0
+            except: amount = 0
+            cat_source = row.get('貸方科目', '')
+            main_cat, sub_cat = normalize_category(cat_source, 'Income', note)
+
+        elif tx_type == 'Expense':
+            account = normalize_account_name(row.get('貸方科目', ''))
             try:
-                df = pd.read_csv(uploaded_file)
-            except UnicodeDecodeError:
-                uploaded_file.seek(0)
-                df = pd.read_csv(uploaded_file, encoding='cp950')
-            except Exception:
-                 # Fallback for other encodings if needed
-                 uploaded_file.seek(0)
-                 df = pd.read_csv(uploaded_file, encoding='big5') 
+                amount = float(row['貸方金額']) if not pd.isna(row['貸方金額']) else 0
+            except: amount = 0
+            cat_source = row.get('借方科目', '')
+            main_cat, sub_cat = normalize_category(cat_source, 'Expense', note)
+
+        elif tx_type == 'Transfer':
+            skipped.append((row_no, "資金調度 (不匯入)"))
+            continue
+
+        if amount > 0:
+            transactions.append({
+                'date': date_obj,
+                'type': '收入' if tx_type == 'Income' else '支出',
+                'category': main_cat,
+                'subcategory': sub_cat,
+                'account': account,
+                'amount': amount,
+                'note': note
+            })
         else:
-            df = pd.read_excel(uploaded_file)
-            
-        # Standardize columns
-        # Expected Headers: 日期, 借方科目, 借方金額, 貸方科目, 貸方金額, 說明 (or similar)
-        
-        df.columns = [str(c).strip() for c in df.columns]
-        
-        col_map = {}
-        # Dynamic Mapping
-        for c in df.columns:
-            if '日期' in c: col_map[c] = '日期'
-            elif '借方科目' in c or ('借方' in c and '金額' not in c): col_map[c] = '借方科目'
-            elif '借方金額' in c: col_map[c] = '借方金額'
-            elif '貸方科目' in c or ('貸方' in c and '金額' not in c): col_map[c] = '貸方科目'
-            elif '貸方金額' in c: col_map[c] = '貸方金額'
-            elif '說明' in c or '摘要' in c: col_map[c] = '說明'
-            
-        df = df.rename(columns=col_map)
-        
-        # Validation checks
-        required = ['日期', '借方科目', '借方金額', '貸方科目', '貸方金額']
-        missing = [req for req in required if req not in df.columns]
-        
-        # If headers are missing, try positional if 6 columns exist
-        if missing and len(df.columns) >= 6:
-            # Assume standard format: Date, DrAcct, DrAmt, CrAcct, CrAmt, Note
-            df.columns.values[0] = '日期'
-            df.columns.values[1] = '借方科目'
-            df.columns.values[2] = '借方金額'
-            df.columns.values[3] = '貸方科目'
-            df.columns.values[4] = '貸方金額'
-            df.columns.values[5] = '說明'
-            missing = []
-            
-        if missing:
-            return f"缺少必要欄位: {', '.join(missing)}"
-        
-        transactions = []
-        
-        for index, row in df.iterrows():
-            if pd.isna(row.get('日期')): continue
-            
-            tx_type = identify_transaction_type(row)
-            
-            if not tx_type:
-                continue
-                
-            note = str(row.get('說明', ''))
-            date_val = row['日期']
-            
-            # Date Parsing
-            if isinstance(date_val, str):
-                try:
-                    date_obj = datetime.strptime(date_val, '%Y/%m/%d')
-                except:
-                    try:
-                        date_obj = datetime.strptime(date_val, '%Y-%m-%d')
-                    except:
-                        # Continue or use today? Use today with warning? 
-                        # Better to skip or flag. Using today as safe fallback for now.
-                        date_obj = datetime.now()
-            else:
-                date_obj = date_val
-                
-            amount = 0
-            account = ""
-            main_cat = ""
-            sub_cat = ""
-            
-            if tx_type == 'Income':
-                account = normalize_account_name(row['借方科目'])
-                try:
-                    amount = float(row['借方金額']) if not pd.isna(row['借方金額']) else 0
-                except: amount = 0
-                cat_source = row.get('貸方科目', '')
-                main_cat, sub_cat = normalize_category(cat_source, 'Income', note)
-                
-            elif tx_type == 'Expense':
-                account = normalize_account_name(row.get('貸方科目', ''))
-                try:
-                    amount = float(row['貸方金額']) if not pd.isna(row['貸方金額']) else 0
-                except: amount = 0
-                cat_source = row.get('借方科目', '')
-                main_cat, sub_cat = normalize_category(cat_source, 'Expense', note)
-            
-            elif tx_type == 'Transfer':
-                continue
-                
-            if amount > 0:
-                transactions.append({
-                    'date': date_obj,
-                    'type': '收入' if tx_type == 'Income' else '支出',
-                    'category': main_cat,
-                    'subcategory': sub_cat,
-                    'account': account,
-                    'amount': amount,
-                    'note': note
-                })
-                
-        return pd.DataFrame(transactions)
-        
+            skipped.append((row_no, "金額為 0 或無法辨識"))
+
+    return pd.DataFrame(transactions), skipped
+
+def parse_sheet(raw):
+    """
+    Parse one raw sheet (no header applied).
+    Returns (transactions DataFrame, skipped rows) or an error message string.
+    """
+    df, header_row = apply_header(raw)
+    missing = standardize_columns(df)
+    if missing:
+        return f"缺少必要欄位: {', '.join(missing)}"
+    # Spreadsheet rows are 1-based and the header occupies header_row + 1
+    return parse_transactions(df, first_row=header_row + 2)
+
+def process_file(uploaded_file, engine=DEFAULT_EXCEL_ENGINE):
+    """
+    Process the uploaded Excel/CSV file and return a DataFrame of valid transactions.
+    Only the first sheet is used; see process_batch for multi-sheet workbooks.
+    """
+    try:
+        sheets = read_sheets(uploaded_file, engine)
+        raw = next(iter(sheets.values()))
+        result = parse_sheet(raw)
+        if isinstance(result, str):
+            return result
+        return result[0]
+
     except Exception as e:
         return str(e)
+
+def _parse_workbook(job):
+    """
+    Parse every sheet of one workbook. Runs inside a worker process, so the input
+    is a plain (name, bytes, engine) tuple and the output only contains picklable values.
+    """
+    name, content, engine = job
+    report = []
+    frames = []
+
+    buffer = io.BytesIO(content)
+    buffer.name = name
+    try:
+        sheets = read_sheets(buffer, engine)
+    except Exception as e:
+        return frames, [{'file': name, 'sheet': '', 'status': '讀取失敗', 'rows': 0, 'skipped_rows': [], 'error': str(e)}]
+
+    for sheet_name, raw in sheets.items():
+        entry = {'file': name, 'sheet': sheet_name, 'status': '成功', 'rows': 0, 'skipped_rows': [], 'error': ''}
+        try:
+            result = parse_sheet(raw) if not raw.empty else (pd.DataFrame(), [])
+            if isinstance(result, str):
+                entry['status'] = '略過'
+                entry['error'] = result
+            else:
+                df, skipped = result
+                entry['rows'] = len(df)
+                entry['skipped_rows'] = skipped
+                if df.empty:
+                    entry['status'] = '無資料'
+                else:
+                    df['source'] = f"{name} / {sheet_name}"
+                    frames.append(df)
+        except Exception as e:
+            entry['status'] = '解析失敗'
+            entry['error'] = str(e)
+        report.append(entry)
+
+    return frames, report
+
+def collect_sources(sources):
+    """
+    Normalize batch input into a list of (name, bytes).
+    `sources` may be a folder path, a zip path, or a list of uploaded files / paths
+    (uploaded zips are expanded too).
+    """
+    if isinstance(sources, (str, os.PathLike)):
+        path = str(sources)
+        if os.path.isdir(path):
+            sources = [os.path.join(root, f) for root, _, files in os.walk(path) for f in sorted(files)]
+        else:
+            sources = [path]
+
+    jobs = []
+    for src in sources:
+        if isinstance(src, (str, os.PathLike)):
+            name = os.path.basename(str(src))
+            with open(src, 'rb') as f:
+                content = f.read()
+        else:
+            name = getattr(src, 'name', 'upload')
+            src.seek(0)
+            content = src.read()
+
+        if name.lower().endswith('.zip'):
+            with zipfile.ZipFile(io.BytesIO(content)) as zf:
+                for info in zf.infolist():
+                    if not info.is_dir() and info.filename.lower().endswith(SUPPORTED_EXTENSIONS):
+                        jobs.append((f"{name}/{info.filename}", zf.read(info)))
+        elif name.lower().endswith(SUPPORTED_EXTENSIONS):
+            # Skip Excel lock files such as "~$11401.xlsx"
+            if not name.startswith('~$'):
+                jobs.append((name, content))
+
+    return jobs
+
+def sources_key(sources):
+    """
+    Cheap identity of a batch input, for caching its parse result: uploaded files
+    by (name, size, file_id), paths by (path, size, mtime) of every file.
+    """
+    if isinstance(sources, (str, os.PathLike)):
+        path = str(sources)
+        paths = [os.path.join(root, f) for root, _, files in os.walk(path) for f in sorted(files)] if os.path.isdir(path) else [path]
+        return tuple((p, os.path.getsize(p), os.path.getmtime(p)) for p in paths if os.path.exists(p))
+    return tuple((getattr(f, 'name', ''), getattr(f, 'size', None), getattr(f, 'file_id', id(f))) for f in sources)
+
+def process_batch(sources, max_workers=None, engine=DEFAULT_EXCEL_ENGINE):
+    """
+    Parse many workbooks (every sheet of each) in a process pool.
+    Returns (transactions DataFrame sorted by date, report list of per-sheet dicts).
+    """
+    jobs = [(name, content, engine) for name, content in collect_sources(sources)]
+    if not jobs:
+        return pd.DataFrame(), []
+
+    if len(jobs) == 1:
+        results = [_parse_workbook(jobs[0])]
+    else:
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                results = list(pool.map(_parse_workbook, jobs))
+        except Exception as e:
+            # e.g. process pool unavailable in this environment; parse in-process instead
+            print(f"Process pool failed, parsing sequentially: {e}")
+            results = [_parse_workbook(job) for job in jobs]
+
+    frames = []
+    report = []
+    for file_frames, file_report in results:
+        frames.extend(file_frames)
+        report.extend(file_report)
+
+    if not frames:
+        return pd.DataFrame(), report
+
+    df = pd.concat(frames, ignore_index=True)
+    df['date'] = pd.to_datetime(df['date'])
+    df = df.sort_values(by='date', kind='stable').reset_index(drop=True)
+    return df, report
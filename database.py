@@ -1,16 +1,67 @@
 import pandas as pd
 from datetime import datetime
 import gspread
+import requests
+from gspread.utils import numericise_all, rowcol_to_a1
 from oauth2client.service_account import ServiceAccountCredentials
 import streamlit as st
 import toml
 import os
+import queue
 import time
+import hashlib
+import threading
+import unicodedata
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+import utils
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+try:
+    import fcntl
+except ImportError: # Windows: single-process only
+    fcntl = None
 
 # Constants
 SHEET_URL_KEY = "spreadsheet"
 SECRETS_PATH = ".streamlit/secrets.toml"
+LOCAL_DIR = "local_data" # Server-side job state, snapshots and generated files
+
+# Worksheet headers, in column order
+TABLE_HEADERS = {
+    "transactions": ["id", "date", "type", "category", "subcategory", "account", "amount", "original_amount", "note", "nhi_month", "idem_key", "deleted", "deleted_at", "deleted_by"],
+    "monthly_closings": ["month", "bank_actual", "cash_actual", "bank_calc", "cash_calc", "note", "closed_at"],
+    "nhi_records": ["month", "total_fee", "deduction", "rejection", "chronic_count", "general_count", "drug_fee", "updated_at"],
+}
+# Bookkeeping columns kept in the sheet (hidden there) but not returned by reads
+HIDDEN_COLUMNS = {"transactions": ["idem_key", "deleted", "deleted_at", "deleted_by"]}
+# Columns returned by get_transactions
+TRANSACTION_COLUMNS = [c for c in TABLE_HEADERS["transactions"] if c not in HIDDEN_COLUMNS["transactions"]]
+
+# Process-wide cache of decoded worksheets, shared by every session.
+# Writes made through this module update it in place; other changes show up after CACHE_TTL
+# (rows edited in place on the sheet: after FULL_SYNC_SECONDS).
+CACHE_TTL = 300 # seconds
+_cache = {}
+_cache_lock = threading.RLock()
+
+# Data versions: bumped whenever a table's cached data changes. Prefixed with a
+# per-process token so versions from an earlier run never match.
+# Cached frames are shared by every session of the process and never modified in
+# place (writes swap in a new frame), so the version doubles as a change
+# notification: sessions poll current_version() and redraw only on a change.
+_PROCESS_TOKEN = uuid.uuid4().hex[:8]
+_data_versions = {}
+
+# Multi-worker deployment (deploy/pharmacy@.service): PHARMACY_WORKERS processes
+# share the Sheets quota and, through the on-disk snapshots, one cache. A worker
+# adopts a snapshot another worker published, only one worker at a time fetches
+# a table (under a file lock), and local writes are applied to the latest
+# snapshot and published again. Versions then derive from the snapshot, so they
+# agree across workers.
+WORKERS = max(1, int(os.environ.get("PHARMACY_WORKERS", "1")))
+SHARED_CACHE = WORKERS > 1
 
 # Define a standard retry strategy for API calls
 # Wait 2^x * 1 second between retries, up to 10 seconds, max 5 attempts
@@ -20,6 +71,25 @@ api_retry = retry(
     retry=retry_if_exception_type((gspread.exceptions.APIError, gspread.exceptions.GSpreadException))
 )
 
+# Google Sheets allows 60 requests per minute per user; keep some headroom
+# for interactive sessions when bulk jobs run.
+REQUESTS_PER_MINUTE = 50 // WORKERS
+_request_times = deque()
+_throttle_lock = threading.Lock()
+
+def throttle():
+    """Block until one more Sheets request fits in the per-minute quota (shared by all threads)."""
+    while True:
+        with _throttle_lock:
+            now = time.time()
+            while _request_times and now - _request_times[0] >= 60:
+                _request_times.popleft()
+            if len(_request_times) < REQUESTS_PER_MINUTE:
+                _request_times.append(now)
+                return
+            wait = 60 - (now - _request_times[0])
+        time.sleep(wait)
+
 def get_config():
     """
     Retrieve configuration from Streamlit secrets or local Config file.
@@ -96,10 +166,7 @@ def init_db():
     # Wrap critical reads in try-except block inside init or rely on global retry if refactored.
     # But for init_db, since it's cached, we want it to succeed eventually.
     
-    curr_headers_trans = ws_trans.row_values(1)
-    req_headers_trans = ["id", "date", "type", "category", "subcategory", "account", "amount", "original_amount", "note", "nhi_month"]
-    if not curr_headers_trans:
-        ws_trans.append_row(req_headers_trans)
+    _ensure_headers(ws_trans, "transactions")
 
     # 2. Monthly Closings
     try:
@@ -107,10 +174,7 @@ def init_db():
     except gspread.WorksheetNotFound:
         ws_closing = sh.add_worksheet("monthly_closings", rows=100, cols=10)
         
-    curr_headers_closing = ws_closing.row_values(1)
-    req_headers_closing = ["month", "bank_actual", "cash_actual", "bank_calc", "cash_calc", "note", "closed_at"]
-    if not curr_headers_closing:
-        ws_closing.append_row(req_headers_closing)
+    _ensure_headers(ws_closing, "monthly_closings")
 
     # 3. NHI Records
     try:
@@ -118,27 +182,553 @@ def init_db():
     except gspread.WorksheetNotFound:
         ws_nhi = sh.add_worksheet("nhi_records", rows=100, cols=10)
         
-    curr_headers_nhi = ws_nhi.row_values(1)
-    req_headers_nhi = ["month", "total_fee", "deduction", "rejection", "chronic_count", "general_count", "drug_fee", "updated_at"]
-    if not curr_headers_nhi:
-        ws_nhi.append_row(req_headers_nhi)
+    _ensure_headers(ws_nhi, "nhi_records")
 
+def _ensure_headers(ws, name):
+    """
+    Write the header row of an empty sheet, or add columns introduced since the
+    sheet was created (existing rows read them as blank). New bookkeeping
+    columns are hidden in the sheet.
+    """
+    current = ws.row_values(1)
+    required = TABLE_HEADERS[name]
+    if len(current) >= len(required) or required[:len(current)] != current:
+        return # up to date (or a layout this code did not create)
+    if not current:
+        ws.append_row(required)
+    else:
+        if ws.col_count < len(required):
+            ws.add_cols(len(required) - ws.col_count)
+        ws.update(range_name=f"A1:{rowcol_to_a1(1, len(required))}", values=[required])
+    for col in HIDDEN_COLUMNS.get(name, []):
+        i = required.index(col)
+        if i >= len(current):
+            ws.hide_columns(i, i + 1)
 
-def add_transaction(date, type, category, subcategory, account, amount, original_amount=None, note="", nhi_month=None):
-    """Add a new transaction to the Google Sheet."""
-    ws = get_worksheet("transactions")
-    
-    # Generate ID: Simple Max ID + 1 strategy
-    # Read all IDs first.
+def _decode_transactions(data):
+    """Build a typed transactions DataFrame from sheet records."""
+    df = pd.DataFrame(data)
+
+    if df.empty:
+         return df
+
+    # Convert date column to datetime
+    df['date'] = pd.to_datetime(df['date'])
+
+    # Enforce numeric types for amount columns
+    # Coerce errors (non-numeric) to NaN, then fill with 0
+    if 'amount' in df.columns:
+        df['amount'] = pd.to_numeric(df['amount'], errors='coerce').fillna(0.0)
+    if 'original_amount' in df.columns:
+        df['original_amount'] = pd.to_numeric(df['original_amount'], errors='coerce').fillna(0.0)
+    if 'deleted' in df.columns:
+        df['deleted'] = pd.to_numeric(df['deleted'], errors='coerce').fillna(0).astype(int)
+    return df
+
+def _decode_numeric(columns):
+    """Decoder for tables that only need numeric columns coerced."""
+    def decode(data):
+        df = pd.DataFrame(data)
+        for c in columns:
+            if c in df.columns:
+                df[c] = pd.to_numeric(df[c], errors='coerce').fillna(0.0)
+        return df
+    return decode
+
+_DECODERS = {
+    "transactions": _decode_transactions,
+    "monthly_closings": _decode_numeric(['bank_actual', 'cash_actual', 'bank_calc', 'cash_calc']),
+    "nhi_records": _decode_numeric(['total_fee', 'deduction', 'rejection', 'drug_fee', 'chronic_count', 'general_count']),
+}
+
+def decode_values(name, header, rows):
+    """Decode raw sheet rows (as from get_all_values) the same way as get_all_records would."""
+    records = [dict(zip(header, numericise_all(list(row) + [""] * (len(header) - len(row))))) for row in rows]
+    if not records:
+        return pd.DataFrame(columns=header)
+    return _DECODERS[name](records)
+
+def arrow_safe(df):
+    """Copy of df where mixed number/text object columns become text (Arrow needs one type per column)."""
+    out = df.reset_index(drop=True)
+    for c in out.columns:
+        if out[c].dtype == object:
+            out[c] = out[c].astype(str)
+    return out
+
+# On-disk copy of the decoded frames (Arrow IPC / Feather), rewritten after every sync.
+# After a restart it is memory-mapped and served while a refresh runs in the background.
+SNAPSHOT_DIR = os.path.join(LOCAL_DIR, "snapshot")
+_snapshot_used = set() # tables whose snapshot must not be served (already used, or invalidated)
+_refreshing = set()
+
+# The delta sync only sees appended rows. Cells edited in place on the sheet
+# (an amount corrected by hand, a tombstone cleared to undo a delete) show up
+# with the next full fetch, at most FULL_SYNC_SECONDS after the previous one.
+# A process starts with no full fetch, so a snapshot is always re-read in full.
+FULL_SYNC_SECONDS = 900
+_full_synced_at = {}
+
+def _snapshot_path(name):
+    return os.path.join(SNAPSHOT_DIR, f"{name}.arrow")
+
+def _write_snapshot(name, df):
+    """Write the snapshot atomically. Returns its stamp (mtime_ns), or None on failure."""
+    try:
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        out = arrow_safe(df)
+        tmp = f"{_snapshot_path(name)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        out.to_feather(tmp, compression="uncompressed") # uncompressed so it can be memory-mapped
+        os.replace(tmp, _snapshot_path(name))
+        return _stamp(_snapshot_path(name))
+    except Exception as e:
+        print(f"Could not write snapshot for {name}: {e}")
+        return None
+
+def _read_snapshot(name):
+    path = _snapshot_path(name)
+    if not os.path.exists(path):
+        return None
+    try:
+        import pyarrow.feather as feather
+        return feather.read_table(path, memory_map=True).to_pandas()
+    except Exception as e:
+        print(f"Could not read snapshot for {name}: {e}")
+        return None
+
+def _stamp(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+def _synced_path(name):
+    return _snapshot_path(name) + ".synced"
+
+def _shared_synced_at(name):
+    """Time any worker last confirmed the snapshot against the sheet."""
+    stamps = [s for s in (_stamp(_snapshot_path(name)), _stamp(_synced_path(name))) if s]
+    return max(stamps) / 1e9 if stamps else 0.0
+
+@contextmanager
+def _shared_lock(name):
+    """Shared cache: serialize fetches and writes of `name` across workers (no-op otherwise)."""
+    if not SHARED_CACHE or fcntl is None:
+        yield
+        return
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    with open(_snapshot_path(name) + ".lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def _adopt_snapshot(name):
+    """Shared cache: replace the cached entry with a snapshot another worker published."""
+    stamp = _stamp(_snapshot_path(name))
+    with _cache_lock:
+        entry = _cache.get(name)
+        if stamp is None or (entry is not None and entry.get("shared") == stamp):
+            return entry
+    df = _read_snapshot(name)
+    if df is None:
+        return entry
+    with _cache_lock:
+        entry = _new_entry(df, _shared_synced_at(name))
+        entry["shared"] = stamp
+        _cache[name] = entry
+        _bump_version(name)
+    return entry
+
+def _publish(name, entry):
+    """Shared cache: write a locally changed entry as the snapshot other workers adopt."""
+    if SHARED_CACHE:
+        entry["shared"] = _write_snapshot(name, entry["df"])
+
+def _bump_version(name):
+    with _cache_lock:
+        _data_versions[name] = _data_versions.get(name, 0) + 1
+
+def current_version(name):
+    """Version token of `name` without loading the table (cheap enough to poll)."""
+    if SHARED_CACHE:
+        entry = _adopt_snapshot(name)
+        return f"s{entry.get('shared') if entry else None}"
+    return f"{_PROCESS_TOKEN}-{_data_versions.get(name, 0)}"
+
+def data_version(name):
+    """Opaque token that changes whenever the cached data of `name` changes."""
+    _load_table(name)
+    return current_version(name)
+
+def _new_entry(df, loaded_at):
+    return {"df": df, "loaded_at": loaded_at, "version": 0, "fingerprints": None, "idem": None, "shared": None}
+
+def _fetch_table(name, previous=None, full=False):
+    """
+    Download and decode a worksheet. For transactions, when the cached ids are a
+    prefix of the sheet's id column, only the rows added since are fetched
+    (unless full). A full fetch that matches `previous` returns `previous`.
+    """
+    ws = get_worksheet(name)
+    if (name == "transactions" and not full and previous is not None and not previous.empty
+            and set(TABLE_HEADERS[name]) <= set(previous.columns)):
+        sheet_ids = ws.col_values(1)[1:] # Skip header
+        cached_ids = previous['id'].astype(str).tolist()
+        n = len(cached_ids)
+        if sheet_ids[:n] == cached_ids:
+            if len(sheet_ids) == n:
+                return previous
+            header = list(previous.columns)
+            end = rowcol_to_a1(len(sheet_ids) + 1, len(header))
+            values = ws.get(f"A{n + 2}:{end}")
+            return pd.concat([previous, decode_values(name, header, values)], ignore_index=True)
+    df = _DECODERS[name](ws.get_all_records()) # Returns list of dicts
+    if previous is not None and list(df.columns) == list(previous.columns) and arrow_safe(df).equals(arrow_safe(previous)):
+        return previous
+    return df
+
+def _sync_table(name, background=False, force=False):
+    """
+    Fetch a worksheet into the cache and rewrite its snapshot.
+    A background sync is discarded if the cache changed while it was downloading,
+    so it never overwrites rows written locally in the meantime.
+    With the shared cache, a snapshot another worker synced within CACHE_TTL is
+    adopted instead of fetching (unless force).
+    """
+    with _shared_lock(name):
+        if SHARED_CACHE and not force:
+            shared = _adopt_snapshot(name)
+            synced_at = _shared_synced_at(name)
+            if shared is not None and time.time() - synced_at <= CACHE_TTL:
+                with _cache_lock:
+                    shared["loaded_at"] = max(shared["loaded_at"], synced_at)
+                return shared
+
+        with _cache_lock:
+            current = _cache.get(name)
+            version = current["version"] if current else None
+        previous = current["df"] if current is not None else None
+
+        full = previous is None or force or time.time() - _full_synced_at.get(name, 0.0) > FULL_SYNC_SECONDS
+        df = _fetch_table(name, previous, full=full)
+        if full:
+            _full_synced_at[name] = time.time()
+
+        with _cache_lock:
+            latest = _cache.get(name)
+            if background and (latest is not current or (latest and latest["version"] != version)):
+                return latest
+            entry = _new_entry(df, time.time())
+            unchanged = current is not None and df is previous
+            if unchanged:
+                # Nothing new on the sheet: keep derived data such as the fingerprint index
+                entry["fingerprints"] = current["fingerprints"]
+                entry["idem"] = current["idem"]
+                entry["shared"] = current["shared"]
+            else:
+                _bump_version(name)
+            _cache[name] = entry
+        if not SHARED_CACHE:
+            _write_snapshot(name, df)
+        else:
+            if not unchanged or entry["shared"] is None:
+                entry["shared"] = _write_snapshot(name, df)
+            with open(_synced_path(name), "w"):
+                pass # mtime = last sync, without changing the snapshot's version
+    return entry
+
+def _refresh_in_background(name):
+    with _cache_lock:
+        if name in _refreshing:
+            return
+        _refreshing.add(name)
+
+    def run():
+        try:
+            _sync_table(name, background=True)
+        except Exception as e:
+            print(f"Background refresh of {name} failed: {e}")
+        finally:
+            with _cache_lock:
+                _refreshing.discard(name)
+
+    threading.Thread(target=run, name=f"refresh-{name}", daemon=True).start()
+
+def sync_table(name):
+    """
+    Delta-sync one worksheet into the cache now (scheduled jobs), with a full
+    re-read every FULL_SYNC_SECONDS. Returns the cached row count.
+    """
+    return len(_sync_table(name, background=True)["df"])
+
+def _load_table(name, force=False):
+    """
+    Return the cache entry for a worksheet.
+    - First use in this process: serve the on-disk snapshot and refresh in the background.
+    - Stale entry: serve it and refresh in the background.
+    - Missing entry or force: fetch synchronously.
+    With the shared cache, a snapshot published by another worker replaces the entry first.
+    """
+    if SHARED_CACHE and not force:
+        _adopt_snapshot(name)
+    with _cache_lock:
+        entry = _cache.get(name)
+        if entry is not None and not force:
+            if time.time() - entry["loaded_at"] > CACHE_TTL:
+                _refresh_in_background(name)
+            return entry
+        if not force and not SHARED_CACHE and name not in _snapshot_used:
+            _snapshot_used.add(name)
+            df = _read_snapshot(name)
+            if df is not None:
+                entry = _new_entry(df, 0.0) # loaded_at 0: always stale
+                _cache[name] = entry
+                _bump_version(name)
+                _refresh_in_background(name)
+                return entry
+    return _sync_table(name, force=force)
+
+# Cold tier: fully closed years moved out of the live sheet by archive.py
+ARCHIVE_DIR = os.path.join(LOCAL_DIR, "archive")
+_archive_cache = {} # year -> (file mtime, DataFrame)
+_archive_fingerprints = {} # year -> (archived DataFrame it was built from, fingerprint index)
+
+def archive_path(year):
+    return os.path.join(ARCHIVE_DIR, f"transactions_{year}.parquet")
+
+def archived_years():
+    """Years that have an archive file, ascending."""
+    if not os.path.isdir(ARCHIVE_DIR):
+        return []
+    years = []
+    for f in os.listdir(ARCHIVE_DIR):
+        if f.startswith("transactions_") and f.endswith(".parquet"):
+            years.append(int(f[len("transactions_"):-len(".parquet")]))
+    return sorted(years)
+
+def load_archived_year(year):
+    """Archived transactions of one year (cached until the file changes)."""
+    path = archive_path(year)
+    mtime = os.path.getmtime(path)
+    cached = _archive_cache.get(year)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, pd.read_parquet(path))
+        _archive_cache[year] = cached
+    return cached[1]
+
+def _archived_transactions(start_date=None, end_date=None):
+    """Archived rows for the years a date range touches, or None."""
+    years = [y for y in archived_years()
+             if (not start_date or y >= start_date.year) and (not end_date or y <= end_date.year)]
+    if not years:
+        return None
+    return pd.concat([load_archived_year(y) for y in years], ignore_index=True)
+
+def _load_transactions(force=False):
+    """Return the cached transactions entry."""
+    return _load_table("transactions", force)
+
+def _fingerprint_index():
+    """Fingerprint index of the cached transactions, built on first use."""
+    entry = _load_transactions()
+    with _cache_lock:
+        if entry["fingerprints"] is None:
+            entry["fingerprints"] = build_fingerprint_index(drop_deleted(entry["df"]))
+        return entry["fingerprints"]
+
+def _idem_index():
+    """idem_key -> transaction id for the cached transactions, built on first use."""
+    entry = _load_transactions()
+    with _cache_lock:
+        if entry["idem"] is None:
+            df = entry["df"]
+            if 'idem_key' in df.columns:
+                keys = df['idem_key'].fillna("").astype(str)
+                entry["idem"] = dict(zip(keys[keys != ""], df.loc[keys != "", 'id']))
+            else:
+                entry["idem"] = {}
+        return entry["idem"]
+
+def _cache_append_transactions(rows):
+    """Add freshly written sheet rows to the cached frame and fingerprint index."""
+    with _shared_lock("transactions"):
+        if SHARED_CACHE:
+            _adopt_snapshot("transactions")
+        with _cache_lock:
+            entry = _cache.get("transactions")
+            if entry is None:
+                return
+            headers = TABLE_HEADERS["transactions"]
+            new_df = _decode_transactions([dict(zip(headers, r)) for r in rows])
+            entry["df"] = pd.concat([entry["df"], new_df], ignore_index=True) if not entry["df"].empty else new_df
+            entry["version"] += 1
+            _bump_version("transactions")
+            if entry["fingerprints"] is not None:
+                for fp in fingerprint_frame(new_df):
+                    entry["fingerprints"][fp] = entry["fingerprints"].get(fp, 0) + 1
+            if entry["idem"] is not None:
+                key_col = headers.index("idem_key")
+                entry["idem"].update({r[key_col]: r[0] for r in rows if r[key_col]})
+        _publish("transactions", entry)
+
+def _cache_mark_deleted(ids, deleted_at, deleted_by):
+    """Flag tombstoned rows in the cached frame; rows keep their place, so row order still matches the sheet."""
+    with _shared_lock("transactions"):
+        if SHARED_CACHE:
+            _adopt_snapshot("transactions")
+        with _cache_lock:
+            entry = _cache.get("transactions")
+            if entry is None:
+                return
+            ids = {str(i) for i in ids}
+            df = entry["df"].copy()
+            match = df['id'].astype(str).isin(ids)
+            for c, value in (("deleted", 1), ("deleted_at", deleted_at), ("deleted_by", deleted_by)):
+                if c not in df.columns:
+                    df[c] = 0 if c == "deleted" else ""
+                df.loc[match, c] = value
+            entry["df"] = df
+            entry["version"] += 1
+            entry["fingerprints"] = None
+            entry["idem"] = None
+            _bump_version("transactions")
+        _publish("transactions", entry)
+
+def _cache_update_transactions(rows):
+    """Apply sheet rows rewritten in place (matched by id) to the cached frame."""
+    with _shared_lock("transactions"):
+        if SHARED_CACHE:
+            _adopt_snapshot("transactions")
+        with _cache_lock:
+            entry = _cache.get("transactions")
+            if entry is None:
+                return
+            headers = TABLE_HEADERS["transactions"]
+            new_df = _decode_transactions([dict(zip(headers, r)) for r in rows]).set_index('id')
+            df = entry["df"].copy()
+            match = df['id'].isin(new_df.index)
+            for c in new_df.columns:
+                if c not in df.columns:
+                    df[c] = ""
+                df.loc[match, c] = df.loc[match, 'id'].map(new_df[c])
+            entry["df"] = df
+            entry["version"] += 1
+            entry["fingerprints"] = None
+            entry["idem"] = None
+            _bump_version("transactions")
+        _publish("transactions", entry)
+
+def invalidate_cache(name=None):
+    """Drop cached data for one worksheet, or for all of them. The next read fetches the sheet."""
+    names = [name] if name else list(TABLE_HEADERS)
+    if SHARED_CACHE:
+        # Refetch now and publish, so other workers drop their copy too
+        for n in names:
+            _sync_table(n, force=True)
+        return
+    with _cache_lock:
+        for n in names:
+            _cache.pop(n, None)
+            _snapshot_used.add(n)
+            _bump_version(n)
+
+@st.cache_resource
+def warm_start():
+    """
+    Process start-up: when local snapshots exist, initialize the sheets in the
+    background so the first page renders from the snapshots without waiting for
+    authentication and downloads.
+    """
+    if all(os.path.exists(_snapshot_path(n)) for n in TABLE_HEADERS):
+        threading.Thread(target=init_db, name="init-db", daemon=True).start()
+    else:
+        init_db()
+
+def _normalize_note(note):
+    """Fold width/case and collapse whitespace so cosmetic edits don't defeat duplicate checks."""
+    if note is None or (isinstance(note, float) and pd.isna(note)):
+        return ""
+    note = unicodedata.normalize('NFKC', str(note)).casefold()
+    return " ".join(note.split())
+
+def transaction_fingerprint(date, type, account, amount, note):
+    """Stable short hash of (date, type, account, amount, normalized note)."""
+    try:
+        amount = f"{float(amount):.2f}"
+    except (TypeError, ValueError):
+        amount = str(amount)
+    key = "|".join([pd.Timestamp(date).strftime('%Y-%m-%d'), str(type), str(account), amount, _normalize_note(note)])
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=8).hexdigest()
+
+def fingerprint_frame(df):
+    """Fingerprint every row of a transactions-shaped DataFrame."""
+    if df.empty:
+        return []
+    notes = df['note'] if 'note' in df.columns else [""] * len(df)
+    return [
+        transaction_fingerprint(d, t, a, m, n)
+        for d, t, a, m, n in zip(df['date'], df['type'], df['account'], df['amount'], notes)
+    ]
+
+def build_fingerprint_index(df):
+    """Map fingerprint -> number of rows with that fingerprint."""
+    index = {}
+    for fp in fingerprint_frame(df):
+        index[fp] = index.get(fp, 0) + 1
+    return index
+
+def _archived_fingerprint_index(year):
+    """Fingerprint index of one archived year, rebuilt when its file changes."""
+    df = load_archived_year(year)
+    cached = _archive_fingerprints.get(year)
+    if cached is None or cached[0] is not df:
+        cached = (df, build_fingerprint_index(drop_deleted(df)))
+        _archive_fingerprints[year] = cached
+    return cached[1]
+
+def _fingerprint_indexes(years):
+    """
+    Indexes holding the recorded rows of `years`: the live sheet's, plus one per
+    archived year among them (archive.py moved those rows out of the sheet).
+    """
+    archived = sorted(set(years) & set(archived_years()))
+    return [_fingerprint_index()] + [_archived_fingerprint_index(y) for y in archived]
+
+def is_duplicate_transaction(date, type, account, amount, note=""):
+    """O(1) check whether an identical transaction is already recorded."""
+    fp = transaction_fingerprint(date, type, account, amount, note)
+    return any(index.get(fp, 0) > 0 for index in _fingerprint_indexes({pd.Timestamp(date).year}))
+
+def find_existing_transactions(df):
+    """
+    Flag rows of a candidate frame that are already in the sheet.
+    Repeats are counted, so a file with two identical rows only flags as many
+    as the sheet already holds. Rows of archived years are checked against the archive.
+    Returns a boolean Series aligned with df.
+    """
+    years = pd.to_datetime(df['date']).dt.year.unique() if not df.empty else []
+    indexes = _fingerprint_indexes(int(y) for y in years)
+    seen = {}
+    flags = []
+    for fp in fingerprint_frame(df):
+        seen[fp] = seen.get(fp, 0) + 1
+        flags.append(seen[fp] <= sum(index.get(fp, 0) for index in indexes))
+    return pd.Series(flags, index=df.index, dtype=bool)
+
+def _next_transaction_id(ws):
+    """Generate ID: Simple Max ID + 1 strategy over the id column."""
     # Note: This is not race-condition safe for high concurrency, but fine for this app.
     ids = ws.col_values(1)[1:] # Skip header
     if ids:
-        new_id = max([int(i) for i in ids if i.isdigit()] or [0]) + 1
-    else:
-        new_id = 1
-        
-    row = [
-        new_id,
+        return max([int(i) for i in ids if i.isdigit()] or [0]) + 1
+    return 1
+
+def _transaction_row(tx_id, date, type, category, subcategory, account, amount, original_amount=None, note="", nhi_month=None, idem_key=""):
+    """Build a sheet row in the transactions header order."""
+    return [
+        tx_id,
         date.strftime('%Y-%m-%d'),
         type,
         category,
@@ -147,35 +737,201 @@ def add_transaction(date, type, category, subcategory, account, amount, original
         amount,
         original_amount if original_amount is not None else "",
         note,
-        nhi_month if nhi_month is not None else ""
+        nhi_month if nhi_month is not None else "",
+        idem_key,
+        "", "", "" # deleted, deleted_at, deleted_by: rewriting a row revives a tombstone
     ]
-    ws.append_row(row)
 
-def get_transactions(start_date=None, end_date=None):
-    """Retrieve transactions within a date range."""
+def new_idem_key(prefix="tx"):
+    """Client-side idempotency key (prefixed so the sheet never reads it as a number)."""
+    return f"{prefix}:{uuid.uuid4().hex}"
+
+def add_transaction(date, type, category, subcategory, account, amount, original_amount=None, note="", nhi_month=None, idem_key=None):
+    """
+    Add a new transaction to the Google Sheet.
+    Writing again with the same idem_key is a no-op (double submits, retries).
+    """
+    add_transactions([dict(date=date, type=type, category=category, subcategory=subcategory, account=account,
+                           amount=amount, original_amount=original_amount, note=note, nhi_month=nhi_month,
+                           idem_key=idem_key)])
+
+def add_transactions(transactions):
+    """
+    Add many transactions with a single append request.
+    `transactions` is a list of dicts keyed like add_transaction's arguments.
+    Returns the number of rows written (rows whose idem_key is already recorded are skipped).
+    """
+    return len(_append_transactions(transactions)[1])
+
+# Idempotent appends: every row carries an idem_key (the caller's, or a fresh
+# one). Keys already in the cache are skipped, and after a failed append the
+# key column is re-read so rows that did land are not written a second time.
+# When an append finally fails, rows may still have landed without reaching the
+# cache: a marker file makes the next append (in any process) re-read the sheet
+# first, so a resubmit with the same keys is recognized.
+APPEND_ATTEMPTS = 5
+APPEND_ERRORS = (gspread.exceptions.APIError, requests.exceptions.RequestException)
+_APPEND_FAILED_PATH = os.path.join(LOCAL_DIR, "transactions.append_failed")
+_append_lock = threading.Lock()
+
+@contextmanager
+def write_lock():
+    """
+    One writer of the transactions sheet at a time: key check + id allocation
+    (max id + 1) + append + cache update, or any write by row number. Held across
+    threads and, through a file lock, across processes (app workers, the API
+    server, CLI scripts), so two writers never hand out the same id.
+    """
+    with _append_lock:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(LOCAL_DIR, exist_ok=True)
+        with open(os.path.join(LOCAL_DIR, "transactions.write.lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+def _append_rows(ws, rows):
+    key_col = TABLE_HEADERS["transactions"].index("idem_key")
+    pending = rows
+    for attempt in range(APPEND_ATTEMPTS):
+        try:
+            ws.append_rows(pending)
+            return
+        except APPEND_ERRORS:
+            if attempt == APPEND_ATTEMPTS - 1:
+                raise
+            time.sleep(min(2 ** (attempt + 1), 10))
+            landed = set(ws.col_values(key_col + 1)[1:])
+            pending = [r for r in pending if r[key_col] not in landed]
+            if not pending:
+                return
+
+def _append_transactions(transactions):
+    """
+    Write `transactions` with one append request.
+    Returns (ids aligned with `transactions`, sheet rows actually written).
+    """
+    if not transactions:
+        return [], []
+    with write_lock():
+        return _append_locked(transactions)
+
+def _append_locked(transactions):
+    if os.path.exists(_APPEND_FAILED_PATH):
+        _sync_table("transactions", force=True)
+        os.remove(_APPEND_FAILED_PATH)
+    known = _idem_index()
+    keys = [tx.get('idem_key') or new_idem_key() for tx in transactions]
+    todo = {} # key -> transaction, first occurrence only
+    for key, tx in zip(keys, transactions):
+        if key not in known and key not in todo:
+            todo[key] = tx
+    if not todo:
+        return [known[k] for k in keys], []
+
     ws = get_worksheet("transactions")
-    data = ws.get_all_records() # Returns list of dicts
-    
-    df = pd.DataFrame(data)
-    
-    if df.empty:
-         return df
+    next_id = _next_transaction_id(ws)
+
+    rows = []
+    new_ids = {}
+    for offset, (key, tx) in enumerate(todo.items()):
+        new_ids[key] = next_id + offset
+        rows.append(_transaction_row(
+            next_id + offset,
+            tx['date'],
+            tx['type'],
+            tx['category'],
+            tx.get('subcategory') or "",
+            tx['account'],
+            tx['amount'],
+            tx.get('original_amount') if not pd.isna(tx.get('original_amount')) else None,
+            tx.get('note', ""),
+            tx.get('nhi_month') if not pd.isna(tx.get('nhi_month')) else None,
+            key
+        ))
+
+    try:
+        _append_rows(ws, rows)
+    except Exception:
+        os.makedirs(LOCAL_DIR, exist_ok=True)
+        open(_APPEND_FAILED_PATH, "w").close()
+        raise
+    _cache_append_transactions(rows)
+    return [new_ids[k] if k in new_ids else known[k] for k in keys], rows
+
+# Write queue: callers writing many small batches concurrently (api_server.py)
+# hand their rows to one writer thread, which coalesces everything queued within
+# WRITE_FLUSH_SECONDS into a single append, within the shared request quota.
+WRITE_FLUSH_SECONDS = 1.0
+WRITE_BATCH_ROWS = 1000
+_write_queue = queue.Queue()
+_writer_lock = threading.Lock()
+_writer = None
+
+def queue_transactions(transactions):
+    """Queue transactions for the writer thread. Returns a Future resolving to their new ids."""
+    global _writer
+    future = Future()
+    _write_queue.put((list(transactions), future))
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(target=_writer_loop, name="write-queue", daemon=True)
+            _writer.start()
+    return future
+
+def _writer_loop():
+    while True:
+        batch = [_write_queue.get()]
+        rows = len(batch[0][0])
+        deadline = time.time() + WRITE_FLUSH_SECONDS
+        while rows < WRITE_BATCH_ROWS:
+            try:
+                item = _write_queue.get(timeout=max(0.0, deadline - time.time()))
+            except queue.Empty:
+                break
+            batch.append(item)
+            rows += len(item[0])
+
+        try:
+            throttle() # id column read
+            throttle() # append
+            ids, _ = _append_transactions([tx for txs, _ in batch for tx in txs])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            continue
+        start = 0
+        for txs, future in batch:
+            future.set_result(ids[start:start + len(txs)])
+            start += len(txs)
+
+def get_transactions(start_date=None, end_date=None, include_hidden=False):
+    """
+    Retrieve transactions within a date range (served from the process cache).
+    Archived (closed) years are included transparently when the range reaches them.
+    include_hidden keeps bookkeeping columns such as idem_key.
+    """
+    df = _load_transactions()["df"]
 
-    # Convert date column to datetime
-    df['date'] = pd.to_datetime(df['date'])
-    
-    # Enforce numeric types for amount columns
-    # Coerce errors (non-numeric) to NaN, then fill with 0
-    if 'amount' in df.columns:
-        df['amount'] = pd.to_numeric(df['amount'], errors='coerce').fillna(0.0)
-    if 'original_amount' in df.columns:
-        df['original_amount'] = pd.to_numeric(df['original_amount'], errors='coerce').fillna(0.0)
-    
     # Normalize inputs to date objects if they are datetime
     if start_date and isinstance(start_date, datetime):
         start_date = start_date.date()
     if end_date and isinstance(end_date, datetime):
         end_date = end_date.date()
+
+    cold = _archived_transactions(start_date, end_date)
+    if cold is not None:
+        df = pd.concat([cold, df], ignore_index=True) if not df.empty else cold
+    df = drop_deleted(df)
+    if not include_hidden:
+        df = df.drop(columns=HIDDEN_COLUMNS["transactions"], errors='ignore')
+
+    if df.empty:
+         return df.copy()
     
     if start_date and end_date:
         mask = (df['date'].dt.date >= start_date) & (df['date'].dt.date <= end_date)
@@ -187,98 +943,312 @@ def get_transactions(start_date=None, end_date=None):
     df = df.sort_values(by='date', ascending=False)
     return df
 
-def delete_transaction(tx_id):
-    """Delete a transaction by ID."""
+# Detail views: date range -> (frame, lower-cased search text), per data version
+SEARCH_COLUMNS = ['type', 'category', 'subcategory', 'account', 'note']
+_QUERY_CACHE_SIZE = 8
+_query_cache = OrderedDict()
+
+def _indexed_range(start_date, end_date):
+    key = (current_version("transactions"), str(start_date), str(end_date))
+    with _cache_lock:
+        hit = _query_cache.get(key)
+        if hit is not None:
+            _query_cache.move_to_end(key)
+            return hit
+    df = get_transactions(start_date=start_date, end_date=end_date).reset_index(drop=True)
+    if df.empty:
+        # An empty sheet decodes to a frame without columns
+        df = pd.DataFrame(columns=TRANSACTION_COLUMNS)
+    text = df[SEARCH_COLUMNS[0]].astype(str)
+    for c in SEARCH_COLUMNS[1:]:
+        text = text + "\x1f" + df[c].fillna("").astype(str)
+    hit = (df, text.str.lower())
+    with _cache_lock:
+        _query_cache[key] = hit
+        while len(_query_cache) > _QUERY_CACHE_SIZE:
+            _query_cache.popitem(last=False)
+    return hit
+
+def query_transactions(start_date, end_date, text="", sort_by="date", ascending=False, offset=0, limit=50, filters=None):
+    """
+    One page of a date range, filtered by `text` (substring of type/category/
+    subcategory/account/note, case-insensitive) and `filters` ({column: [values]}),
+    and sorted by `sort_by`. Returns (page DataFrame, total matching rows).
+    """
+    df, search = _indexed_range(start_date, end_date)
+    text = (text or "").strip().lower()
+    if text:
+        df = df[search.str.contains(text, regex=False).values]
+    for col, values in (filters or {}).items():
+        if values:
+            df = df[df[col].isin(values)]
+    total = len(df)
+    if sort_by in df.columns and total:
+        # Stable sort by id first so equal keys keep a deterministic order across pages
+        if 'id' in df.columns and sort_by != 'id':
+            df = df.sort_values('id', ascending=ascending, kind='stable')
+        df = df.sort_values(sort_by, ascending=ascending, kind='stable')
+    return df.iloc[offset:offset + limit], total
+
+# Soft delete: a deleted transaction keeps its sheet row with deleted = 1 plus
+# who/when, and reads skip it. Rows never shift, so the delta sync (cached ids
+# are a prefix of the sheet) and row numbers stay valid. archive.compact()
+# removes old tombstones from the sheet in one batch, under write_lock() like
+# every write that addresses rows by number.
+def drop_deleted(df):
+    """Rows of a transactions frame that are not tombstoned."""
+    if df.empty or 'deleted' not in df.columns:
+        return df
+    return df[df['deleted'] != 1]
+
+def delete_transactions(ids, deleted_by=""):
+    """
+    Tombstone transactions by ID: one read of the id column, then one update
+    writing the three tombstone cells of every row. Returns the number of rows marked.
+    """
+    ids = [str(int(i)) for i in ids]
+    if not ids:
+        return 0
+    with write_lock(): # rows cannot move (archive/compaction) between the read and the write
+        return _delete_locked(ids, deleted_by)
+
+def _delete_locked(ids, deleted_by):
     ws = get_worksheet("transactions")
-    cell = ws.find(str(tx_id), in_column=1)
-    
-    if cell:
-        ws.delete_rows(cell.row)
+    # Row numbers come from the sheet, not the cache: archiving or compaction in
+    # another process may have moved rows since this cache was loaded
+    rows = {v: i + 1 for i, v in enumerate(ws.col_values(1)) if i > 0}
+    found = [i for i in ids if i in rows]
+    if not found:
+        return 0
+    col = TABLE_HEADERS["transactions"].index("deleted") + 1
+    deleted_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    ws.batch_update([
+        {"range": f"{rowcol_to_a1(rows[i], col)}:{rowcol_to_a1(rows[i], col + 2)}", "values": [[1, deleted_at, deleted_by or ""]]}
+        for i in found
+    ])
+    _cache_mark_deleted(found, deleted_at, deleted_by or "")
+    return len(found)
 
-def save_closing(month, bank_actual, cash_actual, bank_calc, cash_calc, note):
-    """Save monthly closing record."""
-    ws = get_worksheet("monthly_closings")
-    
-    # Check if month exists
-    try:
-        cell = ws.find(month, in_column=1)
-    except gspread.CellNotFound:
-        cell = None
-        
-    row_data = [
-        month, 
-        bank_actual, 
-        cash_actual, 
-        bank_calc, 
-        cash_calc, 
-        note, 
-        datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    ]
-    
-    if cell:
-        # Update existing row
-        # gspread uses 1-based index. 
-        # Easier to update range.
-        # But `update` needs range.
-        # Let's just build the range string "A{row}:G{row}"
-        r = cell.row
-        ws.update(range_name=f"A{r}:G{r}", values=[row_data])
-    else:
-        # Append
-        ws.append_row(row_data)
+def delete_transaction(tx_id, deleted_by=""):
+    """Delete (tombstone) a transaction by ID."""
+    return delete_transactions([tx_id], deleted_by) > 0
+
+# Month-end carryover: one 業主資本/上期結轉 income row per account, dated the first
+# day of the next month and keyed carryover:<month>:<account>, so re-closing a
+# month updates the rows instead of adding more.
+CARRYOVER_CATEGORY = "業主資本"
+CARRYOVER_SUBCATEGORY = "上期結轉"
+
+def carryover_key(month, account):
+    return f"carryover:{month}:{account}"
+
+def carryover_note(month):
+    return f"系統自動結轉 - {month} 期末"
+
+def carryover_date(month):
+    return (pd.Timestamp(f"{month}-01") + pd.offsets.MonthBegin(1)).to_pydatetime()
+
+def is_archived_month(month):
+    """
+    True when `month`'s ledger or its carryover rows (first day of the next month)
+    are in a year archive.py moved to the cold tier. Such months cannot be
+    re-closed: their keyed carryovers are no longer on the sheet to be updated.
+    """
+    years = set(archived_years())
+    return int(str(month)[:4]) in years or carryover_date(month).year in years
+
+def _cell(value):
+    if hasattr(value, "item"): # numpy scalars
+        value = value.item()
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return {"userEnteredValue": {"numberValue": value}}
+    return {"userEnteredValue": {"stringValue": "" if value is None else str(value)}}
+
+def _update_row_request(ws, row, values):
+    """batch_update request overwriting sheet row `row` (1-based) from column A."""
+    return {"updateCells": {"rows": [{"values": [_cell(v) for v in values]}], "fields": "userEnteredValue",
+                            "start": {"sheetId": ws.id, "rowIndex": row - 1, "columnIndex": 0}}}
+
+def _append_rows_request(ws, rows):
+    return {"appendCells": {"sheetId": ws.id, "rows": [{"values": [_cell(v) for v in r]} for r in rows],
+                            "fields": "userEnteredValue"}}
+
+def _legacy_carryovers(df, month, account):
+    """Ids of carryover rows for `month` appended as plain transactions before carryovers were keyed."""
+    if df.empty:
+        return []
+    keys = df['idem_key'].fillna("").astype(str) if 'idem_key' in df.columns else pd.Series("", index=df.index)
+    match = ((df['category'] == CARRYOVER_CATEGORY) & (df['subcategory'] == CARRYOVER_SUBCATEGORY)
+             & (df['account'] == account) & (df['note'].astype(str) == carryover_note(month))
+             & ~keys.str.startswith("carryover:"))
+    return df.loc[match, 'id'].tolist()
+
+def save_closings(closings, carryover=True):
+    """
+    Save (insert or update) monthly closings and, with `carryover`, upsert each
+    month's carryover rows, all in one batch_update after one batched read, however
+    many times the months were closed before.
+    `closings`: list of dicts with month, bank_actual, cash_actual, bank_calc, cash_calc, note.
+    Returns the ids of older duplicate carryover rows that were left untouched.
+    """
+    if not closings:
+        return []
+    if carryover:
+        archived = [str(c['month']) for c in closings if is_archived_month(c['month'])]
+        if archived:
+            raise ValueError(f"Months in archived years cannot be re-closed: {', '.join(archived)}")
+    with write_lock(): # allocates transaction ids
+        return _save_closings_locked(closings, carryover)
+
+def _save_closings_locked(closings, carryover):
+    sh = get_spreadsheet()
+    sheets = {ws.title: ws for ws in sh.worksheets()}
+    ws_closing, ws_tx = sheets["monthly_closings"], sheets["transactions"]
+    key_col = rowcol_to_a1(1, TABLE_HEADERS["transactions"].index("idem_key") + 1).rstrip("1")
+    ranges = sh.values_batch_get(["monthly_closings!A:A", "transactions!A:A", f"transactions!{key_col}:{key_col}"])["valueRanges"]
+    column = lambda i: [r[0] if r else "" for r in ranges[i].get("values", [])]
+    closing_rows = {m: i + 1 for i, m in enumerate(column(0)) if i > 0}
+    tx_ids = column(1)
+    tx_rows = {str(v): i + 1 for i, v in enumerate(tx_ids) if i > 0}
+    key_rows = {k: i + 1 for i, k in enumerate(column(2)) if i > 0 and k}
+    next_id = max([int(i) for i in tx_ids[1:] if str(i).isdigit()] or [0]) + 1
+    cached = drop_deleted(_load_transactions()["df"]) if carryover else None
+
+    closed_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    requests, new_closings, updated_tx, new_tx, duplicates = [], [], [], [], []
+    for c in closings:
+        month = c['month']
+        row = [month, c['bank_actual'], c['cash_actual'], c['bank_calc'], c['cash_calc'], c['note'], closed_at]
+        if month in closing_rows:
+            requests.append(_update_row_request(ws_closing, closing_rows[month], row))
+        else:
+            new_closings.append(row)
+        if not carryover:
+            continue
+
+        for account, amount in (("銀行", c['bank_actual']), ("現金", c['cash_actual'])):
+            key = carryover_key(month, account)
+            sheet_row = key_rows.get(key)
+            legacy = _legacy_carryovers(cached, month, account)
+            if sheet_row is None and legacy and str(legacy[0]) in tx_rows:
+                # Adopt the row an earlier version appended; later copies are reported
+                sheet_row = tx_rows[str(legacy[0])]
+                legacy = legacy[1:]
+            duplicates += legacy
+            if sheet_row is not None:
+                tx = _transaction_row(int(tx_ids[sheet_row - 1]), carryover_date(month), "收入", CARRYOVER_CATEGORY,
+                                      CARRYOVER_SUBCATEGORY, account, amount, None, carryover_note(month), None, key)
+                requests.append(_update_row_request(ws_tx, sheet_row, tx))
+                updated_tx.append(tx)
+            elif amount != 0:
+                tx = _transaction_row(next_id, carryover_date(month), "收入", CARRYOVER_CATEGORY,
+                                      CARRYOVER_SUBCATEGORY, account, amount, None, carryover_note(month), None, key)
+                next_id += 1
+                new_tx.append(tx)
+
+    if new_closings:
+        requests.append(_append_rows_request(ws_closing, new_closings))
+    if new_tx:
+        requests.append(_append_rows_request(ws_tx, new_tx))
+    sh.batch_update({"requests": requests})
+
+    if updated_tx:
+        _cache_update_transactions(updated_tx)
+    if new_tx:
+        _cache_append_transactions(new_tx)
+    invalidate_cache("monthly_closings")
+    return duplicates
+
+def _carryover_amount(df, month, account):
+    """Amount of the carryover row save_closings would rewrite for (month, account), or None."""
+    if 'idem_key' in df.columns:
+        keyed = df[df['idem_key'].astype(str) == carryover_key(month, account)]
+        if not keyed.empty:
+            return float(keyed['amount'].iloc[0])
+    legacy = _legacy_carryovers(df, month, account)
+    if legacy:
+        return float(df.loc[df['id'] == legacy[0], 'amount'].iloc[0])
+    return None
+
+def plan_reclose(start_month, end_month):
+    """
+    Recompute the calculated balances of every closed month in [start_month, end_month]
+    from one ledger read, as they will be after re-closing (each month's opening
+    carryover set to the previous month's recorded actuals).
+    Returns a DataFrame: month, bank/cash actual, recorded calc (*_calc_old), new calc, note.
+    """
+    closings = get_closings_range(start_month, end_month)
+    columns = ['month', 'bank_actual', 'cash_actual', 'bank_calc_old', 'cash_calc_old', 'bank_calc', 'cash_calc', 'note']
+    if closings.empty:
+        return pd.DataFrame(columns=columns)
+    months = closings['month'].astype(str).tolist()
+    start = datetime.strptime(months[0], '%Y-%m')
+    end = (pd.Timestamp(datetime.strptime(months[-1], '%Y-%m')) + pd.offsets.MonthEnd(0)).to_pydatetime()
+    df = get_transactions(start_date=start, end_date=end, include_hidden=True)
+    by_month = dict(tuple(df.groupby(df['date'].dt.strftime('%Y-%m')))) if not df.empty else {}
+    actuals = {str(c['month']): (float(c['bank_actual']), float(c['cash_actual'])) for _, c in closings.iterrows()}
+
+    rows = []
+    for _, c in closings.iterrows():
+        month = str(c['month'])
+        dm = by_month.get(month, df.iloc[0:0])
+        flow = dict(zip(("銀行", "現金"), utils.calculate_account_flow(dm)))
+        prev = (pd.Period(month, freq='M') - 1).strftime('%Y-%m')
+        if prev in actuals:
+            # The previous month is re-closed too: its carryover becomes its actual balance
+            for account, target in zip(("銀行", "現金"), actuals[prev]):
+                flow[account] += target - (_carryover_amount(dm, prev, account) or 0.0)
+        rows.append([month, float(c['bank_actual']), float(c['cash_actual']), float(c['bank_calc']),
+                     float(c['cash_calc']), flow["銀行"], flow["現金"], c['note']])
+    return pd.DataFrame(rows, columns=columns)
+
+def reclose(plan):
+    """Write a plan_reclose result: all closings and carryovers in one batch_update."""
+    return save_closings(plan.to_dict('records'), carryover=True)
+
+def save_closing(month, bank_actual, cash_actual, bank_calc, cash_calc, note, carryover=False):
+    """Save monthly closing record (and, with carryover, next month's opening rows)."""
+    return save_closings([dict(month=month, bank_actual=bank_actual, cash_actual=cash_actual,
+                               bank_calc=bank_calc, cash_calc=cash_calc, note=note)], carryover=carryover)
+
+def _closing_tuple(row):
+    # Map row to tuple as expected by app (previous sqlite returned tuple)
+    # Headers: month, bank_actual, cash_actual, bank_calc, cash_calc, note, closed_at
+    return (
+        row['month'],
+        float(row['bank_actual']),
+        float(row['cash_actual']),
+        float(row['bank_calc']),
+        float(row['cash_calc']),
+        row['note'],
+        row['closed_at']
+    )
 
 def get_closing(month):
     """Get closing record for a specific month."""
-    ws = get_worksheet("monthly_closings")
-    try:
-        cell = ws.find(month, in_column=1)
-        if cell:
-            p = ws.row_values(cell.row)
-            # Map list to dict accessible object or tuple as expected by app
-            # Previous sqlite returned tuple. 
-            # Headers: month, bank_actual, cash_actual, bank_calc, cash_calc, note, closed_at
-            # Make sure types are correct (gspread returns strings usually, or floats if auto-converted)
-            # We better cast them.
-            return (
-                p[0], 
-                float(p[1]) if p[1] else 0.0, 
-                float(p[2]) if p[2] else 0.0, 
-                float(p[3]) if p[3] else 0.0, 
-                float(p[4]) if p[4] else 0.0, 
-                p[5], 
-                p[6]
-            )
-    except gspread.CellNotFound:
-        pass
-    return None
+    df = _load_table("monthly_closings")["df"]
+    if df.empty:
+        return None
+    match = df[df['month'].astype(str) == month]
+    if match.empty:
+        return None
+    return _closing_tuple(match.iloc[0])
 
 def get_closings_range(start_month, end_month):
     """Retrieve monthly closings within a specific range (inclusive)."""
-    ws = get_worksheet("monthly_closings")
-    data = ws.get_all_records()
-    df = pd.DataFrame(data)
+    df = _load_table("monthly_closings")["df"]
     
     if df.empty:
-        return df
+        return df.copy()
         
     mask = (df['month'] >= start_month) & (df['month'] <= end_month)
     df = df.loc[mask]
     df = df.sort_values(by='month')
-    
-    # Ensure numeric columns
-    cols = ['bank_actual', 'cash_actual', 'bank_calc', 'cash_calc']
-    for c in cols:
-        if c in df.columns:
-            df[c] = pd.to_numeric(df[c], errors='coerce').fillna(0.0)
-            
     return df
 
 def get_previous_closing(current_month_str):
     """Get the most recent closing record before the current month."""
-    # This is harder in Sheets than SQL. Need to fetch all and sort.
-    ws = get_worksheet("monthly_closings")
-    data = ws.get_all_records()
-    df = pd.DataFrame(data)
+    df = _load_table("monthly_closings")["df"]
     
     if df.empty:
         return None
@@ -288,16 +1258,7 @@ def get_previous_closing(current_month_str):
     
     if not df.empty:
         # Return first row as tuple
-        row = df.iloc[0]
-        return (
-            row['month'],
-            float(row['bank_actual']),
-            float(row['cash_actual']),
-            float(row['bank_calc']),
-            float(row['cash_calc']),
-            row['note'],
-            row['closed_at']
-        )
+        return _closing_tuple(df.iloc[0])
     return None
 
 def save_nhi_record(month, total_fee, deduction, rejection, chronic_count, general_count, drug_fee):
@@ -325,15 +1286,14 @@ def save_nhi_record(month, total_fee, deduction, rejection, chronic_count, gener
         ws.update(range_name=f"A{r}:H{r}", values=[row_data])
     else:
         ws.append_row(row_data)
+    invalidate_cache("nhi_records")
 
 def get_nhi_records(start_month=None, end_month=None):
     """Retrieve NHI records within a month range (YYYY-MM)."""
-    ws = get_worksheet("nhi_records")
-    data = ws.get_all_records()
-    df = pd.DataFrame(data)
+    df = _load_table("nhi_records")["df"]
     
     if df.empty:
-        return df
+        return df.copy()
         
     if start_month and end_month:
         mask = (df['month'] >= start_month) & (df['month'] <= end_month)
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import pandas as pd
+
+import database as db
+import journal
+
+# Lazy, chunked exports of the transaction ledger.
+# Files are written row-chunk by row-chunk to a temp file and then moved into
+# EXPORT_DIR under a name derived from (range, filters, format, data version),
+# so asking for the same export again returns the existing file.
+EXPORT_DIR = os.path.join(db.LOCAL_DIR, "exports")
+CHUNK_ROWS = 5000
+MAX_CACHED_EXPORTS = 20
+EXPORT_FORMATS = {
+    "csv": {"label": "CSV", "ext": ".csv", "mime": "text/csv"},
+    "xlsx": {"label": "Excel (XLSX)", "ext": ".xlsx",
+             "mime": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"},
+    "parquet": {"label": "Parquet", "ext": ".parquet", "mime": "application/octet-stream"},
+}
+# Row layouts: the transaction list as stored, or the accountant's 借貸 journal
+EXPORT_LAYOUTS = {"transactions": "交易明細", "journal": "借貸日記簿 (會計師格式)"}
+
+def apply_filters(df, filters=None):
+    """
+    Filter a transactions frame.
+    filters: {"type": [...], "category": [...], "account": [...], "text": "..."}; empty values are ignored.
+    """
+    if not filters or df.empty:
+        return df
+    for col in ("type", "category", "subcategory", "account"):
+        values = filters.get(col)
+        if values:
+            df = df[df[col].isin(values)]
+    text = filters.get("text")
+    if text:
+        df = df[df['note'].astype(str).str.contains(text, case=False, regex=False, na=False)]
+    return df
+
+def _archive_version(start_date, end_date):
+    """mtimes of the archive files a range touches (archives change outside the cache)."""
+    return [(y, os.path.getmtime(db.archive_path(y))) for y in db.archived_years()
+            if (not start_date or y >= start_date.year) and (not end_date or y <= end_date.year)]
+
+def export_key(start_date, end_date, fmt, filters=None, layout="transactions"):
+    """Cache key for one export: changes whenever the underlying data does."""
+    payload = {
+        "start": str(start_date or ""),
+        "end": str(end_date or ""),
+        "fmt": fmt,
+        "layout": layout,
+        "filters": filters or {},
+        "data": db.data_version("transactions"),
+        "archive": _archive_version(start_date, end_date),
+    }
+    return hashlib.sha1(json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8')).hexdigest()[:16]
+
+def export_filename(start_date, end_date, fmt, layout="transactions"):
+    """Download name shown to the user."""
+    prefix = "pharmacy_journal" if layout == "journal" else "pharmacy_revenue"
+    return f"{prefix}_{start_date}_{end_date}{EXPORT_FORMATS[fmt]['ext']}"
+
+def _chunks(df):
+    for start in range(0, len(df), CHUNK_ROWS):
+        yield df.iloc[start:start + CHUNK_ROWS]
+
+def _write_csv(df, f):
+    with open(f, 'w', encoding='utf-8-sig', newline='') as out:
+        out.write(",".join(df.columns) + "\n")
+        for chunk in _chunks(df):
+            chunk.to_csv(out, index=False, header=False, date_format='%Y-%m-%d')
+
+def _write_xlsx(df, f):
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("transactions")
+    ws.append(list(df.columns))
+    for chunk in _chunks(df):
+        chunk = chunk.astype(object).where(chunk.notna(), None)
+        for row in chunk.itertuples(index=False, name=None):
+            ws.append([v.to_pydatetime() if isinstance(v, pd.Timestamp) else v for v in row])
+    wb.save(f)
+
+def _write_parquet(df, f):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    df = db.arrow_safe(df)
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    with pq.ParquetWriter(f, schema, compression="zstd") as writer:
+        for chunk in _chunks(df):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+_WRITERS = {"csv": _write_csv, "xlsx": _write_xlsx, "parquet": _write_parquet}
+
+def _prune_exports():
+    """Keep only the MAX_CACHED_EXPORTS most recent export files."""
+    files = [os.path.join(EXPORT_DIR, f) for f in os.listdir(EXPORT_DIR) if not f.endswith(".tmp")]
+    files.sort(key=os.path.getmtime, reverse=True)
+    for path in files[MAX_CACHED_EXPORTS:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def export_transactions(start_date, end_date, fmt="csv", filters=None, layout="transactions"):
+    """Return the path of an export file for the range, generating it only if not cached."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    if layout not in EXPORT_LAYOUTS:
+        raise ValueError(f"Unsupported export layout: {layout}")
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    path = os.path.join(EXPORT_DIR, export_key(start_date, end_date, fmt, filters, layout) + EXPORT_FORMATS[fmt]['ext'])
+    if os.path.exists(path):
+        os.utime(path) # keep recently used exports out of pruning
+        return path
+
+    df = apply_filters(db.get_transactions(start_date=start_date, end_date=end_date), filters)
+    if layout == "journal":
+        df = journal.build_journal(df)
+    fd, tmp = tempfile.mkstemp(dir=EXPORT_DIR, suffix=".tmp")
+    os.close(fd)
+    try:
+        _WRITERS[fmt](df, tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    _prune_exports()
+    return path
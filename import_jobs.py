@@ -0,0 +1,189 @@
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+
+import pandas as pd
+
+import database as db
+
+try:
+    import fcntl
+except ImportError: # not on POSIX: only threads of this process are seen
+    fcntl = None
+
+# Background import jobs. Each job persists its pending rows and a checkpoint
+# (rows committed so far) under JOBS_DIR, so an interrupted import can resume
+# from the last committed chunk instead of starting over.
+# A running job holds a file lock on its lease file, so every app worker sees
+# it as running and only one process ever executes it.
+JOBS_DIR = os.path.join(db.LOCAL_DIR, "import_jobs")
+CHUNK_SIZE = 200
+IMPORT_COLUMNS = ['date', 'type', 'category', 'subcategory', 'account', 'amount', 'note']
+
+_threads = {}
+_threads_lock = threading.Lock()
+
+def _state_path(job_id):
+    return os.path.join(JOBS_DIR, f"{job_id}.json")
+
+def _rows_path(job_id):
+    return os.path.join(JOBS_DIR, f"{job_id}.pkl")
+
+def _lease_path(job_id):
+    return os.path.join(JOBS_DIR, f"{job_id}.lease")
+
+def _take_lease(job_id):
+    """Lock the job's lease file. Returns the open file (closing it releases the lease), or None if held elsewhere."""
+    f = open(_lease_path(job_id), "a")
+    if fcntl is not None:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return None
+    return f
+
+def _save_state(state):
+    """Write the job state atomically so a crash never leaves a half-written checkpoint."""
+    state['updated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    tmp = _state_path(state['id']) + ".tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp, _state_path(state['id']))
+
+def _load_state(job_id):
+    with open(_state_path(job_id), encoding='utf-8') as f:
+        return json.load(f)
+
+def create_job(df, label=""):
+    """Persist the rows to import and return a new job ID. The job is not started."""
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    job_id = datetime.now().strftime('%Y%m%d%H%M%S') + "-" + uuid.uuid4().hex[:6]
+    df[IMPORT_COLUMNS].reset_index(drop=True).to_pickle(_rows_path(job_id))
+    _save_state({
+        'id': job_id,
+        'label': label,
+        'status': 'pending',
+        'total': len(df),
+        'committed': 0,
+        'in_flight': None,
+        'error': '',
+        'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    })
+    return job_id
+
+def is_running(job_id):
+    """True while a thread of this or any other process holds the job's lease."""
+    with _threads_lock:
+        t = _threads.get(job_id)
+        if t is not None and t.is_alive():
+            return True
+    if fcntl is None or not os.path.exists(_lease_path(job_id)):
+        return False
+    lease = _take_lease(job_id)
+    if lease is None:
+        return True
+    lease.close()
+    return False
+
+def get_job(job_id):
+    """
+    Return the job state dict, or None if unknown.
+    A job left 'running' (or never started) by a previous process is reported as 'interrupted'.
+    """
+    if not os.path.exists(_state_path(job_id)):
+        return None
+    state = _load_state(job_id)
+    if state['status'] in ('running', 'pending') and not is_running(job_id):
+        state['status'] = 'interrupted'
+    return state
+
+def list_jobs(unfinished_only=False):
+    """All known jobs, newest first."""
+    if not os.path.isdir(JOBS_DIR):
+        return []
+    jobs = [get_job(f[:-5]) for f in os.listdir(JOBS_DIR) if f.endswith('.json')]
+    jobs = [j for j in jobs if j]
+    if unfinished_only:
+        jobs = [j for j in jobs if j['status'] != 'done']
+    return sorted(jobs, key=lambda j: j['created_at'], reverse=True)
+
+def _run_job(job_id):
+    lease = _take_lease(job_id)
+    if lease is None:
+        return # running in another process
+    try:
+        _run_leased(job_id)
+    finally:
+        lease.close()
+
+def _run_leased(job_id):
+    state = _load_state(job_id)
+    if state['status'] == 'done':
+        return # finished by another process in the meantime
+    rows = pd.read_pickle(_rows_path(job_id))
+    state['status'] = 'running'
+    state['error'] = ''
+    _save_state(state)
+
+    try:
+        while state['committed'] < state['total']:
+            start = state['committed']
+            end = min(start + CHUNK_SIZE, state['total'])
+            chunk = rows.iloc[start:end]
+
+            if state.get('in_flight'):
+                # The previous run died after sending this chunk but before the
+                # checkpoint: re-read the sheet so rows that already landed are
+                # recognized by their idempotency keys and skipped.
+                db.invalidate_cache("transactions")
+
+            state['in_flight'] = [start, end]
+            _save_state(state)
+
+            records = chunk.to_dict('records')
+            for i, rec in zip(chunk.index, records):
+                rec['idem_key'] = f"import:{job_id}:{i}"
+            db.add_transactions(records)
+
+            state['committed'] = end
+            state['in_flight'] = None
+            _save_state(state)
+
+        state['status'] = 'done'
+    except Exception as e:
+        state['status'] = 'failed'
+        state['error'] = str(e)
+    _save_state(state)
+
+    if state['status'] == 'done':
+        os.remove(_rows_path(job_id))
+        os.remove(_lease_path(job_id))
+
+def cancel_job(job_id):
+    """
+    Discard a job that is not running: its state, pending rows and lease file.
+    Rows it already committed stay in the sheet. Returns False if the job is running.
+    """
+    lease = _take_lease(job_id)
+    if lease is None:
+        return False
+    try:
+        for path in (_state_path(job_id), _rows_path(job_id), _lease_path(job_id)):
+            if os.path.exists(path):
+                os.remove(path)
+    finally:
+        lease.close()
+    return True
+
+def start_job(job_id):
+    """Run (or resume) a job on a background thread. No-op if it is already running."""
+    with _threads_lock:
+        t = _threads.get(job_id)
+        if t is not None and t.is_alive():
+            return
+        t = threading.Thread(target=_run_job, args=(job_id,), name=f"import-{job_id}", daemon=True)
+        _threads[job_id] = t
+        t.start()
@@ -0,0 +1,159 @@
+import argparse
+import io
+import sys
+from datetime import datetime
+
+import pandas as pd
+
+import data_import
+import database as db
+
+# Double-entry (借貸) journal in the accountant's ledger layout, the same layout
+# data_import reads: 日期 / 借方科目 / 借方金額 / 貸方科目 / 貸方金額 / 說明.
+#   收入      Dr 資產帳戶   Cr 主科目
+#   支出      Dr 主科目     Cr 資產帳戶
+#   手續費    Dr FEE_ACCOUNT Cr 主科目 (original_amount - amount of fee-adjusted income)
+#   資金調度  Dr 轉入帳戶   Cr 轉出帳戶 (轉出/轉入 rows paired by date + amount)
+JOURNAL_COLUMNS = ['日期', '借方科目', '借方金額', '貸方科目', '貸方金額', '說明']
+ASSET_ACCOUNTS = {'銀行': '銀行存款', '現金': '現金'}
+FEE_ACCOUNT = '手續費'
+WITHDRAWAL_ACCOUNT = '業主往來' # counter account of a 提出 (transfer out with no transfer in)
+SUSPENSE_ACCOUNT = '資金調度' # counter account of a transfer in with no matching transfer out
+
+def _asset(account):
+    return account.map(ASSET_ACCOUNTS).fillna(account)
+
+def _description(df):
+    """說明: the note, prefixed with the subcategory when the note does not already mention it."""
+    note = df['note'].fillna('').astype(str).str.strip()
+    sub = df['subcategory'].fillna('').astype(str).str.strip()
+    mentioned = [s in n for s, n in zip(sub, note)]
+    desc = (sub + ' ' + note).str.strip().where(~pd.Series(mentioned, index=df.index), note)
+    return desc.where(desc != '', df['type'].astype(str))
+
+def _lines(df, debit, credit, amount, line=0):
+    return pd.DataFrame({
+        '日期': df['date'].values,
+        '借方科目': debit.values,
+        '借方金額': amount.values,
+        '貸方科目': credit.values,
+        '貸方金額': amount.values,
+        '說明': _description(df).values,
+        '_order': df['_order'].values,
+        '_line': line,
+    })
+
+def _pair_transfers(df):
+    """Match 轉出 with 轉入 rows of the same date and amount (n-th with n-th)."""
+    cols = ['date', 'amount', 'account', 'note', 'subcategory', 'type', '_order']
+    if '_order' not in df.columns:
+        df = df.assign(_order=range(len(df)))
+    out = df[(df['type'] == '資金調度') & (df['category'] == '轉出')][cols]
+    inn = df[(df['type'] == '資金調度') & (df['category'] == '轉入')][cols]
+    out = out.assign(_k=out.groupby(['date', 'amount']).cumcount())
+    inn = inn.assign(_k=inn.groupby(['date', 'amount']).cumcount())
+    return out.merge(inn, on=['date', 'amount', '_k'], how='outer', suffixes=('', '_in'), indicator=True)
+
+def build_journal(df):
+    """Transactions -> balanced journal rows (one debit and one credit per row), ordered by date."""
+    if df.empty:
+        return pd.DataFrame(columns=JOURNAL_COLUMNS)
+    df = df.sort_values(['date', 'id'] if 'id' in df.columns else ['date'], kind='stable').reset_index(drop=True)
+    df['_order'] = df.index
+    amount = df['amount'].astype(float)
+    original = pd.to_numeric(df.get('original_amount'), errors='coerce') if 'original_amount' in df.columns else pd.Series(float('nan'), index=df.index)
+    asset = _asset(df['account'])
+
+    income = df['type'] == '收入'
+    expense = df['type'] == '支出'
+    fee = income & (original > amount)
+
+    parts = [
+        _lines(df[income], asset[income], df.loc[income, 'category'], amount[income]),
+        _lines(df[fee], pd.Series(FEE_ACCOUNT, index=df.index)[fee], df.loc[fee, 'category'], (original - amount)[fee], line=1),
+        _lines(df[expense], df.loc[expense, 'category'], asset[expense], amount[expense]),
+    ]
+
+    pairs = _pair_transfers(df)
+    if not pairs.empty:
+        both = pairs[pairs['_merge'] == 'both']
+        out_only = pairs[pairs['_merge'] == 'left_only']
+        in_only = pairs[pairs['_merge'] == 'right_only']
+        parts.append(_lines(both, _asset(both['account_in']), _asset(both['account']), both['amount']))
+        parts.append(_lines(out_only, pd.Series(WITHDRAWAL_ACCOUNT, index=out_only.index), _asset(out_only['account']), out_only['amount']))
+        # Unmatched transfer in: take note/order from the 轉入 side
+        in_rows = in_only.assign(note=in_only['note_in'], subcategory=in_only['subcategory_in'],
+                                 type=in_only['type_in'], _order=in_only['_order_in'])
+        parts.append(_lines(in_rows, _asset(in_rows['account_in']), pd.Series(SUSPENSE_ACCOUNT, index=in_rows.index), in_rows['amount']))
+
+    journal = pd.concat([p for p in parts if not p.empty], ignore_index=True)
+    journal = journal.sort_values(['日期', '_order', '_line'], kind='stable')
+    return journal[JOURNAL_COLUMNS].reset_index(drop=True)
+
+def expected_totals(df):
+    """
+    Income/expense totals per account that re-importing the journal should give.
+    Paired transfers are asset-to-asset and are skipped by the importer; an unmatched
+    轉出 imports as an expense and an unmatched 轉入 as income.
+    """
+    rows = df[df['type'].isin(['收入', '支出'])][['type', 'account', 'amount']]
+    pairs = _pair_transfers(df)
+    if not pairs.empty:
+        out_only = pairs[pairs['_merge'] == 'left_only']
+        in_only = pairs[pairs['_merge'] == 'right_only']
+        rows = pd.concat([
+            rows,
+            pd.DataFrame({'type': '支出', 'account': out_only['account'], 'amount': out_only['amount']}),
+            pd.DataFrame({'type': '收入', 'account': in_only['account_in'], 'amount': in_only['amount']}),
+        ], ignore_index=True)
+    rows = rows[rows['amount'] > 0] # the importer skips zero amounts
+    return rows.groupby(['type', 'account'])['amount'].agg(['sum', 'count'])
+
+def verify_journal(journal, df):
+    """
+    Re-import `journal` through data_import.process_file and compare totals with `df`.
+    Returns (ok, comparison DataFrame) or raises ValueError if the journal cannot be parsed.
+    """
+    buffer = io.BytesIO(journal.to_csv(index=False, date_format='%Y-%m-%d').encode('utf-8'))
+    buffer.name = "journal.csv"
+    reimported = data_import.process_file(buffer)
+    if isinstance(reimported, str):
+        raise ValueError(f"Journal could not be re-imported: {reimported}")
+
+    expected = expected_totals(df)
+    if reimported.empty:
+        actual = expected.iloc[0:0]
+    else:
+        actual = reimported.groupby(['type', 'account'])['amount'].agg(['sum', 'count'])
+    comparison = expected.join(actual, how='outer', lsuffix='_expected', rsuffix='_imported').fillna(0)
+    comparison['差異'] = (comparison['sum_imported'] - comparison['sum_expected']).round(2)
+    comparison = comparison.reset_index().rename(columns={
+        'type': '類型', 'account': '帳戶', 'sum_expected': '系統金額', 'sum_imported': '匯入金額',
+        'count_expected': '系統筆數', 'count_imported': '匯入筆數'})
+    ok = bool((comparison['差異'] == 0).all() and (comparison['系統筆數'] == comparison['匯入筆數']).all())
+    return ok, comparison
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export transactions as a double-entry journal in the accountant's layout.")
+    parser.add_argument("--start", required=True, help="First date (YYYY-MM-DD)")
+    parser.add_argument("--end", required=True, help="Last date (YYYY-MM-DD)")
+    parser.add_argument("--out", help="Output file (.xlsx or .csv); default: journal_<start>_<end>.xlsx")
+    parser.add_argument("--verify", action="store_true", help="Re-import the journal and compare totals")
+    args = parser.parse_args()
+
+    start = datetime.strptime(args.start, '%Y-%m-%d').date()
+    end = datetime.strptime(args.end, '%Y-%m-%d').date()
+    df = db.get_transactions(start_date=start, end_date=end)
+    journal = build_journal(df)
+    out = args.out or f"journal_{args.start}_{args.end}.xlsx"
+    if out.lower().endswith('.csv'):
+        journal.to_csv(out, index=False, encoding='utf-8-sig', date_format='%Y-%m-%d')
+    else:
+        journal.to_excel(out, index=False)
+    print(f"{len(df)} transactions -> {len(journal)} journal rows written to {out}")
+
+    if args.verify:
+        ok, comparison = verify_journal(journal, df)
+        print(comparison.to_string(index=False))
+        print("Verify OK" if ok else "Verify MISMATCH")
+        sys.exit(0 if ok else 1)
@@ -1,111 +1,237 @@
+import argparse
+import hashlib
+import json
+import math
+import os
 import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import gspread
 import pandas as pd
+import requests
+import database as db
 from database import init_db, get_worksheet
-from datetime import datetime
-import time
 
-def migrate():
-    print("Starting migration...")
-    
-    # 1. Initialize Google Sheets
-    print("Initializing Google Sheets...")
+SQLITE_PATH = 'pharmacy.db'
+TABLES = ["transactions", "monthly_closings", "nhi_records"]
+BATCH_SIZE = 500 # rows per append request
+CHECKPOINT_PATH = os.path.join(db.LOCAL_DIR, "migrate_checkpoint.json")
+SECONDS_PER_REQUEST = 1.0 # rough round-trip time used by --dry-run estimates
+APPEND_ATTEMPTS = 5
+
+_checkpoint_lock = threading.Lock()
+
+def load_checkpoint():
+    if os.path.exists(CHECKPOINT_PATH):
+        with open(CHECKPOINT_PATH, encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+def save_checkpoint(table, progress):
+    """Record per-table progress; shared by the worker threads."""
+    with _checkpoint_lock:
+        checkpoint = load_checkpoint()
+        checkpoint[table] = progress
+        os.makedirs(os.path.dirname(CHECKPOINT_PATH), exist_ok=True)
+        tmp = CHECKPOINT_PATH + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp, CHECKPOINT_PATH)
+
+def count_rows(conn, table):
+    return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+def iter_batches(conn, table, offset=0, batch_size=BATCH_SIZE):
+    """Stream source rows in sheet column order, `batch_size` rows at a time."""
+    cols = db.TABLE_HEADERS[table]
+    query = f"SELECT * FROM {table} ORDER BY rowid LIMIT -1 OFFSET ?"
+    for chunk in pd.read_sql_query(query, conn, params=(offset,), chunksize=batch_size):
+        # Ensure all cols exist
+        for c in cols:
+            if c not in chunk.columns:
+                chunk[c] = ""
+        # Fill NaNs, convert to list of lists
+        yield chunk[cols].fillna("").values.tolist()
+
+def _normalize_cell(value):
+    """Render a cell the same way for SQLite values and Sheets values (e.g. 977.0 == '977')."""
+    if value is None:
+        return ""
+    text = str(value).strip()
     try:
-        init_db()
-    except Exception as e:
-        print(f"Error initializing DB (Check secrets.toml or credentials): {e}")
-        return
-    
-    # 2. Connect to SQLite
+        number = float(text)
+    except ValueError:
+        return text
+    if math.isnan(number):
+        return ""
+    return str(int(number)) if number.is_integer() else repr(round(number, 6))
+
+def checksum_rows(rows, digest=None):
+    digest = digest or hashlib.sha256()
+    for row in rows:
+        digest.update("\x1f".join(_normalize_cell(v) for v in row).encode('utf-8'))
+        digest.update(b"\x1e")
+    return digest
+
+def source_checksum(conn, table):
+    digest = hashlib.sha256()
+    for rows in iter_batches(conn, table):
+        checksum_rows(rows, digest)
+    return digest.hexdigest()
+
+# The migration is the only writer of a sheet it cleared, so the number of data
+# rows on the sheet is exactly the number of source rows that landed. It is
+# re-read before resuming and after a failed append (the request may have been
+# applied even though its response was lost), and only the missing rows are sent.
+def landed_rows(ws):
+    db.throttle()
+    return max(0, len(db.api_retry(ws.col_values)(1)) - 1) # Skip header
+
+def append_batch(ws, rows, done):
+    """Append `rows`, which follow the first `done` source rows, without duplicating any."""
+    pending = rows
+    for attempt in range(APPEND_ATTEMPTS):
+        try:
+            db.throttle()
+            ws.append_rows(pending)
+            return
+        except (gspread.exceptions.APIError, requests.exceptions.RequestException):
+            if attempt == APPEND_ATTEMPTS - 1:
+                raise
+            time.sleep(min(2 ** (attempt + 1), 10))
+            pending = rows[max(0, landed_rows(ws) - done):]
+            if not pending:
+                return
+
+def migrate_table(table, batch_size, resume):
+    """Copy one table in bounded batches, checkpointing after every request."""
+    # sqlite3 connections can't be shared between threads
+    conn = sqlite3.connect(SQLITE_PATH)
+    try:
+        total = count_rows(conn, table)
+        progress = load_checkpoint().get(table) if resume else None
+        if not progress or not progress.get('header_written'):
+            progress = {'rows_done': 0, 'header_written': False, 'source_rows': total}
+
+        ws = get_worksheet(table)
+        if not progress['header_written']:
+            db.throttle()
+            db.api_retry(ws.clear)()
+            db.throttle()
+            db.api_retry(ws.append_row)(db.TABLE_HEADERS[table]) # Header
+            progress['header_written'] = True
+            save_checkpoint(table, progress)
+        else:
+            # The checkpoint is saved after each append: trust the sheet, which may be one batch ahead
+            progress['rows_done'] = landed_rows(ws)
+            print(f"[{table}] Resuming after {progress['rows_done']} rows.")
+
+        for rows in iter_batches(conn, table, progress['rows_done'], batch_size):
+            append_batch(ws, rows, progress['rows_done'])
+            progress['rows_done'] += len(rows)
+            save_checkpoint(table, progress)
+            print(f"[{table}] {progress['rows_done']}/{total}")
+
+        return verify_table(conn, table, ws)
+    finally:
+        conn.close()
+
+def verify_table(conn, table, ws):
+    """Compare row count and content checksum of the sheet against the source."""
+    db.throttle()
+    values = ws.get_all_values()[1:] # Skip header
+    width = len(db.TABLE_HEADERS[table])
+    sheet_rows = [(row + [""] * width)[:width] for row in values]
+
+    expected_rows = count_rows(conn, table)
+    expected_sum = source_checksum(conn, table)
+    actual_sum = checksum_rows(sheet_rows).hexdigest()
+
+    ok = len(sheet_rows) == expected_rows and actual_sum == expected_sum
+    status = "OK" if ok else "MISMATCH"
+    print(f"[{table}] Verify {status}: rows {len(sheet_rows)}/{expected_rows}, checksum {actual_sum[:12]} vs {expected_sum[:12]}")
+    return ok
+
+def dry_run(tables, batch_size):
+    """Report the API calls and time a migration would need without touching the sheet."""
+    conn = sqlite3.connect(SQLITE_PATH)
+    total_calls = 0
+    for table in tables:
+        rows = count_rows(conn, table)
+        # clear + header + appends + verification read
+        calls = 2 + math.ceil(rows / batch_size) + 1
+        total_calls += calls
+        print(f"[{table}] {rows} rows -> {calls} API calls")
+    conn.close()
+
+    # Tables run concurrently but share one quota
+    quota_minutes = total_calls / db.REQUESTS_PER_MINUTE
+    latency_minutes = total_calls * SECONDS_PER_REQUEST / 60 / max(len(tables), 1)
+    minutes = max(quota_minutes, latency_minutes)
+    print(f"Total: {total_calls} API calls, estimated {minutes * 60:.0f} seconds "
+          f"(quota {db.REQUESTS_PER_MINUTE} requests/minute)")
+
+def migrate(batch_size=BATCH_SIZE, resume=False, tables=None, dry=False):
+    print("Starting migration...")
+
+    # 1. Connect to SQLite
     print("Connecting to local database...")
     try:
-        conn = sqlite3.connect('pharmacy.db')
+        conn = sqlite3.connect(SQLITE_PATH)
         # Check if tables exist
         cursor = conn.cursor()
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = [t[0] for t in cursor.fetchall()]
-        print(f"Found tables in SQLite: {tables}")
+        found = [t[0] for t in cursor.fetchall()]
+        conn.close()
+        print(f"Found tables in SQLite: {found}")
     except Exception as e:
-        print(f"Error connecting to pharmacy.db: {e}")
+        print(f"Error connecting to {SQLITE_PATH}: {e}")
         return
 
-    # 3. Migrate Transactions
-    if 'transactions' in tables:
-        print("Migrating transactions...")
-        try:
-            df_trans = pd.read_sql_query("SELECT * FROM transactions", conn)
-            if not df_trans.empty:
-                # Target columns in order
-                cols = ["id", "date", "type", "category", "subcategory", "account", "amount", "original_amount", "note", "nhi_month"]
-                
-                # Ensure all cols exist
-                for c in cols:
-                    if c not in df_trans.columns:
-                        df_trans[c] = ""
-                
-                # Fill NaNs
-                df_trans = df_trans.fillna("")
-                
-                # Convert to list of lists
-                data = df_trans[cols].values.tolist()
-                
-                ws = get_worksheet("transactions")
-                ws.clear()
-                ws.append_row(cols) # Header
-                ws.append_rows(data)
-                print(f"Successfully migrated {len(data)} transactions.")
-            else:
-                print("Transactions table is empty.")
-        except Exception as e:
-            print(f"Error migrating transactions: {e}")
-    else:
-        print("Table 'transactions' not found in SQLite.")
+    selected = [t for t in (tables or TABLES) if t in found]
+    for t in tables or TABLES:
+        if t not in found:
+            print(f"Table '{t}' not found in SQLite.")
 
-    # 4. Migrate Monthly Closings
-    if 'monthly_closings' in tables:
-        print("Migrating monthly closings...")
-        try:
-            df_closing = pd.read_sql_query("SELECT * FROM monthly_closings", conn)
-            if not df_closing.empty:
-                cols = ["month", "bank_actual", "cash_actual", "bank_calc", "cash_calc", "note", "closed_at"]
-                for c in cols:
-                    if c not in df_closing.columns:
-                        df_closing[c] = ""
-                
-                df_closing = df_closing.fillna("")
-                data = df_closing[cols].values.tolist()
-                
-                ws = get_worksheet("monthly_closings")
-                ws.clear()
-                ws.append_row(cols)
-                ws.append_rows(data)
-                print(f"Successfully migrated {len(data)} closings.")
-        except Exception as e:
-            print(f"Error migrating closings: {e}")
-    
-    # 5. Migrate NHI Records
-    if 'nhi_records' in tables:
-        print("Migrating NHI records...")
-        try:
-            df_nhi = pd.read_sql_query("SELECT * FROM nhi_records", conn)
-            if not df_nhi.empty:
-                cols = ["month", "total_fee", "deduction", "rejection", "chronic_count", "general_count", "drug_fee", "updated_at"]
-                for c in cols:
-                    if c not in df_nhi.columns:
-                        df_nhi[c] = ""
-                
-                df_nhi = df_nhi.fillna("")
-                data = df_nhi[cols].values.tolist()
-                
-                ws = get_worksheet("nhi_records")
-                ws.clear()
-                ws.append_row(cols)
-                ws.append_rows(data)
-                print(f"Successfully migrated {len(data)} NHI records.")
-        except Exception as e:
-            print(f"Error migrating NHI records: {e}")
+    if dry:
+        dry_run(selected, batch_size)
+        return
 
-    conn.close()
-    print("Migration completed!")
+    # 2. Initialize Google Sheets
+    print("Initializing Google Sheets...")
+    try:
+        init_db()
+    except Exception as e:
+        print(f"Error initializing DB (Check secrets.toml or credentials): {e}")
+        return
+
+    # 3. Migrate tables concurrently; the shared throttle keeps them within quota
+    started = time.time()
+    results = {}
+    with ThreadPoolExecutor(max_workers=len(selected) or 1) as pool:
+        futures = {t: pool.submit(migrate_table, t, batch_size, resume) for t in selected}
+        for t, future in futures.items():
+            try:
+                results[t] = future.result()
+            except Exception as e:
+                print(f"Error migrating {t}: {e} (re-run with --resume to continue)")
+                results[t] = False
+
+    if all(results.values()):
+        if os.path.exists(CHECKPOINT_PATH):
+            os.remove(CHECKPOINT_PATH)
+        print(f"Migration completed in {time.time() - started:.0f}s!")
+    else:
+        failed = [t for t, ok in results.items() if not ok]
+        print(f"Migration finished with problems in: {', '.join(failed)}")
 
 if __name__ == "__main__":
-    migrate()
+    parser = argparse.ArgumentParser(description="Migrate pharmacy.db (SQLite) into Google Sheets.")
+    parser.add_argument("--dry-run", action="store_true", help="Only report estimated API calls and duration")
+    parser.add_argument("--resume", action="store_true", help="Continue from the last checkpoint instead of clearing the sheets")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Rows per append request")
+    parser.add_argument("--tables", nargs="+", choices=TABLES, help="Only migrate these tables")
+    args = parser.parse_args()
+    migrate(batch_size=args.batch_size, resume=args.resume, tables=args.tables, dry=args.dry_run)
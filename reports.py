@@ -0,0 +1,315 @@
+import base64
+import hashlib
+import html
+import io
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+
+import database as db
+import utils
+
+# Month-end / year-end report packs: a multi-sheet XLSX, a printable HTML page
+# and a PDF with the charts. Packs are built on a background worker from one
+# read of each cached table and stored under REPORT_DIR, keyed by period and a
+# fingerprint of the rows they read, so they are regenerated only after data of
+# that period changes (a new transaction this month leaves closed packs valid).
+REPORT_DIR = os.path.join(db.LOCAL_DIR, "reports")
+REPORT_TABLES = ["transactions", "monthly_closings", "nhi_records"]
+REPORT_FILES = {
+    "xlsx": {"label": "Excel 報表", "mime": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"},
+    "html": {"label": "列印版 (HTML)", "mime": "text/html"},
+    "pdf": {"label": "圖表 (PDF)", "mime": "application/pdf"},
+}
+# Fonts tried in order for Chinese labels in charts
+CJK_FONTS = ["Noto Sans CJK TC", "Noto Sans TC", "Microsoft JhengHei", "PingFang TC", "Heiti TC", "WenQuanYi Zen Hei"]
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reports")
+_jobs = {} # cache key -> Future
+_jobs_lock = threading.Lock()
+_key_memo = OrderedDict() # (period, data versions) -> cache key
+_KEY_MEMO_SIZE = 32
+
+def period_months(period):
+    """'2025-03' -> ['2025-03']; '2025' -> ['2025-01', ..., '2025-12']."""
+    if len(period) == 4:
+        return [f"{period}-{m:02d}" for m in range(1, 13)]
+    return [period]
+
+def period_range(period):
+    """First and last day of a 'YYYY' or 'YYYY-MM' period."""
+    months = period_months(period)
+    start = datetime.strptime(months[0], '%Y-%m')
+    end = (pd.Timestamp(datetime.strptime(months[-1], '%Y-%m')) + pd.offsets.MonthEnd(0)).to_pydatetime()
+    return start, end
+
+def is_closed(period):
+    """True when every month of the period has a monthly closing."""
+    months = period_months(period)
+    closed = db.get_closings_range(months[0], months[-1])
+    return not closed.empty and set(months) <= set(closed['month'].astype(str))
+
+def _frame_digest(digest, df):
+    if not df.empty:
+        df = df.sort_values(list(df.columns[:1]), kind='stable')
+    digest.update(df.to_csv(index=False).encode('utf-8'))
+
+def report_key(period):
+    """
+    Period + fingerprint of the rows the pack reads: the period's ledger, its
+    closings (closed_at included), its NHI records and the NHI receipts matched
+    to them by nhi_month. Recomputed only when a table's data version changes.
+    """
+    versions = (tuple(db.data_version(t) for t in REPORT_TABLES),
+                tuple((y, os.path.getmtime(db.archive_path(y))) for y in db.archived_years()))
+    memo_key = (period, versions)
+    with _jobs_lock:
+        if memo_key in _key_memo:
+            return _key_memo[memo_key]
+
+    months = period_months(period)
+    start, end = period_range(period)
+    nhi = db.get_nhi_records(start_month=months[0], end_month=months[-1])
+    digest = hashlib.sha1(period.encode('utf-8'))
+    _frame_digest(digest, db.get_transactions(start_date=start, end_date=end))
+    _frame_digest(digest, db.get_closings_range(months[0], months[-1]))
+    _frame_digest(digest, nhi)
+    if not nhi.empty:
+        ledger = db.get_transactions()
+        if 'nhi_month' in ledger.columns:
+            _frame_digest(digest, ledger[ledger['nhi_month'].astype(str).isin(months)])
+    key = digest.hexdigest()[:12]
+
+    with _jobs_lock:
+        _key_memo[memo_key] = key
+        while len(_key_memo) > _KEY_MEMO_SIZE:
+            _key_memo.popitem(last=False)
+    return key
+
+def report_paths(period, key):
+    return {fmt: os.path.join(REPORT_DIR, f"{period}_{key}.{fmt}") for fmt in REPORT_FILES}
+
+# --- Data -------------------------------------------------------------------
+
+def build_report_data(period):
+    """All tables of a report pack as DataFrames."""
+    months = period_months(period)
+    start, end = period_range(period)
+    ledger = db.get_transactions(start_date=start, end_date=end)
+    ledger = ledger.assign(month=ledger['date'].dt.strftime('%Y-%m')) if not ledger.empty else ledger.assign(month=[])
+
+    # P&L by category (owner's capital and transfers are not revenue)
+    pnl_rows = ledger[ledger['type'].isin(['收入', '支出']) & (ledger['category'] != '業主資本')]
+    pnl = (pnl_rows.groupby(['type', 'category', 'subcategory'])['amount'].sum()
+           .reset_index().sort_values(['type', 'amount'], ascending=[False, False]))
+    pnl.columns = ['類型', '主科目', '子科目', '金額']
+
+    monthly = pnl_rows.pivot_table(index='month', columns='type', values='amount', aggfunc='sum', fill_value=0)
+    monthly = monthly.reindex(index=months, columns=['收入', '支出'], fill_value=0)
+    monthly['淨利'] = monthly['收入'] - monthly['支出']
+    monthly.index.name = '月份'
+    monthly = monthly.reset_index()
+
+    # Bank / cash reconciliation per month
+    closings = db.get_closings_range(months[0], months[-1])
+    closings = closings.set_index(closings['month'].astype(str)) if not closings.empty else closings
+    recon_rows = []
+    for m in months:
+        flow_bank, flow_cash = utils.calculate_account_flow(ledger[ledger['month'] == m])
+        row = {'月份': m, '銀行系統計算': flow_bank, '現金系統計算': flow_cash,
+               '銀行實際': None, '現金實際': None, '銀行差異': None, '現金差異': None, '結帳時間': ''}
+        if not closings.empty and m in closings.index:
+            c = closings.loc[m]
+            row.update({'銀行實際': float(c['bank_actual']), '現金實際': float(c['cash_actual']),
+                        '銀行差異': float(c['bank_actual']) - flow_bank, '現金差異': float(c['cash_actual']) - flow_cash,
+                        '結帳時間': c['closed_at']})
+        recon_rows.append(row)
+    reconciliation = pd.DataFrame(recon_rows)
+
+    # NHI: declared vs received (received matched by nhi_month, so read the whole ledger)
+    nhi = db.get_nhi_records(start_month=months[0], end_month=months[-1])
+    if not nhi.empty:
+        nhi = utils.nhi_reconciliation(utils.nhi_metrics(nhi), db.get_transactions()).sort_values('month')
+        nhi = nhi[['month', 'total_fee', 'drug_fee', 'deduction', 'rejection', 'point_value',
+                   'chronic_income', 'general_income', 'actual_received', '實際入帳', '差異']]
+        nhi.columns = ['月份', '申報調劑費', '藥費', '點值核扣', '核刪', '點值',
+                       '慢箋調劑費', '一般箋調劑費', '當月健保應收', '實際入帳', '差異']
+
+    total_income = float(monthly['收入'].sum())
+    total_expense = float(monthly['支出'].sum())
+    return {
+        "period": period,
+        "generated_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "closed": is_closed(period),
+        "summary": pd.DataFrame([
+            {'項目': '總收入', '金額': total_income},
+            {'項目': '總支出', '金額': total_expense},
+            {'項目': '淨利', '金額': total_income - total_expense},
+            {'項目': '交易筆數', '金額': len(ledger)},
+        ]),
+        "pnl": pnl,
+        "monthly": monthly,
+        "reconciliation": reconciliation,
+        "nhi": nhi,
+    }
+
+# --- Output -----------------------------------------------------------------
+
+SHEETS = [("summary", "總覽"), ("pnl", "損益 (依科目)"), ("monthly", "每月損益"),
+          ("reconciliation", "銀行現金對帳"), ("nhi", "健保對帳")]
+
+def write_xlsx(data, path):
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        for key, title in SHEETS:
+            df = data[key]
+            if df is not None and not df.empty:
+                df.to_excel(writer, sheet_name=title, index=False)
+
+def _charts(data):
+    """Matplotlib figures for the pack: [(title, Figure)]."""
+    import matplotlib
+    from matplotlib.figure import Figure
+
+    fonts = list(matplotlib.rcParams['font.sans-serif'])
+    matplotlib.rcParams['font.sans-serif'] = CJK_FONTS + [f for f in fonts if f not in CJK_FONTS]
+    matplotlib.rcParams['axes.unicode_minus'] = False
+
+    figures = []
+    monthly = data["monthly"]
+    fig = Figure(figsize=(8, 4))
+    ax = fig.add_subplot()
+    x = range(len(monthly))
+    ax.bar([i - 0.2 for i in x], monthly['收入'], width=0.4, label='收入')
+    ax.bar([i + 0.2 for i in x], monthly['支出'], width=0.4, label='支出')
+    ax.plot(list(x), monthly['淨利'], marker='o', color='black', label='淨利')
+    ax.set_xticks(list(x), monthly['月份'], rotation=45)
+    ax.legend()
+    fig.tight_layout()
+    figures.append(("每月收支", fig))
+
+    expenses = data["pnl"][data["pnl"]['類型'] == '支出'].groupby('主科目')['金額'].sum().sort_values()
+    if not expenses.empty:
+        fig = Figure(figsize=(8, 4))
+        ax = fig.add_subplot()
+        ax.barh(expenses.index, expenses.values)
+        fig.tight_layout()
+        figures.append(("支出結構 (依主科目)", fig))
+
+    nhi = data["nhi"]
+    if nhi is not None and not nhi.empty:
+        fig = Figure(figsize=(8, 4))
+        ax = fig.add_subplot()
+        bottom = pd.Series(0.0, index=nhi.index)
+        for col in ['慢箋調劑費', '一般箋調劑費', '藥費']:
+            ax.bar(nhi['月份'], nhi[col], bottom=bottom, label=col)
+            bottom = bottom + nhi[col]
+        ax.plot(nhi['月份'], nhi['實際入帳'], marker='o', color='black', label='實際入帳')
+        ax.tick_params(axis='x', rotation=45)
+        ax.legend()
+        fig.tight_layout()
+        figures.append(("健保營收結構", fig))
+    return figures
+
+def _format_table(df):
+    formatted = df.copy()
+    for col in formatted.columns:
+        if col == '點值':
+            formatted[col] = formatted[col].map(lambda v: f"{v:.4f}")
+        elif pd.api.types.is_numeric_dtype(formatted[col]):
+            formatted[col] = formatted[col].map(lambda v: "" if pd.isna(v) else f"{v:,.0f}")
+    return formatted.to_html(index=False, border=0, classes="table", na_rep="")
+
+def write_html_pdf(data, html_path, pdf_path):
+    """Printable HTML (tables + embedded chart images) and a PDF of the charts."""
+    from matplotlib.backends.backend_pdf import PdfPages
+
+    figures = _charts(data)
+    with PdfPages(pdf_path) as pdf:
+        for title, fig in figures:
+            fig.suptitle(f"{data['period']} {title}")
+            pdf.savefig(fig)
+
+    images = []
+    for title, fig in figures:
+        buf = io.BytesIO()
+        fig.savefig(buf, format="png", dpi=110)
+        images.append((title, base64.b64encode(buf.getvalue()).decode('ascii')))
+
+    status = "已結帳" if data["closed"] else "未完成結帳 (數字可能變動)"
+    parts = [
+        "<!DOCTYPE html><html lang='zh-Hant'><head><meta charset='utf-8'>",
+        f"<title>{html.escape(data['period'])} 財務報表</title>",
+        "<style>body{font-family:sans-serif;margin:2em}table{border-collapse:collapse;margin-bottom:1.5em}"
+        "td,th{border:1px solid #ccc;padding:4px 8px;text-align:right}th{background:#f3f3f3}"
+        "section{page-break-inside:avoid}img{max-width:100%}"
+        "@media print{body{margin:0}section{page-break-after:always}}</style></head><body>",
+        f"<h1>{html.escape(data['period'])} 財務報表</h1>",
+        f"<p>{status} · 產生時間 {data['generated_at']}</p>",
+    ]
+    for key, title in SHEETS:
+        df = data[key]
+        if df is not None and not df.empty:
+            parts.append(f"<section><h2>{title}</h2>{_format_table(df)}</section>")
+    for title, b64 in images:
+        parts.append(f"<section><h2>{title}</h2><img src='data:image/png;base64,{b64}'></section>")
+    parts.append("</body></html>")
+    with open(html_path, 'w', encoding='utf-8') as f:
+        f.write("\n".join(parts))
+
+def generate_report(period, key=None):
+    """Build the pack for `period` synchronously and return {format: path}."""
+    key = key or report_key(period)
+    paths = report_paths(period, key)
+    if all(os.path.exists(p) for p in paths.values()):
+        return paths
+
+    os.makedirs(REPORT_DIR, exist_ok=True)
+    data = build_report_data(period)
+    tmp = {fmt: os.path.join(REPORT_DIR, f"{period}_{key}.tmp.{fmt}") for fmt in paths}
+    write_xlsx(data, tmp["xlsx"])
+    write_html_pdf(data, tmp["html"], tmp["pdf"])
+    for fmt, p in paths.items():
+        os.replace(tmp[fmt], p)
+
+    # Older packs of the same period are superseded
+    for f in os.listdir(REPORT_DIR):
+        if f.startswith(f"{period}_") and not f.startswith(f"{period}_{key}."):
+            os.remove(os.path.join(REPORT_DIR, f))
+    return paths
+
+# --- Background worker ------------------------------------------------------
+
+def request_report(period):
+    """Queue generation of a pack (no-op if it is ready or already queued). Returns the cache key."""
+    key = report_key(period)
+    with _jobs_lock:
+        future = _jobs.get(key)
+        if future is None or (future.done() and future.exception() is not None):
+            _jobs[key] = _executor.submit(generate_report, period, key)
+    return key
+
+def ensure_report(period):
+    """Generate a pack through the worker and wait for it. Returns {format: path}."""
+    key = request_report(period)
+    with _jobs_lock:
+        future = _jobs[key]
+    return future.result()
+
+def report_status(period):
+    """{'status': 'ready'|'running'|'failed'|'missing', 'paths': {...}, 'error': str}"""
+    key = report_key(period)
+    paths = report_paths(period, key)
+    if all(os.path.exists(p) for p in paths.values()):
+        return {"status": "ready", "paths": paths, "error": ""}
+    with _jobs_lock:
+        future = _jobs.get(key)
+    if future is None:
+        return {"status": "missing", "paths": paths, "error": ""}
+    if not future.done():
+        return {"status": "running", "paths": paths, "error": ""}
+    error = future.exception()
+    return {"status": "failed" if error else "ready", "paths": paths, "error": str(error or "")}
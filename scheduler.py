@@ -0,0 +1,267 @@
+import argparse
+import json
+import os
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+
+import streamlit as st
+import toml
+
+import database as db
+import services
+
+# Recurring maintenance jobs, run by a thread inside the Streamlit process (see
+# app.py) so that delta syncs and pre-built reports land in the same cache the
+# pages read (report keys include this process's data versions).
+# Every run is appended to HISTORY_PATH. A job holds a lock file while it runs,
+# so it never overlaps with itself, also across several app processes.
+# Job modules (reports, backup, archive) are imported when a job first runs, so
+# starting the scheduler does not load them into every process (see app.py).
+SCHEDULER_DIR = os.path.join(db.LOCAL_DIR, "scheduler")
+HISTORY_PATH = os.path.join(SCHEDULER_DIR, "history.jsonl")
+MAX_HISTORY = 2000 # lines kept in the history file
+TICK_SECONDS = 30
+LOCK_STALE_SECONDS = 6 * 3600 # a lock older than this was left by a crashed process
+
+# Either "every" (seconds) or "at" (HH:MM, once a day).
+# Override in .streamlit/secrets.toml:
+#   [scheduler]
+#   enabled = true
+#   backup = "03:00"
+#   delta_sync = 300
+SCHEDULE = {
+    "delta_sync": {"label": "差異同步 (Sheets → 快取)", "every": 300},
+    "analysis_cache": {"label": "分析快取重建", "every": 900},
+    "reports": {"label": "報表預先產生", "at": "02:30"},
+    "backup": {"label": "快照備份", "at": "03:00"},
+    "compact": {"label": "清除已刪除紀錄", "at": "03:30"},
+}
+
+def _delta_sync():
+    return {name: db.sync_table(name) for name in db.TABLE_HEADERS}
+
+def _analysis_cache():
+    for step in services.warmup_steps():
+        step()
+    return {"transactions": db.current_version("transactions")}
+
+def _reports():
+    import reports
+    # Last month's pack and this year's pack to date
+    today = datetime.now()
+    last_month = (today.replace(day=1) - timedelta(days=1)).strftime('%Y-%m')
+    return {period: sorted(reports.ensure_report(period)) for period in (last_month, str(today.year))}
+
+def _backup():
+    import backup
+    manifest = backup.create_snapshot()
+    return {"snapshot": manifest["id"], "changed": {t: i["changed"] for t, i in manifest["tables"].items()}}
+
+def _compact():
+    import archive
+    return {"removed": archive.compact()}
+
+JOBS = {
+    "delta_sync": _delta_sync,
+    "analysis_cache": _analysis_cache,
+    "reports": _reports,
+    "backup": _backup,
+    "compact": _compact,
+}
+
+def load_schedule():
+    """SCHEDULE with the [scheduler] overrides from secrets.toml applied. Returns (enabled, schedule)."""
+    schedule = {name: dict(spec) for name, spec in SCHEDULE.items()}
+    config = {}
+    if os.path.exists(db.SECRETS_PATH):
+        try:
+            config = toml.load(db.SECRETS_PATH).get("scheduler", {})
+        except Exception as e:
+            print(f"Error loading scheduler config: {e}")
+    for name, value in config.items():
+        if name not in schedule:
+            continue
+        spec = schedule[name]
+        spec.pop("every", None)
+        spec.pop("at", None)
+        if isinstance(value, str):
+            spec["at"] = value
+        else:
+            spec["every"] = int(value)
+    return bool(config.get("enabled", True)), schedule
+
+def describe(spec):
+    return f"每日 {spec['at']}" if "at" in spec else f"每 {spec['every'] // 60} 分鐘"
+
+# --- History ----------------------------------------------------------------
+
+def read_history(job=None, limit=None):
+    """Recorded runs, newest first."""
+    if not os.path.exists(HISTORY_PATH):
+        return []
+    with open(HISTORY_PATH, encoding='utf-8') as f:
+        runs = [json.loads(line) for line in f if line.strip()]
+    if job:
+        runs = [r for r in runs if r["job"] == job]
+    runs.reverse()
+    return runs[:limit] if limit else runs
+
+def _append_history(record):
+    os.makedirs(SCHEDULER_DIR, exist_ok=True)
+    with open(HISTORY_PATH, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+    with open(HISTORY_PATH, encoding='utf-8') as f:
+        lines = f.readlines()
+    if len(lines) > MAX_HISTORY * 1.1:
+        tmp = HISTORY_PATH + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.writelines(lines[-MAX_HISTORY:])
+        os.replace(tmp, HISTORY_PATH)
+
+def last_runs():
+    """{job: most recent run record}"""
+    latest = {}
+    for r in read_history():
+        latest.setdefault(r["job"], r)
+    return latest
+
+# --- Locks ------------------------------------------------------------------
+
+def _lock_path(job):
+    return os.path.join(SCHEDULER_DIR, f"{job}.lock")
+
+def _acquire(job):
+    """Create the job's lock file; False if another run holds it."""
+    os.makedirs(SCHEDULER_DIR, exist_ok=True)
+    path = _lock_path(job)
+    if os.path.exists(path) and time.time() - os.path.getmtime(path) > LOCK_STALE_SECONDS:
+        os.remove(path)
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, 'w') as f:
+        json.dump({"pid": os.getpid(), "started_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S')}, f)
+    return True
+
+def _release(job):
+    try:
+        os.remove(_lock_path(job))
+    except OSError:
+        pass
+
+def running_jobs():
+    """{job: {"pid", "started_at"}} for jobs currently holding their lock."""
+    running = {}
+    for job in JOBS:
+        try:
+            with open(_lock_path(job), encoding='utf-8') as f:
+                running[job] = json.load(f)
+        except (OSError, ValueError):
+            pass
+    return running
+
+# --- Running ----------------------------------------------------------------
+
+def next_run(spec, last_started):
+    """When a job with schedule `spec` is next due, given its last start (datetime or None)."""
+    now = datetime.now()
+    if "every" in spec:
+        return now if last_started is None else last_started + timedelta(seconds=spec["every"])
+    hour, minute = map(int, spec["at"].split(":"))
+    slot = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if slot > now:
+        slot -= timedelta(days=1)
+    # slot is the latest scheduled time that has passed
+    return slot if last_started is None or last_started < slot else slot + timedelta(days=1)
+
+def parse_time(ts):
+    return datetime.strptime(ts, '%Y-%m-%d %H:%M:%S') if ts else None
+
+_started_at = None # when this process's scheduler loop started
+
+def _is_due(job, spec):
+    last = parse_time(last_runs().get(job, {}).get("started_at"))
+    if last is None and "at" in spec:
+        # Never run before (fresh deploy): wait for the first slot after start-up
+        # instead of catching up at once (backups, reports and compaction are heavy or destructive)
+        last = _started_at or datetime.now()
+    return next_run(spec, last) <= datetime.now()
+
+def run_job(job, trigger="manual", spec=None):
+    """
+    Run one job now and record it. With `spec`, run only if the job is still due
+    once the lock is held (another process may have just run it).
+    Returns the history record, or None if nothing ran.
+    """
+    if not _acquire(job):
+        return None
+    if spec is not None and not _is_due(job, spec):
+        _release(job)
+        return None
+    started = datetime.now()
+    record = {"job": job, "trigger": trigger, "started_at": started.strftime('%Y-%m-%d %H:%M:%S')}
+    try:
+        record["result"] = JOBS[job]()
+        record["status"] = "ok"
+    except Exception as e:
+        record["status"] = "failed"
+        record["error"] = f"{e}"
+        traceback.print_exc()
+    finally:
+        record["finished_at"] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        record["duration"] = round((datetime.now() - started).total_seconds(), 2)
+        _append_history(record)
+        _release(job)
+    return record
+
+def run_due_jobs():
+    """Run every job whose scheduled time has come, one after another."""
+    enabled, schedule = load_schedule()
+    if not enabled:
+        return
+    for job, spec in schedule.items():
+        if _is_due(job, spec):
+            run_job(job, trigger="schedule", spec=spec)
+
+def run_in_background(job):
+    """Manual run from the admin page without blocking the rerun."""
+    threading.Thread(target=run_job, args=(job,), name=f"job-{job}", daemon=True).start()
+
+def _loop():
+    global _started_at
+    _started_at = datetime.now()
+    while True:
+        try:
+            run_due_jobs()
+        except Exception as e:
+            print(f"Scheduler tick failed: {e}")
+        time.sleep(TICK_SECONDS)
+
+@st.cache_resource
+def start():
+    """Start the scheduler thread once per process."""
+    thread = threading.Thread(target=_loop, name="scheduler", daemon=True)
+    thread.start()
+    return thread
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run or inspect scheduled maintenance jobs.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_run = sub.add_parser("run", help="Run one job now")
+    p_run.add_argument("job", choices=list(JOBS))
+    p_hist = sub.add_parser("history", help="Show recent runs")
+    p_hist.add_argument("--limit", type=int, default=20)
+    sub.add_parser("loop", help="Run due jobs forever (when not started by the app)")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        record = run_job(args.job)
+        print(json.dumps(record, ensure_ascii=False, default=str) if record else f"{args.job} is already running")
+    elif args.command == "history":
+        for r in read_history(limit=args.limit):
+            print(f"{r['started_at']}  {r['job']:<15} {r['status']:<7} {r['duration']:>8.2f}s  {r.get('error', '')}")
+    else:
+        _loop()
@@ -0,0 +1,97 @@
+import threading
+from datetime import date
+
+import streamlit as st
+
+import database as db
+import utils
+
+# Per-session state shared by app.py and the pages under app_pages/.
+SESSION_DEFAULTS = {'logged_in': False, 'role': None, 'username': None}
+CHANGE_POLL_SECONDS = 5
+
+def init_session():
+    for key, value in SESSION_DEFAULTS.items():
+        if key not in st.session_state:
+            st.session_state[key] = value
+
+def login(username, password):
+    """Verify the credentials and store the user in the session. Returns the role or None."""
+    role = utils.verify_user(username, password)
+    if role:
+        st.session_state['logged_in'] = True
+        st.session_state['role'] = role
+        st.session_state['username'] = username
+        if role == 'admin':
+            start_warmup()
+    return role
+
+def logout():
+    cancel_warmup()
+    for key, value in SESSION_DEFAULTS.items():
+        st.session_state[key] = value
+
+def is_admin():
+    return st.session_state.get('role') == 'admin'
+
+# Admin warm-up: right after login, load what the analysis pages read first into
+# the shared process cache on a background thread, so the login rerun returns
+# at once and the first page visit is served from memory.
+def warmup_steps():
+    today = date.today()
+    year_start = date(today.year, 1, 1)
+    return [
+        lambda: db.get_transactions(start_date=year_start, end_date=today), # current-year ledger
+        lambda: db.query_transactions(today.replace(day=1), today), # general analysis default range
+        lambda: db.get_closings_range(f"{today.year - 1}-01", f"{today.year}-12"),
+        lambda: db.get_nhi_records(),
+    ]
+
+def _warmup(cancel):
+    for step in warmup_steps():
+        if cancel.is_set():
+            return
+        try:
+            step()
+        except Exception as e:
+            # Best effort: the page will fetch (and report errors) on its own
+            print(f"Warm-up step failed: {e}")
+
+def start_warmup():
+    cancel_warmup()
+    cancel = threading.Event()
+    st.session_state['_warmup_cancel'] = cancel
+    threading.Thread(target=_warmup, args=(cancel,), name="admin-warmup", daemon=True).start()
+
+def cancel_warmup():
+    """Stop a pending warm-up before its next step (a fetch already running completes into the cache)."""
+    cancel = st.session_state.pop('_warmup_cancel', None)
+    if cancel is not None:
+        cancel.set()
+
+# Change notification: all sessions read the same process-wide cache, and every
+# write bumps the table's version (db.current_version). A session remembers the
+# versions it rendered and polls for differences.
+def table_versions(tables):
+    return {t: db.current_version(t) for t in tables}
+
+def mark_seen(scope, tables):
+    st.session_state[f"_seen_{scope}"] = table_versions(tables)
+
+def has_changed(scope, tables):
+    seen = st.session_state.get(f"_seen_{scope}")
+    return seen is not None and seen != table_versions(tables)
+
+def change_notice(scope, tables):
+    """Show a refresh prompt on this page once another session changes `tables`."""
+    mark_seen(scope, tables)
+
+    @st.fragment(run_every=CHANGE_POLL_SECONDS)
+    def notice():
+        if has_changed(scope, tables):
+            c1, c2 = st.columns([4, 1])
+            c1.info("🔄 資料已更新 (其他使用者寫入或背景同步)")
+            if c2.button("重新整理", key=f"refresh_{scope}"):
+                st.rerun()
+
+    notice()
@@ -76,6 +76,58 @@ def calculate_net_amount(category, subcategory, amount):
             return amount * rate, True
     return amount, False
 
+def calculate_account_flow(df):
+    """
+    計算期間內銀行與現金的淨異動 (收入 - 支出 + 轉入 - 轉出)。
+    return: (flow_bank, flow_cash)
+    """
+    if df.empty:
+        return 0.0, 0.0
+    sign = df['type'].map({'收入': 1, '支出': -1}).fillna(0)
+    transfer = df['type'] == '資金調度'
+    sign = sign.where(~transfer, df['category'].map({'轉入': 1, '轉出': -1}).fillna(0))
+    flow = (df['amount'] * sign).groupby(df['account']).sum()
+    return float(flow.get('銀行', 0.0)), float(flow.get('現金', 0.0))
+
+def nhi_metrics(df_nhi):
+    """
+    健保申報衍生指標 (回傳新的 DataFrame)。
+    actual_received = 總調劑費 + 藥費 - 核扣 - 核刪
+    point_value = 1 - 核扣 / 總調劑費
+    chronic_income = 點值 * 75 * 慢箋張數
+    general_income = (總調劑費 - 核扣 - 核刪) - chronic_income (藥費為代收代付，不計入)
+    """
+    df = df_nhi.copy()
+    for col, default in (('drug_fee', 0.0), ('chronic_count', 0), ('general_count', 0)):
+        if col not in df.columns:
+            df[col] = default
+    df['drug_fee'] = df['drug_fee'].fillna(0)
+    df['actual_received'] = df['total_fee'] + df['drug_fee'] - df['deduction'] - df['rejection']
+    df['point_value'] = (1 - df['deduction'] / df['total_fee']).where(df['total_fee'] > 0, 0)
+    df['chronic_income'] = df['point_value'] * 75 * df['chronic_count']
+    total_service_fee = df['total_fee'] - df['deduction'] - df['rejection']
+    df['general_income'] = total_service_fee - df['chronic_income']
+    return df
+
+def nhi_reconciliation(df_nhi, transactions):
+    """
+    健保預估 vs 實際入帳 (依 nhi_month 對應健保一暫/二暫)。
+    df_nhi 需已經過 nhi_metrics；回傳新增 實際入帳、差異、real_dispensing_fee 欄位的 DataFrame。
+    """
+    if 'nhi_month' not in transactions.columns:
+        transactions = transactions.assign(nhi_month=None)
+    nhi_tx = transactions[
+        (transactions['category'] == '健保收入') &
+        (transactions['subcategory'].isin(['健保一暫', '健保二暫'])) &
+        (transactions['nhi_month'].isin(df_nhi['month'].tolist()))
+    ]
+    actual_sums = nhi_tx.groupby('nhi_month')['amount'].sum().rename('實際入帳')
+    df = df_nhi.copy()
+    df['實際入帳'] = df['month'].map(actual_sums).fillna(0)
+    df['差異'] = df['實際入帳'] - df['actual_received']
+    df['real_dispensing_fee'] = df['total_fee'] - df['deduction']
+    return df
+
 # 使用者帳號 (Simple hardcoded users for now)
 USERS = {
     "admin": "admin123",
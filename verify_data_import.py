@@ -0,0 +1,34 @@
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import data_import
+import database as db
+
+print("Testing blank date cells...")
+# Rows 2-5: blank, spaces only, valid, unreadable
+df = pd.DataFrame({
+    '日期': ['', ' ', '2025/01/05', '不是日期'],
+    '借方科目': ['現金'] * 4,
+    '借方金額': [100, 200, 300, 400],
+    '貸方科目': ['銷貨收入'] * 4,
+    '貸方金額': [None] * 4,
+    '說明': ['小計', '', '門市', '錯誤'],
+})
+parsed, skipped = data_import.parse_transactions(df)
+print(parsed)
+print(skipped)
+
+# Blank dates are skipped silently (like empty cells), unreadable ones are reported
+assert len(parsed) == 1
+assert parsed.iloc[0]['amount'] == 300
+assert [row for row, _ in skipped] == [5]
+assert not parsed['date'].isna().any()
+
+# The preview's duplicate check fingerprints every parsed row
+assert len(db.fingerprint_frame(parsed)) == 1
+
+print("ALL TESTS PASSED")
@@ -0,0 +1,66 @@
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+import requests
+
+# Offline check with an in-memory worksheet: run from a scratch directory so no
+# local snapshot or lock file of the real app is touched.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(tempfile.mkdtemp())
+
+import database as db
+
+class FakeWorksheet:
+    """Minimal worksheet. fail_appends: number of appends that land and then raise (lost response)."""
+    def __init__(self):
+        self.rows = [db.TABLE_HEADERS["transactions"]]
+        self.fail_appends = 0
+
+    def col_values(self, col):
+        return [str(r[col - 1]) if len(r) >= col else "" for r in self.rows]
+
+    def get_all_records(self):
+        header = self.rows[0]
+        return [dict(zip(header, list(r) + [""] * (len(header) - len(r)))) for r in self.rows[1:]]
+
+    def append_rows(self, rows):
+        self.rows.extend(rows)
+        if self.fail_appends:
+            self.fail_appends -= 1
+            raise requests.exceptions.ConnectionError("response lost")
+
+ws = FakeWorksheet()
+db.get_worksheet = lambda name: ws
+db.time.sleep = lambda seconds: None
+
+def rows_with_key(key):
+    i = db.TABLE_HEADERS["transactions"].index("idem_key")
+    return [r for r in ws.rows[1:] if r[i] == key]
+
+def add(key):
+    db.add_transaction(datetime(2030, 1, 5), "支出", "雜費", "其他", "現金", 100, note="Idempotency", idem_key=key)
+
+print("Test 1: append lands, then raises; the retry sees the key and stops")
+ws.fail_appends = 1
+add("form:retry")
+assert len(rows_with_key("form:retry")) == 1
+
+print("Test 2: append lands, then raises until retries run out; the resubmit is skipped")
+db.APPEND_ATTEMPTS = 1
+ws.fail_appends = 1
+try:
+    add("form:abc")
+    raise AssertionError("expected the append to fail")
+except requests.exceptions.ConnectionError:
+    pass
+add("form:abc") # double click after the error
+assert len(rows_with_key("form:abc")) == 1
+assert len(db.get_transactions()) == 2
+
+print("Test 3: plain resubmit of a recorded key writes nothing")
+add("form:abc")
+assert len(ws.rows) == 3
+
+print("ALL TESTS PASSED")
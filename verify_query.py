@@ -0,0 +1,53 @@
+import os
+import sys
+import tempfile
+from datetime import date
+
+# Offline check with an in-memory worksheet (run from a scratch directory)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(tempfile.mkdtemp())
+
+import api_server
+import database as db
+
+class FakeWorksheet:
+    def __init__(self, rows):
+        self.rows = [db.TABLE_HEADERS["transactions"]] + rows
+
+    def col_values(self, col):
+        return [str(r[col - 1]) for r in self.rows]
+
+    def get_all_records(self):
+        return [dict(zip(self.rows[0], r)) for r in self.rows[1:]]
+
+ws = FakeWorksheet([])
+db.get_worksheet = lambda name: ws
+
+print("Test 1: empty sheet")
+page, total = db.query_transactions(date(2030, 1, 1), date(2030, 12, 31), text="門市", filters={"type": ["收入"]})
+assert total == 0 and page.empty
+status, payload = api_server.query({"start": "2030-01-01", "end": "2030-12-31"})
+assert status == 200 and payload == {"total": 0, "offset": 0, "rows": []}
+
+print("Test 2: search and filter once rows exist")
+ws.rows += [
+    [1, "2030-01-05", "收入", "銷貨收入", "現金收入", "現金", 300, "", "門市", "", "k1", "", "", ""],
+    [2, "2030-01-06", "支出", "雜費", "其他", "現金", 50, "", "文具", "", "k2", "", "", ""],
+]
+db.invalidate_cache("transactions")
+page, total = db.query_transactions(date(2030, 1, 1), date(2030, 12, 31), text="門市")
+assert total == 1 and page.iloc[0]['id'] == 1
+page, total = db.query_transactions(date(2030, 1, 1), date(2030, 12, 31), filters={"type": ["支出"]})
+assert total == 1 and page.iloc[0]['id'] == 2
+
+print("Test 3: sort accepts visible columns only")
+status, payload = api_server.query({"start": "2030-01-01", "end": "2030-12-31", "sort": "amount"})
+assert status == 200 and payload["total"] == 2
+for hidden in ("idem_key", "deleted", "deleted_at", "deleted_by"):
+    try:
+        api_server.query({"start": "2030-01-01", "end": "2030-12-31", "sort": hidden})
+        raise AssertionError(f"sort by {hidden} should be rejected")
+    except api_server.ApiError as e:
+        assert e.status == 400
+
+print("ALL TESTS PASSED")